@@ -8,6 +8,8 @@ import re
 import requests
 import json
 
+from src.api.extinf import EXTINF, parseExtInf
+
 
 def parsePlaylist(lines):
 	name = ""
@@ -16,42 +18,21 @@ def parsePlaylist(lines):
 	tvg = None
 	rec = False
 
-	tvg_regexp = re.compile('#EXTINF:.*tvg-id="([^"]*)"')
-	group_regexp = re.compile('#EXTINF:.*group-title="([^"]*)"')
-	logo_regexp = re.compile('#EXTINF:.*tvg-logo="([^"]*)"')
-	rec_regexp = re.compile('#EXTINF:.*tvg-rec="([^"]*)"')
-	catchup_regexp = re.compile('#EXTINF:.*catchup-days="([^"]*)"')
-
 	import codecs
 	if lines:
 		if lines[0].startswith(codecs.BOM_UTF8):
 			lines[0] = lines[0][3:]
 
 	for line in lines:
-		if line.startswith("#EXTINF:"):
-			name = line.strip().split(',')[1]
-			m = tvg_regexp.match(line)
-			if m:
-				tvg = m.group(1)
-			else:
-				tvg = None
-			m = group_regexp.match(line)
-			if m:
-				group = m.group(1)
-			m = logo_regexp.match(line)
-			if m:
-				logo = m.group(1)
-			else:
-				logo = ""
-			m = rec_regexp.match(line)
-			if m:
-				rec = m.group(1) == "1"
+		if line.startswith(EXTINF):
+			attrs, name = parseExtInf(line.strip())
+			tvg = attrs.get('tvg-id')
+			group = attrs.get('group-title', group)
+			logo = attrs.get('tvg-logo', "")
+			if 'tvg-rec' in attrs:
+				rec = attrs['tvg-rec'] == "1"
 			else:
-				m = catchup_regexp.match(line)
-				if m:
-					rec = m.group(1) != "0"
-				else:
-					rec = False
+				rec = attrs.get('catchup-days', "0") != "0"
 		elif line.startswith("#EXTGRP:"):
 			group = line.strip().split(':')[1]
 		elif line.startswith("#"):
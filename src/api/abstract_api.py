@@ -22,13 +22,22 @@ import urllib2
 from json import loads as json_loads
 from os import path as os_path
 from datetime import datetime
+from operator import attrgetter
+from bisect import bisect_left
+from twisted.web.client import Headers
+from twisted.internet.defer import CancelledError, maybeDeferred, succeed
 try:
-	from typing import Dict  # pylint: disable=unused-import
+	from typing import Dict, Iterable, Iterator, List, Optional, Tuple  # pylint: disable=unused-import
 except ImportError:
 	pass
 
-from ..utils import getHwAddr, Group, Channel, APIException, APILoginFailed, EPG
+from ..utils import getHwAddr, Group, Channel, APIException, APILoginFailed, EPG, StringTable
 from ..dist import VERSION
+from ..webclient import makeAgent, readResponseBody, timeoutDeferred
+from .keepalive import ConnectionPool, HTTPKeepAliveHandler, HTTPSKeepAliveHandler
+from .httpcache import HttpCache
+from .epgstore import EpgStore
+from .channelids import ChannelIds
 
 MODE_STREAM = 0
 MODE_VIDEOS = 1
@@ -39,6 +48,21 @@ def renameDict(d, keys):
 		d[new] = d.pop(old)
 
 
+def iterLines(chunks):
+	"""
+	Split stream of string chunks into lines without line separator
+	:type chunks: Iterable[str]
+	:rtype: Iterator[str]
+	"""
+	tail = ''
+	for chunk in chunks:
+		lines = (tail + chunk).split('\n')
+		tail = lines.pop()
+		for line in lines:
+			yield line
+	yield tail
+
+
 class AbstractAPI(object):
 	MODE = MODE_STREAM
 	PROVIDER = "free"
@@ -50,6 +74,9 @@ class AbstractAPI(object):
 	SERVICES = []
 	USE_SEEK = True
 	AUTH_TYPE = "Login"
+	TIMEOUT = 10  # seconds
+	CHUNK_SIZE = 64 * 1024
+	HTTP_CACHE_PATH = '/tmp/IPtvDream-cache/'  # tmpfs, files here take RAM
 
 	def __init__(self, username, password):
 		"""
@@ -62,15 +89,21 @@ class AbstractAPI(object):
 		self.packet_expire = None
 		self.settings = {}
 
-		socket.setdefaulttimeout(10)
+		socket.setdefaulttimeout(self.TIMEOUT)
 		self.uuid = getHwAddr('eth0')
 		self.cookiejar = cookielib.CookieJar()
-		self.urlopener = urllib2.build_opener(urllib2.HTTPCookieProcessor(self.cookiejar))
+		# Connections are reused between requests, see keepalive module
+		self.connection_pool = ConnectionPool()
+		self.urlopener = urllib2.build_opener(
+			urllib2.HTTPCookieProcessor(self.cookiejar),
+			HTTPKeepAliveHandler(self.connection_pool), HTTPSKeepAliveHandler(self.connection_pool))
 		self.urlopener.addheaders = [
 					('User-Agent', 'IPtvDream/%s %s' % (VERSION, self.NAME)),
 					('Connection', 'Keep-Alive'),
 					('Accept', 'application/json, text/javascript, */*'),
 					('Accept-Encoding', 'gzip, deflate')]
+		self.http_cache = HttpCache(os_path.join(self.HTTP_CACHE_PATH, 'http', self.NAME))
+		self._agent = None
 
 	def start(self):
 		"""Functions that runs on start, and needs exception handling"""
@@ -110,13 +143,78 @@ class AbstractAPI(object):
 		pass
 
 	def readHttp(self, request):
-		o = self.urlopener.open(request)
+		return ''.join(self.readHttpChunks(request))
+
+	def readHttpChunks(self, request):
+		"""
+		Open request and return iterator over body chunks.
+		Gzip encoded body is decompressed on the fly, so the whole compressed reply is never kept in memory.
+		:rtype: Iterator[str]
+		"""
+		return self._readChunks(self.urlopener.open(request))
+
+	def _readChunks(self, o):
 		enc = o.headers.get('Content-Encoding')
 		if enc and 'gzip' in enc:
-			reply = zlib.decompress(o.read(), 16+zlib.MAX_WBITS)
-			return reply
+			decoder = zlib.decompressobj(16+zlib.MAX_WBITS)
 		else:
-			return o.read()
+			decoder = None
+
+		try:
+			while True:
+				data = o.read(self.CHUNK_SIZE)
+				if not data:
+					break
+				if decoder is not None:
+					data = decoder.decompress(data)
+				if data:
+					yield data
+			if decoder is not None:
+				data = decoder.flush()
+				if data:
+					yield data
+		finally:
+			o.close()
+
+	def readHttpLines(self, request):
+		"""
+		Same as readHttp(request).split('\\n'), but lines are produced while the body is downloaded
+		:rtype: Iterator[str]
+		"""
+		return iterLines(self.readHttpChunks(request))
+
+	def readHttpCached(self, url):
+		"""
+		Same as readHttp, but the reply is stored in http_cache and revalidated with conditional request
+		"""
+		return ''.join(self.readHttpCachedChunks(url))
+
+	def readHttpCachedLines(self, url):
+		"""
+		Same as readHttpCached(url).split('\\n'), but lines are produced while the body is downloaded
+		:rtype: Iterator[str]
+		"""
+		return iterLines(self.readHttpCachedChunks(url))
+
+	def readHttpCachedChunks(self, url):
+		"""
+		:rtype: Iterator[str]
+		"""
+		request = urllib2.Request(url, headers=self.http_cache.conditionalHeaders(url))
+		try:
+			o = self.urlopener.open(request)
+		except urllib2.HTTPError as e:
+			if e.code != 304:
+				raise
+			e.close()
+			chunks = self.http_cache.notModified(url)
+			if chunks is not None:
+				self.trace("Not modified", url)
+				return chunks
+			# Cache entry is lost, download again and store it
+			o = self.urlopener.open(url)
+		return self.http_cache.store(
+			url, o.headers.get('ETag'), o.headers.get('Last-Modified'), self._readChunks(o))
 
 	def getData(self, url, params, name='', fromauth=None):
 		if not self.sid and not fromauth:
@@ -150,24 +248,106 @@ class AbstractAPI(object):
 		except IOError as e:
 			self.sid = None
 			raise APIException(e)
-		try:
-			json = json_loads(reply)
-		except Exception as e:
-			self.sid = None
-			raise APIException("Failed to parse json response: %s" % str(e))
+		json = self._loadJson(reply)
 		if 'error' in json:
 			self.sid = None
 			self.cookiejar.clear()
 			if reauthOnError and not fromauth:
 				return self.getJsonData(url, params, name)
-			error = json['error']
-			if str(error['code']) in ['ACC_WRONG', 'AСС_EMPTY']:
-				raise APILoginFailed(str(error['code']) + ": " + error['message'].encode('utf-8'))
-			else:
-				raise APIException(str(error['code']) + ": " + error['message'].encode('utf-8'))
+			self._raiseJsonError(json['error'])
 		self.trace("getJsonData ok")
 		return json
 
+	def _loadJson(self, reply):
+		try:
+			return json_loads(reply)
+		except Exception as e:
+			self.sid = None
+			raise APIException("Failed to parse json response: %s" % str(e))
+
+	@staticmethod
+	def _raiseJsonError(error):
+		if str(error['code']) in ['ACC_WRONG', 'AСС_EMPTY']:
+			raise APILoginFailed(str(error['code']) + ": " + error['message'].encode('utf-8'))
+		else:
+			raise APIException(str(error['code']) + ": " + error['message'].encode('utf-8'))
+
+	# Asynchronous requests, they return Deferred and don't block enigma2 main loop
+
+	def _getAgent(self):
+		if self._agent is None:
+			self._agent = makeAgent(self.cookiejar, self.TIMEOUT)
+		return self._agent
+
+	def _agentHeaders(self):
+		headers = Headers()
+		for k, v in self.urlopener.addheaders:
+			# connection and encoding are handled by agent
+			if k not in ('Connection', 'Accept-Encoding'):
+				headers.addRawHeader(k, v)
+		return headers
+
+	def readHttpAsync(self, url):
+		"""
+		Asynchronous version of readHttp
+		:rtype: Deferred[str] that fails with APIException
+		"""
+		def error(err):
+			if err.check(CancelledError):
+				return err
+			self.trace("readHttpAsync error!", err.getErrorMessage())
+			raise APIException(err.getErrorMessage())
+
+		d = self._getAgent().request(b'GET', url, headers=self._agentHeaders())
+		d.addCallback(readResponseBody)
+		return timeoutDeferred(d, self.TIMEOUT).addErrback(error)
+
+	def authorizeAsync(self):
+		"""
+		Override in derived class if authorization can be done without blocking
+		:rtype: Deferred
+		"""
+		return maybeDeferred(self.authorize)
+
+	def getJsonDataAsync(self, url, params, name='', fromauth=None):
+		"""
+		Asynchronous version of getJsonData
+		:rtype: Deferred[dict]
+		"""
+		reauthOnError = True
+		if not self.sid and not fromauth:
+			reauthOnError = False
+			self.cookiejar.clear()
+			d = self.authorizeAsync()
+		else:
+			if fromauth:
+				self.cookiejar.clear()
+			d = succeed(None)
+
+		request = url+urllib.urlencode(params)
+
+		def get(_result):
+			self.trace("Getting %s" % name, url, request)
+			return self.readHttpAsync(request).addErrback(error)
+
+		def error(err):
+			if not err.check(CancelledError):
+				self.sid = None
+			return err
+
+		def parse(reply):
+			json = self._loadJson(reply)
+			if 'error' in json:
+				self.sid = None
+				self.cookiejar.clear()
+				if reauthOnError and not fromauth:
+					return self.getJsonDataAsync(url, params, name)
+				self._raiseJsonError(json['error'])
+			self.trace("getJsonDataAsync ok")
+			return json
+
+		return d.addCallback(get).addCallback(parse)
+
 	def _resolveConfigurationFile(self, file_name):
 		try:
 			from Tools.Directories import resolveFilename, SCOPE_SYSETC
@@ -187,6 +367,7 @@ class AbstractStream(AbstractAPI):
 	Sort_N = 0
 	Sort_AZ = 1
 	SORT = ('number', 'name')
+	EPG_STORE_FILE = AbstractAPI.HTTP_CACHE_PATH + '%s-epg.db'
 
 	def __init__(self, username, password):
 		super(AbstractStream, self).__init__(username, password)
@@ -194,10 +375,24 @@ class AbstractStream(AbstractAPI):
 		self.groups = {}  # type: Dict[int, Group]
 		self.favourites = []
 		self.got_favourites = False
+		self._sorted = {}  # type: Dict[Tuple[int, Optional[int]], Tuple[Channel]]
+		self._numbers = None  # type: Optional[Dict[int, int]]
+		self._sorted_numbers = []  # type: List[int]
+		self.epg_store = EpgStore(self.EPG_STORE_FILE % self.NAME, scope=self.epgSettings)
+		# Use for channels that have no numeric id in provider data
+		self.channel_ids = ChannelIds(self._resolveConfigurationFile('%s.ids.json' % self.NAME))
 
 	def setChannelsList(self):
 		pass
 
+	def epgSettings(self):
+		"""
+		Override in derived class to add settings that change epg returned by server.
+		Stored epg is used only while they are the same.
+		:rtype: list
+		"""
+		return [self.username]
+
 	def addFav(self, cid):
 		if not self.favourites.count(cid):
 			self.favourites.append(cid)
@@ -213,7 +408,24 @@ class AbstractStream(AbstractAPI):
 
 	def loadDayEpg(self, cid, date):
 		date = datetime(date.year, date.month, date.day)
-		self.channels[cid].addEpgDay(date, list(self.getDayEpg(cid, date)))
+		epg = self.epg_store.getDay(cid, date)
+		if epg is None:
+			epg = self._storeDayEpg(cid, date, self.getDayEpg(cid, date))
+		self.channels[cid].addEpgDay(date, epg)
+
+	def loadDayEpgAsync(self, cid, date):
+		date = datetime(date.year, date.month, date.day)
+		epg = self.epg_store.getDay(cid, date)
+		if epg is not None:
+			d = succeed(epg)
+		else:
+			d = self.getDayEpgAsync(cid, date).addCallback(lambda data: self._storeDayEpg(cid, date, data))
+		return d.addCallback(lambda data: self.channels[cid].addEpgDay(date, data))
+
+	def _storeDayEpg(self, cid, date, epg):
+		epg = sorted(epg, key=attrgetter('begin'))
+		self.epg_store.putDay(cid, date, epg)
+		return epg
 
 	def getPiconName(self, cid):
 		"""You can return reference to cid or to channel name, anything you want ;)"""
@@ -224,13 +436,59 @@ class AbstractStream(AbstractAPI):
 	def selectGroups(self):
 		return self.groups.values()
 
+	def channelsChanged(self):
+		"""Call after channels or groups were changed to drop sorted lists and number index built before"""
+		self._sorted.clear()
+		self._numbers = None
+		self._shareEpgStrings()
+		self._migrateFavourites()
+
+	def _shareEpgStrings(self):
+		"""
+		Channels without epg get a string table shared by the channel list, so titles repeated across channels
+		are stored once. The table of the previous list is freed together with its channels after reload.
+		"""
+		strings = StringTable()
+		for channel in self.channels.values():
+			if channel.strings is None:
+				channel.strings = strings
+
+	def _migrateFavourites(self):
+		"""Convert favourites saved with hash() ids of previous versions to ids from channel_ids, only once"""
+		if not self.channel_ids.needsMigration():
+			return
+		try:
+			favourites = self.getFavourites()
+			migrated = [
+				cid if cid in self.channels else self.channel_ids.migrate(cid) or cid for cid in favourites]
+			if migrated != favourites:
+				self.trace("Favourites migrated to new channel ids")
+				self.uploadFavourites(migrated)
+				self.got_favourites = False
+		except APIException as e:
+			self.trace("Failed to migrate favourites", e)
+			return
+		self.channel_ids.setMigrated()
+
+	def _sortedChannels(self, sort_key, gid):
+		"""
+		Sorted lists are built on first request and kept until channelsChanged
+		:param int|None gid: None for all channels
+		:rtype: Tuple[Channel]
+		"""
+		try:
+			return self._sorted[sort_key, gid]
+		except KeyError:
+			pass
+		channels = self.channels.values() if gid is None else self.groups[gid].channels
+		result = self._sorted[sort_key, gid] = tuple(sorted(channels, key=attrgetter(self.SORT[sort_key])))
+		return result
+
 	def selectAll(self, sort_key=Sort_N):
-		attr = self.SORT[sort_key]
-		return sorted(self.channels.values(), key=lambda c: getattr(c, attr))
+		return self._sortedChannels(sort_key, None)
 
 	def selectChannels(self, gid, sort_key=Sort_N):
-		attr = self.SORT[sort_key]
-		return sorted(self.groups[gid].channels, key=lambda c: getattr(c, attr))
+		return self._sortedChannels(sort_key, gid)
 
 	def selectFavourites(self):
 		if not self.got_favourites:
@@ -240,11 +498,40 @@ class AbstractStream(AbstractAPI):
 			self.got_favourites = True
 		return [self.channels[cid] for cid in self.favourites]
 
+	def _numberIndex(self):
+		if self._numbers is None:
+			self._numbers = dict((ch.number, cid) for cid, ch in self.channels.iteritems())
+			self._sorted_numbers = sorted(self._numbers)
+		return self._numbers
+
 	def findNumber(self, number):
-		for cid, ch in self.channels.iteritems():
-			if ch.number == number:
-				return cid
-		return None
+		"""
+		:rtype: int|None
+		:return: cid of channel with this number
+		"""
+		return self._numberIndex().get(number)
+
+	def findNumberPrefix(self, prefix, limit=5):
+		"""
+		Find channels which numbers start with digits of prefix, shorter numbers first
+		:param int prefix: digits entered so far
+		:param int limit: maximal number of channels returned
+		:rtype: List[Channel]
+		"""
+		numbers = self._numberIndex()
+		result = []
+		if prefix <= 0:
+			return result
+		low, high = prefix, prefix + 1
+		last = self._sorted_numbers[-1] if self._sorted_numbers else 0
+		while low <= last and len(result) < limit:
+			i = bisect_left(self._sorted_numbers, low)
+			for number in self._sorted_numbers[i:i + limit - len(result)]:
+				if number >= high:
+					break
+				result.append(self.channels[numbers[number]])
+			low, high = low * 10, high * 10
+		return result
 
 	# To be implemented in a derived class
 
@@ -291,6 +578,28 @@ class AbstractStream(AbstractAPI):
 		""" Return url to channel icon """
 		return ""
 
+	# Asynchronous versions of the methods above, used by GUI.
+	# Every bundled provider that goes to network overrides them with requests made by readHttpAsync.
+	# The defaults below only wrap synchronous methods for providers that answer without network requests.
+
+	def getStreamUrlAsync(self, cid, pin, time=None):
+		"""
+		:rtype: Deferred[str]
+		"""
+		return maybeDeferred(self.getStreamUrl, cid, pin, time)
+
+	def getChannelsEpgAsync(self, cids):
+		"""
+		:rtype: Deferred[list[(int, list[EPG])]]
+		"""
+		return maybeDeferred(lambda: list(self.getChannelsEpg(cids)))
+
+	def getDayEpgAsync(self, cid, date):
+		"""
+		:rtype: Deferred[list[EPG]]
+		"""
+		return maybeDeferred(lambda: list(self.getDayEpg(cid, date)))
+
 
 class OfflineFavourites(AbstractStream):
 	def __init__(self, username, password):
@@ -56,6 +56,14 @@ class OTTProvider(OfflineFavourites):
 			reply = self.readHttp(url + urllib.urlencode(params))
 		except IOError as e:
 			raise APIException(e)
+		return self._parseJson(reply)
+
+	def _getJsonAsync(self, url, params):
+		self.trace(url)
+		return self.readHttpAsync(url + urllib.urlencode(params)).addCallback(self._parseJson)
+
+	@staticmethod
+	def _parseJson(reply):
 		try:
 			json = json_loads(reply)
 		except Exception as e:
@@ -79,7 +87,7 @@ class OTTProvider(OfflineFavourites):
 				group_names[group] = gid
 				g = self.groups[gid] = Group(gid, group, [])
 
-			cid = hash(ch['web_name'])
+			cid = self.channel_ids.get(ch['web_name'])
 			c = Channel(cid, ch['name'].encode('utf-8'), number, bool(ch['archive']), False)
 			self.channels[cid] = c
 			self.web_names[cid] = ch['web_name'].encode('utf-8')
@@ -92,17 +100,35 @@ class OTTProvider(OfflineFavourites):
 			return url
 		return '%s?utc=%s' % (url, time.strftime('%s'))
 
-	def getDayEpg(self, cid, date):
-		data = self._getJson(self.api_site + "/epg/%s/?" % self.web_names[cid], {"date": date.strftime("%Y-%m-%d")})
+	def _dayEpgRequest(self, cid, date):
+		return self.api_site + "/epg/%s/?" % self.web_names[cid], {"date": date.strftime("%Y-%m-%d")}
+
+	@staticmethod
+	def _parseDayEpg(data):
 		return [
 			EPG(e['time'], e['time_to'], e['name'].encode('utf-8'), e['descr'].encode('utf-8'))
 			for e in data
 		]
 
-	def getChannelsEpg(self, cids):
-		data = self._getJson(self.api_site + "/epg/current", {})
+	def getDayEpg(self, cid, date):
+		return self._parseDayEpg(self._getJson(*self._dayEpgRequest(cid, date)))
+
+	def getDayEpgAsync(self, cid, date):
+		return self._getJsonAsync(*self._dayEpgRequest(cid, date)).addCallback(self._parseDayEpg)
+
+	def _parseChannelsEpg(self, data):
 		for c in data:
-			yield hash(c['alias']), [
+			cid = self.channel_ids.find(c['alias'])
+			if cid is None:
+				continue
+			yield cid, [
 				EPG(e['time'], e['time_to'], e['name'].encode('utf-8'), e['descr'].encode('utf-8'))
 				for e in c['epg']
 			]
+
+	def getChannelsEpg(self, cids):
+		return self._parseChannelsEpg(self._getJson(self.api_site + "/epg/current", {}))
+
+	def getChannelsEpgAsync(self, cids):
+		d = self._getJsonAsync(self.api_site + "/epg/current", {})
+		return d.addCallback(lambda data: list(self._parseChannelsEpg(data)))
@@ -75,6 +75,10 @@ class TeleportStream(AbstractStream, TeleportAPI):
 		self.icons = {}
 		self.icons_url = ""
 
+	def epgSettings(self):
+		time_shift = self.settings.get('time_shift')
+		return super(TeleportStream, self).epgSettings() + [self.time_shift, time_shift and time_shift.value]
+
 	def epgEntry(self, e):
 		return EPG(int(e['begin']), int(e['end']), e['title'].encode('utf-8'), e['info'].encode('utf-8'))
 
@@ -96,18 +100,29 @@ class TeleportStream(AbstractStream, TeleportAPI):
 		self.icons_url = data['icons']['default'].encode('utf-8')
 		self.trace(self.groups)
 
-	def getStreamUrl(self, cid, pin, time=None):
+	def _streamUrlRequest(self, cid, pin, time):
 		params = {"cid": cid, "time_shift": self.time_shift}
 		if pin:
 			params["protect_code"] = pin
 		if time:
 			params["uts"] = time.strftime("%s")
-		data = self.getJsonData(self.site+"/get_url_tv?", params, "stream url")
+		return self.site+"/get_url_tv?", params, "stream url"
+
+	@staticmethod
+	def _parseStreamUrl(data):
 		return data["url"].encode("utf-8")
 
-	def getChannelsEpg(self, cids):
+	def getStreamUrl(self, cid, pin, time=None):
+		return self._parseStreamUrl(self.getJsonData(*self._streamUrlRequest(cid, pin, time)))
+
+	def getStreamUrlAsync(self, cid, pin, time=None):
+		return self.getJsonDataAsync(*self._streamUrlRequest(cid, pin, time)).addCallback(self._parseStreamUrl)
+
+	def _channelsEpgRequest(self, cids):
 		params = {"cid": ','.join(str(c) for c in cids), "time_shift": self.time_shift}
-		data = self.getJsonData(self.site+"/get_epg_current?", params)
+		return self.site+"/get_epg_current?", params
+
+	def _parseChannelsEpg(self, data):
 		for c in data['channels']:
 			cid = c['id']
 			programs = []
@@ -119,11 +134,26 @@ class TeleportStream(AbstractStream, TeleportAPI):
 					continue
 			yield (cid, programs)
 
-	def getDayEpg(self, cid, date):
+	def getChannelsEpg(self, cids):
+		return self._parseChannelsEpg(self.getJsonData(*self._channelsEpgRequest(cids)))
+
+	def getChannelsEpgAsync(self, cids):
+		d = self.getJsonDataAsync(*self._channelsEpgRequest(cids))
+		return d.addCallback(lambda data: list(self._parseChannelsEpg(data)))
+
+	def _dayEpgRequest(self, cid, date):
 		params = {"cid": cid, "from_uts": datetime(date.year, date.month, date.day).strftime('%s'), "hours": 24}
-		data = self.getJsonData(self.site + "/get_epg?", params)
+		return self.site + "/get_epg?", params
+
+	def _parseDayEpg(self, data):
 		return map(self.epgEntry, data['channels'][0]['epg'])
 
+	def getDayEpg(self, cid, date):
+		return self._parseDayEpg(self.getJsonData(*self._dayEpgRequest(cid, date)))
+
+	def getDayEpgAsync(self, cid, date):
+		return self.getJsonDataAsync(*self._dayEpgRequest(cid, date)).addCallback(self._parseDayEpg)
+
 	def getSettings(self):
 		return self.settings
 
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# Enigma2 IPtvDream player framework
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+"""
+Stable channel ids for providers that identify channels by url or alias instead of number.
+
+Id is 63 bits of md5 of the key, so it is the same on every start and on every platform.
+If two keys give the same id the later one gets the next free id,
+such assignments are saved to file, so favourites and history keep pointing to the same channel.
+
+Before this module ids were hash() of the key, the old id of every key seen is remembered,
+so favourites saved with old ids can be converted by migrate(). Conversion is done once,
+after it setMigrated() stores a mark in the same file.
+"""
+
+from __future__ import print_function
+
+import os
+from hashlib import md5
+from json import loads as json_loads, dumps as json_dumps
+try:
+	from typing import Dict, Optional, Union  # pylint: disable=unused-import
+except ImportError:
+	pass
+
+from ..utils import trace
+
+ID_MASK = (1 << 63) - 1
+
+
+def hashId(key):
+	"""
+	:param str key: utf-8 encoded string
+	:rtype: int
+	"""
+	return int(md5(key).hexdigest()[:16], 16) & ID_MASK or 1
+
+
+class ChannelIds(object):
+	VERSION = 2  # of file format, the first one was plain dict of collided keys
+
+	def __init__(self, file_name):
+		"""
+		:param str file_name: json file with ids of collided keys and migration mark,
+			written only when collision is found or favourites are migrated
+		"""
+		self.file_name = file_name
+		self._collided = None  # type: Optional[Dict[str, int]]
+		self._migrated = False
+		self._ids = {}  # type: Dict[str, int]
+		self._keys = {}  # type: Dict[int, str]
+		self._legacy = {}  # type: Dict[int, int]
+		self.stats = {'collisions': 0}
+
+	def trace(self, *args):
+		trace("ChannelIds", *args)
+
+	def _loadCollided(self):
+		if self._collided is not None:
+			return self._collided
+		self._collided = {}
+		try:
+			with open(self.file_name) as f:
+				data = json_loads(f.read())
+			if data.get('version') == self.VERSION:
+				self._migrated = bool(data['migrated'])
+				data = data['collided']
+			self._collided = dict((k.encode('utf-8'), int(v)) for k, v in data.items())
+		except (IOError, ValueError, AttributeError) as e:
+			if os.path.exists(self.file_name):
+				self.trace("failed to load", e)
+		return self._collided
+
+	def _saveCollided(self):
+		try:
+			with open(self.file_name, 'w') as f:
+				f.write(json_dumps({'version': self.VERSION, 'migrated': self._migrated, 'collided': self._collided}))
+		except IOError as e:
+			self.trace("failed to save", e)
+
+	def get(self, key):
+		"""
+		Return id of channel identified by key, repeated calls with the same key return the same id
+		:param Union[str, unicode] key: url, alias or any other unique name of channel
+		:rtype: int
+		"""
+		legacy = hash(key)
+		if isinstance(key, unicode):
+			key = key.encode('utf-8')
+		try:
+			return self._ids[key]
+		except KeyError:
+			pass
+
+		collided = self._loadCollided()
+		cid = collided.get(key) or hashId(key)
+		if cid in self._keys:
+			self.trace("collision of", key, "and", self._keys[cid])
+			self.stats['collisions'] += 1
+			taken = set(collided.values())
+			while cid in self._keys or cid in taken:
+				cid = (cid + 1) & ID_MASK or 1
+			collided[key] = cid
+			self._saveCollided()
+		self._ids[key] = cid
+		self._keys[cid] = key
+		self._legacy[legacy] = cid
+		return cid
+
+	def find(self, key):
+		"""
+		Return id of key that was already passed to get, new ids are not allocated
+		:param Union[str, unicode] key:
+		:rtype: Optional[int]
+		"""
+		if isinstance(key, unicode):
+			key = key.encode('utf-8')
+		return self._ids.get(key)
+
+	def needsMigration(self):
+		"""True if keys were given ids in this session and favourites were never converted from hash() ids"""
+		self._loadCollided()
+		return bool(self._legacy) and not self._migrated
+
+	def setMigrated(self):
+		"""Remember that favourites were converted, so needsMigration returns False after restart"""
+		self._loadCollided()
+		self._migrated = True
+		self._saveCollided()
+
+	def migrate(self, cid):
+		"""
+		:param int cid: id that was given by hash() of key in previous versions
+		:rtype: Optional[int]
+		:return: current id of the same key, if it was passed to get
+		"""
+		return self._legacy.get(cid)
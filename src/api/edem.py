@@ -30,15 +30,16 @@ class OTTProvider(M3UProvider):
 
 	def start(self):
 		try:
-			self._tvg_info = json_loads(self.readHttp('http://technic.cf/iptvdream4x/it999/tvg.json'))
+			self._tvg_info = json_loads(self.readHttpCached('http://technic.cf/iptvdream4x/it999/tvg.json'))
 		except IOError as e:
 			self.trace("error!", e)
 			raise APIException(e)
 
 	def setChannelsList(self):
-		m3u = self._locatePlaylist()
-		with open(m3u) as f:
-			self._parsePlaylist(f.read().split('\n'))
+		self._loadPlaylistFile(self._locatePlaylist())
+
+	def _snapshotDeps(self):
+		return super(OTTProvider, self)._snapshotDeps() + [self._tvg_info]
 
 	def makeChannel(self, num, name, url, tvg, logo, rec):
 		m = self._url_regexp.match(url)
@@ -52,5 +53,5 @@ class OTTProvider(M3UProvider):
 			except KeyError:
 				pass
 		else:
-			cid = hash(url)
+			cid = self.channel_ids.get(url)
 		return Channel(cid, name, num, rec), {'tvg': tvg, 'url': url, 'logo': logo}
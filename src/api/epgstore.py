@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# Enigma2 IPtvDream player framework
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+"""
+Persistent EPG storage, so programs downloaded before are available after plugin restart.
+
+Day epg is stored per channel and day, live epg (current and next programs) per channel.
+Both are also keyed by scope, a hash of provider settings that change epg (login, time shift),
+so epg downloaded with other settings is not used.
+Entries older than TTL are ignored and removed on next write,
+and the oldest days are removed when database grows above size limit.
+The store does nothing when sqlite3 module is not available.
+"""
+
+from __future__ import print_function
+
+import os
+import time
+import marshal
+from hashlib import md5
+from json import dumps as json_dumps
+try:
+	import sqlite3
+except ImportError:
+	sqlite3 = None
+try:
+	from typing import Callable, Dict, Iterable, List, Optional, Tuple  # pylint: disable=unused-import
+except ImportError:
+	pass
+
+from ..utils import trace, toTimestamp, EPG
+
+
+class EpgStore(object):
+	TTL = 12 * 60 * 60  # seconds
+	MAX_SIZE = 8 * 1024 * 1024  # bytes
+	SCHEMA_VERSION = 2
+
+	def __init__(self, file_name, ttl=TTL, max_size=MAX_SIZE, scope=None):
+		"""
+		:param str file_name: sqlite database file, created on first use
+		:param int ttl: time in seconds after which stored epg is downloaded again
+		:param int max_size: approximate limit of database size in bytes
+		:param Optional[Callable[[], list]] scope: returns current provider settings that change epg
+		"""
+		self.file_name = file_name
+		self.ttl = ttl
+		self.max_size = max_size
+		self.scope = scope
+		self._db = None
+		self._failed = sqlite3 is None
+		self.stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+
+	def trace(self, *args):
+		trace("EpgStore", *args)
+
+	def _connect(self):
+		if self._db is not None or self._failed:
+			return self._db
+		try:
+			directory = os.path.dirname(self.file_name)
+			if directory and not os.path.isdir(directory):
+				os.makedirs(directory)
+			db = sqlite3.connect(self.file_name)
+			if db.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+				db.execute("DROP TABLE IF EXISTS day")
+				db.execute("DROP TABLE IF EXISTS live")
+				db.execute("PRAGMA user_version = %d" % self.SCHEMA_VERSION)
+			db.execute(
+				"CREATE TABLE IF NOT EXISTS day (scope TEXT, cid INTEGER, day INTEGER, fetched REAL, data BLOB, "
+				"PRIMARY KEY (scope, cid, day))")
+			db.execute(
+				"CREATE TABLE IF NOT EXISTS live (scope TEXT, cid INTEGER, fetched REAL, data BLOB, "
+				"PRIMARY KEY (scope, cid))")
+			db.commit()
+		except (OSError, sqlite3.Error) as e:
+			self.trace("disabled:", e)
+			self._failed = True
+			return None
+		self._db = db
+		return db
+
+	def _execute(self, func):
+		"""Run func(db) and commit, store is disabled on database error"""
+		db = self._connect()
+		if db is None:
+			return None
+		try:
+			result = func(db)
+			db.commit()
+			return result
+		except sqlite3.Error as e:
+			self.trace("error:", e)
+			self.close()
+			self._failed = True
+			return None
+
+	@staticmethod
+	def _dumps(epg_list):
+		return sqlite3.Binary(marshal.dumps([
+			(toTimestamp(e.begin), toTimestamp(e.end), e.name, e.description) for e in epg_list]))
+
+	@staticmethod
+	def _loads(data):
+		return [EPG(*row) for row in marshal.loads(str(data))]
+
+	@staticmethod
+	def _day(date):
+		return date.toordinal()
+
+	def _scope(self):
+		if self.scope is None:
+			return ''
+		return md5(json_dumps(self.scope(), sort_keys=True)).hexdigest()
+
+	def getDay(self, cid, date):
+		"""
+		:rtype: List[EPG]|None
+		"""
+		def get(db):
+			return db.execute(
+				"SELECT data FROM day WHERE scope = ? AND cid = ? AND day = ? AND fetched > ?",
+				(scope, cid, self._day(date), time.time() - self.ttl)).fetchone()
+
+		scope = self._scope()
+
+		row = self._execute(get)
+		if row is None:
+			self.stats['misses'] += 1
+			return None
+		self.stats['hits'] += 1
+		return self._loads(row[0])
+
+	def putDay(self, cid, date, epg_list):
+		def put(db):
+			db.execute(
+				"INSERT OR REPLACE INTO day VALUES (?, ?, ?, ?, ?)",
+				(scope, cid, self._day(date), time.time(), self._dumps(epg_list)))
+			self._expire(db, 'day')
+			self._evict(db)
+
+		scope = self._scope()
+		self._execute(put)
+
+	def getLive(self, cids):
+		"""
+		Return stored live epg for channels, that has not ended yet
+		:type cids: Iterable[int]
+		:rtype: Dict[int, List[EPG]]
+		"""
+		def get(db):
+			return db.execute(
+				"SELECT cid, data FROM live WHERE scope = ? AND fetched > ?",
+				(scope, time.time() - self.ttl)).fetchall()
+
+		scope = self._scope()
+		cids = set(cids)
+		now = time.time()
+		result = {}
+		for cid, data in self._execute(get) or []:
+			if cid not in cids:
+				continue
+			programs = [EPG(*row) for row in marshal.loads(str(data)) if row[1] > now]
+			if programs:
+				result[cid] = programs
+		self.stats['hits'] += len(result)
+		self.stats['misses'] += len(cids) - len(result)
+		return result
+
+	def putLive(self, data):
+		"""
+		:type data: Iterable[Tuple[int, List[EPG]]]
+		"""
+		def put(db):
+			fetched = time.time()
+			db.executemany(
+				"INSERT OR REPLACE INTO live VALUES (?, ?, ?, ?)",
+				((scope, cid, fetched, self._dumps(programs)) for cid, programs in data))
+			self._expire(db, 'live')
+
+		scope = self._scope()
+		self._execute(put)
+
+	def _expire(self, db, table):
+		"""Remove entries that are not used anymore because of TTL"""
+		n = db.execute("DELETE FROM %s WHERE fetched <= ?" % table, (time.time() - self.ttl,)).rowcount
+		self.stats['evicted'] += n
+
+	def _evict(self, db):
+		page_size = db.execute("PRAGMA page_size").fetchone()[0]
+		while True:
+			pages = db.execute("PRAGMA page_count").fetchone()[0] - db.execute("PRAGMA freelist_count").fetchone()[0]
+			if pages * page_size <= self.max_size:
+				break
+			count = db.execute("SELECT COUNT(*) FROM day").fetchone()[0]
+			if count <= 1:
+				break
+			# Freed pages are reused by sqlite, so the file doesn't grow further
+			n = max(1, count // 4)
+			db.execute("DELETE FROM day WHERE rowid IN (SELECT rowid FROM day ORDER BY fetched LIMIT ?)", (n,))
+			self.stats['evicted'] += n
+
+	def close(self):
+		if self._db is not None:
+			self._db.close()
+			self._db = None
+
+	def __str__(self):
+		return "EpgStore(%s)" % ", ".join("%s=%d" % kv for kv in sorted(self.stats.items()))
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Enigma2 IPtvDream player framework
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+"""
+Tokenizer for #EXTINF lines of m3u playlists.
+
+Used by plugin parsers and by scripts, so it must not depend on other plugin modules.
+"""
+
+import re
+try:
+	from typing import Dict, Tuple  # pylint: disable=unused-import
+except ImportError:
+	pass
+
+EXTINF = "#EXTINF:"
+
+_ATTR = re.compile(r'([\w-]+)="([^"]*)"')
+
+
+def parseExtInf(line):
+	"""
+	Parse '#EXTINF:duration key="value" ...,title' in one pass.
+	The title starts after the first comma outside of quotes.
+	If attribute is repeated the last value is used.
+	:param str line: line without trailing new line
+	:rtype: Tuple[Dict[str, str], str]
+	:return: attributes and title
+	"""
+	pos = len(EXTINF) if line.startswith(EXTINF) else 0
+	comma = line.find(',', pos)
+	# odd number of quotes before comma means that it is inside of attribute value
+	while comma >= 0 and line.count('"', pos, comma) % 2:
+		comma = line.find(',', comma + 1)
+	if comma < 0:
+		return dict(_ATTR.findall(line, pos)), ""
+	return dict(_ATTR.findall(line, pos, comma)), line[comma + 1:].strip()
@@ -37,7 +37,7 @@ class OTTProvider(JsonSettings, M3UProvider):
 	def start(self):
 		self._downloadTvgMap()
 		try:
-			self._parsePlaylist(self.readHttp(self.playlist_url).split('\n'))
+			self._parsePlaylist(self.readHttpLines(self.playlist_url))
 		except HTTPError as e:
 			self.trace("HTTPError:", e, type(e), e.getcode())
 			if e.code in (403, 404):
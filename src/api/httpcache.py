@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+# Enigma2 IPtvDream player framework
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+"""
+On-disk cache of HTTP responses validated with conditional requests.
+
+Only responses that carry ETag or Last-Modified are stored.
+When the server answers 304 Not Modified the stored body is used instead of downloading it again.
+"""
+
+from __future__ import print_function
+
+import os
+import time
+from hashlib import md5
+from json import loads as json_loads, dumps as json_dumps
+try:
+	from typing import Dict, Iterable, Iterator, Optional  # pylint: disable=unused-import
+except ImportError:
+	pass
+
+from ..utils import trace
+
+
+class HttpCache(object):
+	"""
+	Every provider needs own directory, files not found in its index are removed on load.
+	Default location is on tmpfs, so stored bodies take RAM of the box.
+	"""
+	MAX_SIZE = 4 * 1024 * 1024  # bytes
+	CHUNK_SIZE = 64 * 1024
+	INDEX_FILE = 'index.json'
+
+	def __init__(self, path, max_size=MAX_SIZE):
+		"""
+		:param str path: cache directory, created on first write
+		:param int max_size: total size of stored bodies, least recently used entries are removed above it
+		"""
+		self.path = path
+		self.max_size = max_size
+		self._index = None  # type: Optional[Dict[str, dict]]
+		self.stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+
+	@staticmethod
+	def key(url):
+		return md5(url).hexdigest()
+
+	def _bodyFile(self, key):
+		return os.path.join(self.path, key)
+
+	def _loadIndex(self):
+		if self._index is not None:
+			return self._index
+		self._index = {}
+		try:
+			files = set(os.listdir(self.path))
+		except OSError:
+			return self._index
+		files.discard(self.INDEX_FILE)
+		try:
+			with open(os.path.join(self.path, self.INDEX_FILE)) as f:
+				index = json_loads(f.read())
+		except (IOError, ValueError):
+			index = {}
+		for key, entry in index.items():
+			key = str(key)
+			try:
+				if key in files and os.path.getsize(self._bodyFile(key)) == entry['size']:
+					files.remove(key)
+					self._index[key] = entry
+			except (OSError, KeyError, TypeError):
+				pass
+		# bodies stored before a crash prevented saving the index and unfinished downloads
+		for f in files:
+			trace("HttpCache: remove", f)
+			self._remove(os.path.join(self.path, f))
+		if self.size() > self.max_size:
+			self._evict()
+			self._saveIndex()
+		return self._index
+
+	def _saveIndex(self):
+		try:
+			tmp = os.path.join(self.path, self.INDEX_FILE + '.tmp')
+			with open(tmp, 'w') as f:
+				f.write(json_dumps(self._index))
+			os.rename(tmp, os.path.join(self.path, self.INDEX_FILE))
+		except (IOError, OSError) as e:
+			trace("HttpCache: failed to save index", e)
+
+	def size(self):
+		return sum(entry['size'] for entry in self._loadIndex().values())
+
+	def conditionalHeaders(self, url):
+		"""
+		Return headers that make request conditional on the stored response
+		:rtype: Dict[str, str]
+		"""
+		entry = self._loadIndex().get(self.key(url))
+		headers = {}
+		if entry is not None:
+			if entry.get('etag'):
+				headers['If-None-Match'] = entry['etag'].encode('utf-8')
+			if entry.get('modified'):
+				headers['If-Modified-Since'] = entry['modified'].encode('utf-8')
+		return headers
+
+	def notModified(self, url):
+		"""
+		Return stored body for the url after 304 reply
+		:rtype: Iterator[str]|None
+		"""
+		key = self.key(url)
+		entry = self._loadIndex().get(key)
+		if entry is None:
+			self.stats['misses'] += 1
+			return None
+		try:
+			f = open(self._bodyFile(key), 'rb')
+		except IOError as e:
+			trace("HttpCache: lost body of", url, e)
+			del self._index[key]
+			self.stats['misses'] += 1
+			return None
+		self.stats['hits'] += 1
+		entry['atime'] = time.time()
+		self._saveIndex()
+		return self._readFile(f)
+
+	def _readFile(self, f):
+		with f:
+			while True:
+				data = f.read(self.CHUNK_SIZE)
+				if not data:
+					break
+				yield data
+
+	def store(self, url, etag, modified, chunks):
+		"""
+		Return iterator over chunks that writes them to the cache on the way.
+		The entry is replaced only when the body is read to the end, until then the previous one stays valid.
+		:type chunks: Iterable[str]
+		:rtype: Iterator[str]
+		"""
+		self.stats['misses'] += 1
+		key = self.key(url)
+		if not (etag or modified):
+			# previous body can't be validated anymore
+			self._discard(key)
+			return iter(chunks)
+		self._loadIndex()
+		try:
+			if not os.path.isdir(self.path):
+				os.makedirs(self.path)
+			f = open(self._bodyFile(key) + '.tmp', 'wb')
+		except (IOError, OSError) as e:
+			trace("HttpCache: can't write", e)
+			return iter(chunks)
+		return self._writeFile(f, key, {'url': url, 'etag': etag, 'modified': modified}, chunks)
+
+	def _writeFile(self, f, key, entry, chunks):
+		size = 0
+		complete = False
+		try:
+			for data in chunks:
+				if f is not None:
+					try:
+						f.write(data)
+					except IOError as e:
+						trace("HttpCache: can't write", e)
+						f.close()
+						f = None
+				size += len(data)
+				yield data
+			complete = f is not None
+		finally:
+			if f is not None:
+				f.close()
+			tmp = self._bodyFile(key) + '.tmp'
+			if complete and size <= self.max_size:
+				try:
+					os.rename(tmp, self._bodyFile(key))
+				except OSError as e:
+					trace("HttpCache: can't write", e)
+					self._remove(tmp)
+				else:
+					entry['size'] = size
+					entry['atime'] = time.time()
+					self._index[key] = entry
+					self._evict()
+					self._saveIndex()
+			else:
+				self._remove(tmp)
+				if complete:
+					# new body is too big, the stored one is outdated
+					self._discard(key)
+
+	def _discard(self, key):
+		if self._loadIndex().pop(key, None) is not None:
+			self._remove(self._bodyFile(key))
+			self._saveIndex()
+
+	def _evict(self):
+		total = self.size()
+		for key, entry in sorted(self._index.items(), key=lambda kv: kv[1]['atime']):
+			if total <= self.max_size:
+				break
+			trace("HttpCache: evict", entry['url'])
+			total -= entry['size']
+			del self._index[key]
+			self._remove(self._bodyFile(key))
+			self.stats['evicted'] += 1
+
+	@staticmethod
+	def _remove(file_name):
+		try:
+			os.remove(file_name)
+		except OSError:
+			pass
+
+	def __str__(self):
+		return "HttpCache(%s)" % ", ".join("%s=%d" % kv for kv in sorted(self.stats.items()))
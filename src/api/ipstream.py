@@ -65,7 +65,7 @@ class IpStreamOne(JsonSettings, M3UProvider):
 	def start(self):
 		self._downloadTvgMap()
 		try:
-			self._parsePlaylist(self.readHttp(self.playlist_url % self._token).split('\n'))
+			self._parsePlaylist(self.readHttpLines(self.playlist_url % self._token))
 		except HTTPError as e:
 			self.trace("HTTPError:", e, type(e), e.getcode())
 			if e.code in (403, 404):
@@ -77,7 +77,7 @@ class IpStreamOne(JsonSettings, M3UProvider):
 			raise APIException(e)
 
 	def makeChannel(self, num, name, url, tvg, logo, rec):
-		return Channel(hash(url), name, num, rec), {'tvg': tvg, 'url': url, 'logo': logo}
+		return Channel(self.channel_ids.get(url), name, num, rec), {'tvg': tvg, 'url': url, 'logo': logo}
 
 	def setChannelsList(self):
 		# Channels are downloaded during start, to allow handling login exceptions
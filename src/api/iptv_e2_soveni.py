@@ -45,7 +45,7 @@ class OTTProvider(JsonSettings, M3UProvider):
 		if m:
 			cid = int(m.group(1))
 		else:
-			cid = hash(url)
+			cid = self.channel_ids.get(url)
 			self.trace("Failed to get cid from url", url)
 		url = url.replace("localhost", self._domain).replace("00000000000000", self._key)
 		return Channel(cid, name, num, name.endswith("(A)")), {'tvg': tvg, 'url': url, 'logo': logo}
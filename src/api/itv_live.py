@@ -60,6 +60,14 @@ class OTTProvider(OfflineFavourites):
 			reply = self.readHttp(url + urllib.urlencode(params))
 		except IOError as e:
 			raise APIException(e)
+		return self._parseJson(reply)
+
+	def _getJsonAsync(self, url, params):
+		self.trace(url)
+		return self.readHttpAsync(url + urllib.urlencode(params)).addCallback(self._parseJson)
+
+	@staticmethod
+	def _parseJson(reply):
 		try:
 			json = json_loads(reply)
 		except Exception as e:
@@ -73,19 +81,37 @@ class OTTProvider(OfflineFavourites):
 			return url
 		return url.replace('video.m3u8', 'video-timeshift_abs-%s.m3u8' % time.strftime('%s'))
 
-	def getChannelsEpg(self, cids):
+	def _channelsEpgRequest(self, cids):
 		req = '/epg/{"chid": [%s]}/1' % ",".join(
 			'"%d:%s"' % (cid, self.channels_data[cid]['id']) for cid in cids)
-		data = self._getJson(self.site + urllib2.quote(req, safe='/:",'), {})
+		return self.site + urllib2.quote(req, safe='/:",'), {}
 
+	@staticmethod
+	def _parseChannelsEpg(data):
 		for e in data['res']:
 			yield int(e['id']), [EPG(
 				int(e['startTime']), int(e['stopTime']), e['title'].encode('utf-8'), e['desc'].encode('utf-8')
 			)]
 
-	def getDayEpg(self, cid, date):
-		data = self._getJson(self.site + '/epg/%s/%s' % (self.channels_data[cid]['id'], date.strftime('%Y-%m-%d')), {})
+	def getChannelsEpg(self, cids):
+		return self._parseChannelsEpg(self._getJson(*self._channelsEpgRequest(cids)))
+
+	def getChannelsEpgAsync(self, cids):
+		d = self._getJsonAsync(*self._channelsEpgRequest(cids))
+		return d.addCallback(lambda data: list(self._parseChannelsEpg(data)))
+
+	def _dayEpgRequest(self, cid, date):
+		return self.site + '/epg/%s/%s' % (self.channels_data[cid]['id'], date.strftime('%Y-%m-%d')), {}
+
+	@staticmethod
+	def _parseDayEpg(data):
 		return [EPG(int(e['startTime']), int(e['stopTime']), e['title'].encode('utf-8')) for e in data['res']]
 
+	def getDayEpg(self, cid, date):
+		return self._parseDayEpg(self._getJson(*self._dayEpgRequest(cid, date)))
+
+	def getDayEpgAsync(self, cid, date):
+		return self._getJsonAsync(*self._dayEpgRequest(cid, date)).addCallback(self._parseDayEpg)
+
 	def getPiconUrl(self, cid):
 		return self.channels_data[cid]['logo']
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+# Enigma2 IPtvDream player framework
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+"""
+HTTP keep-alive support for urllib2.
+
+Default urllib2 handlers force 'Connection: close', so every request pays for a new TCP (and TLS) handshake.
+Handlers defined here keep finished connections in a per-host pool and reuse them for subsequent requests.
+"""
+
+from __future__ import print_function
+
+import socket
+import threading
+import time
+import httplib
+import urllib2
+from urllib import addinfourl
+try:
+	from typing import Dict, List, Tuple  # pylint: disable=unused-import
+except ImportError:
+	pass
+
+from ..utils import trace
+
+
+class ConnectionPool(object):
+	"""
+	Keep-alive connections grouped by scheme and host.
+	Only connections with a completely read response are put back to the pool.
+	Number of connections to a host, both idle and in use, is limited by max_per_host.
+	Request that finds no free place waits for one, after wait_timeout it goes over the limit,
+	so a thread that holds unread responses can't block itself forever.
+	"""
+
+	IDLE_TIMEOUT = 30  # seconds, most servers drop idle connections after a minute
+	MAX_PER_HOST = 2
+	WAIT_TIMEOUT = 10  # seconds
+
+	def __init__(self, idle_timeout=IDLE_TIMEOUT, max_per_host=MAX_PER_HOST, wait_timeout=WAIT_TIMEOUT):
+		"""
+		:param float idle_timeout: close connections that were not used for this number of seconds
+		:param int max_per_host: maximum number of connections open to each host
+		:param float wait_timeout: how long request waits for a connection to be returned when limit is reached
+		"""
+		self.idle_timeout = idle_timeout
+		self.max_per_host = max_per_host
+		self.wait_timeout = wait_timeout
+		self._idle = {}  # type: Dict[str, List[Tuple[float, httplib.HTTPConnection]]]
+		# number of connections in use for each key
+		self._busy = {}  # type: Dict[str, int]
+		self._lock = threading.Lock()
+		self._returned = threading.Condition(self._lock)
+		self.stats = {'created': 0, 'reused': 0, 'expired': 0, 'closed': 0, 'waited': 0, 'overflow': 0}
+
+	def acquire(self, key, reuse=True):
+		"""
+		Take a place for the key, waiting for it when max_per_host connections are open.
+		Every call must be paired with release or discard with the same key.
+		:param bool reuse: return the most recently used idle connection, if there is one
+		:return: idle connection or None when a new one has to be created
+		:rtype: httplib.HTTPConnection|None
+		"""
+		conn = None
+		closed = []
+		deadline = time.time() + self.wait_timeout
+		with self._lock:
+			idle = self._idle.setdefault(key, [])
+			while True:
+				now = time.time()
+				# list is ordered by release time, so expired connections are at the beginning
+				n = 0
+				while n < len(idle) and now - idle[n][0] >= self.idle_timeout:
+					n += 1
+				closed.extend(c for t, c in idle[:n])
+				del idle[:n]
+				self.stats['expired'] += n
+				if idle and reuse:
+					conn = idle.pop()[1]
+					self.stats['reused'] += 1
+					break
+				if idle:
+					# new connection is needed, the oldest idle one gives its place
+					closed.append(idle.pop(0)[1])
+					self.stats['closed'] += 1
+				if self._busy.get(key, 0) < self.max_per_host:
+					break
+				if now >= deadline:
+					self.stats['overflow'] += 1
+					trace("ConnectionPool: limit of %d connections to %s exceeded" % (self.max_per_host, key))
+					break
+				self.stats['waited'] += 1
+				self._returned.wait(deadline - now)
+			self._busy[key] = self._busy.get(key, 0) + 1
+		for c in closed:
+			c.close()
+		return conn
+
+	def created(self):
+		with self._lock:
+			self.stats['created'] += 1
+
+	def release(self, key, conn):
+		"""Put connection with fully consumed response back to the pool"""
+		with self._lock:
+			self._free(key)
+			idle = self._idle.setdefault(key, [])
+			if len(idle) + self._busy[key] < self.max_per_host:
+				idle.append((time.time(), conn))
+				return
+		self.discard(conn)
+
+	def discard(self, conn, key=None):
+		"""
+		Close connection
+		:param httplib.HTTPConnection|None conn: None if place was taken but connection was not created
+		:param str|None key: given for connection taken by acquire, its place is freed
+		"""
+		with self._lock:
+			if key is not None:
+				self._free(key)
+			if conn is not None:
+				self.stats['closed'] += 1
+		if conn is not None:
+			conn.close()
+
+	def _free(self, key):
+		self._busy[key] -= 1
+		self._returned.notify()
+
+	def closeAll(self):
+		with self._lock:
+			connections = [c for idle in self._idle.values() for t, c in idle]
+			self._idle = {}
+		for c in connections:
+			self.discard(c)
+
+	def __str__(self):
+		return "ConnectionPool(%s)" % ", ".join("%s=%d" % kv for kv in sorted(self.stats.items()))
+
+
+class _PooledBody(object):
+	"""
+	File-like wrapper around httplib response.
+	Returns the connection to the pool as soon as the body is read to the end.
+	"""
+
+	CHUNK_SIZE = 8192
+
+	def __init__(self, response, release):
+		"""
+		:type response: httplib.HTTPResponse
+		:param release: callable(reusable) called once when the response is finished
+		"""
+		self._response = response
+		self._release = release
+		self._buf = ''
+
+	def _finish(self, reusable):
+		if self._response is None:
+			return
+		reusable = reusable and self._response.isclosed() and not self._response.will_close
+		self._response = None
+		self._release(reusable)
+
+	def _read(self, amt=None):
+		if self._response is None:
+			return ''
+		try:
+			data = self._response.read(amt)
+		except (socket.error, httplib.HTTPException):
+			self._finish(False)
+			raise
+		if self._response.isclosed():
+			self._finish(True)
+		return data
+
+	def read(self, amt=None):
+		if amt is None:
+			data, self._buf = self._buf + self._read(), ''
+			return data
+		if self._buf:
+			data, self._buf = self._buf[:amt], self._buf[amt:]
+			return data
+		return self._read(amt)
+
+	def readline(self, limit=-1):
+		while '\n' not in self._buf:
+			data = self._read(self.CHUNK_SIZE)
+			if not data:
+				break
+			self._buf += data
+		n = self._buf.find('\n') + 1 or len(self._buf)
+		if 0 <= limit < n:
+			n = limit
+		line, self._buf = self._buf[:n], self._buf[n:]
+		return line
+
+	def readlines(self, sizehint=0):
+		return list(self)
+
+	def __iter__(self):
+		return self
+
+	def next(self):
+		line = self.readline()
+		if not line:
+			raise StopIteration
+		return line
+
+	def close(self):
+		# connection is still reusable if the response has no body or it was read to the end
+		self._buf = ''
+		self._finish(True)
+
+	def __del__(self):
+		# response dropped without close, e.g. body of HTTPError, must not keep place in the pool
+		self._finish(False)
+
+
+class _KeepAliveMixin(object):
+	# Requests that can be sent again if pooled connection turns out to be closed by server
+	RETRY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+	def __init__(self, pool):
+		"""
+		:type pool: ConnectionPool
+		"""
+		self._pool = pool
+
+	def _open(self, scheme, connection_class, req, **kwargs):
+		host = req.get_host()
+		if not host:
+			raise urllib2.URLError('no host given')
+
+		headers = dict(req.unredirected_hdrs)
+		headers.update((k, v) for k, v in req.headers.items() if k not in headers)
+		headers['Connection'] = 'keep-alive'
+		headers = dict((name.title(), val) for name, val in headers.items())
+
+		key = "%s://%s" % (scheme, host)
+		tunnel_host = getattr(req, '_tunnel_host', None)
+		tunnel_headers = {}
+		if tunnel_host:
+			key += "/" + tunnel_host
+			if 'Proxy-Authorization' in headers:
+				tunnel_headers['Proxy-Authorization'] = headers.pop('Proxy-Authorization')
+
+		def connect():
+			c = connection_class(host, timeout=req.timeout, **kwargs)
+			if tunnel_host:
+				c.set_tunnel(tunnel_host, headers=tunnel_headers)
+			self._pool.created()
+			return c
+
+		# request with body could be processed by server even if reading response fails,
+		# so it is never sent over idle connection that may be stale
+		retry = req.get_method() in self.RETRY_METHODS and not req.has_data()
+		conn = self._pool.acquire(key, reuse=retry)
+		try:
+			if conn is not None:
+				try:
+					response = self._request(conn, req, headers)
+				except (socket.error, httplib.HTTPException):
+					# Server has closed idle connection, that is normal, retry with a new one in the same place
+					self._pool.discard(conn)
+					conn = connect()
+					response = self._request(conn, req, headers)
+			else:
+				conn = connect()
+				response = self._request(conn, req, headers)
+		except Exception as e:
+			self._pool.discard(conn, key)
+			if isinstance(e, (socket.error, httplib.HTTPException)):
+				raise urllib2.URLError(e)
+			raise
+
+		def release(reusable):
+			if reusable:
+				self._pool.release(key, conn)
+			else:
+				self._pool.discard(conn, key)
+
+		resp = addinfourl(_PooledBody(response, release), response.msg, req.get_full_url())
+		resp.code = response.status
+		resp.msg = response.reason
+		return resp
+
+	@staticmethod
+	def _request(conn, req, headers):
+		conn.request(req.get_method(), req.get_selector(), req.data, headers)
+		return conn.getresponse(buffering=True)
+
+
+class HTTPKeepAliveHandler(_KeepAliveMixin, urllib2.HTTPHandler):
+	def __init__(self, pool, debuglevel=0):
+		urllib2.HTTPHandler.__init__(self, debuglevel)
+		_KeepAliveMixin.__init__(self, pool)
+
+	def http_open(self, req):
+		return self._open('http', httplib.HTTPConnection, req)
+
+
+class HTTPSKeepAliveHandler(_KeepAliveMixin, urllib2.HTTPSHandler):
+	def __init__(self, pool, debuglevel=0):
+		urllib2.HTTPSHandler.__init__(self, debuglevel)
+		_KeepAliveMixin.__init__(self, pool)
+
+	def https_open(self, req):
+		context = getattr(self, '_context', None)
+		if context is not None:
+			return self._open('https', httplib.HTTPSConnection, req, context=context)
+		return self._open('https', httplib.HTTPSConnection, req)
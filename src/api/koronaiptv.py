@@ -15,6 +15,7 @@ from urllib2 import HTTPError
 
 # plugin imports
 from .m3u import M3UProvider
+from .extinf import EXTINF, parseExtInf
 from .abstract_api import JsonSettings
 from ..utils import APIException, APILoginFailed, Channel, Group, ConfSelection
 try:
@@ -43,7 +44,7 @@ class Korona(JsonSettings, M3UProvider):
 	def start(self):
 		self._downloadTvgMap()
 		try:
-			self._parsePlaylist(self.readHttp(self.playlist_url).split('\n'))
+			self._parsePlaylist(self.readHttpLines(self.playlist_url))
 		except HTTPError as e:
 			self.trace("HTTPError:", e, type(e), e.getcode())
 			if e.code in (403, 404):
@@ -55,8 +56,8 @@ class Korona(JsonSettings, M3UProvider):
 			raise APIException(e)
 
 	def _parsePlaylist(self, lines):
-		# Copy of M3U class with some modifications
-		self.tvg_ids = {}
+		# Copy of M3U class with some modifications, channels are published only after the whole playlist
+		channels, groups, channels_data, tvg_ids = {}, {}, {}, {}
 		group_names = {}
 		num = 0
 
@@ -67,49 +68,28 @@ class Korona(JsonSettings, M3UProvider):
 		tvg = None
 		cid = None
 
-		import re
-		tvg_regexp = re.compile('#EXTINF:.*tvg-id="([^"]*)"')
-		group_regexp = re.compile('#EXTINF:.*group-title="([^"]*)"')
-		logo_regexp = re.compile('#EXTINF:.*tvg-logo="([^"]*)"')
-		archive_regexp = re.compile('#EXTINF:.*catchup-days="([^"]*)"')
-		cid_regexp = re.compile('#EXTINF:.*CUID="([^"]*)"')
-
-		for line in lines:
-			if line.startswith("#EXTINF:"):
-				name = line.strip().split(',')[1]
-				m = tvg_regexp.match(line)
-				if m:
+		for line in self._discardBOM(lines):
+			if line.startswith(EXTINF):
+				attrs, name = parseExtInf(line.strip())
+				tvg_id = attrs.get('tvg-id')
+				if tvg_id is not None:
 					if self.tvg_map:
-						k = unicode(m.group(1))
+						k = unicode(tvg_id)
 						try:
 							tvg = self.tvg_map[k]
 						except KeyError:
 							tvg = None
 							self.trace("unknown tvg-id", k)
 					else:
-						tvg = int(m.group(1))
+						tvg = int(tvg_id)
 				else:
 					tvg = None
-				m = group_regexp.match(line)
-				if m:
-					group = m.group(1)
-				else:
-					group = "Unknown"
-				m = logo_regexp.match(line)
-				if m:
-					logo = m.group(1)
-				else:
-					logo = ""
-				m = archive_regexp.match(line)
-				if m:
-					archive = True
-				else:
-					archive = False
-				m = cid_regexp.match(line)
-				if m:
-					cid = int(m.group(1))
-				else:
-					cid = None
+				group = attrs.get('group-title', "Unknown")
+				logo = attrs.get('tvg-logo', "")
+				archive = 'catchup-days' in attrs
+				cid = attrs.get('CUID')
+				if cid is not None:
+					cid = int(cid)
 			elif line.startswith("#EXTGRP:"):
 				group = line.strip().split(':')[1]
 			elif line.startswith("#"):
@@ -121,25 +101,30 @@ class Korona(JsonSettings, M3UProvider):
 				assert url.find("://") > 0, "line: " + url
 				try:
 					gid = group_names[group]
-					g = self.groups[gid]
+					g = groups[gid]
 				except KeyError:
 					gid = len(group_names)
 					group_names[group] = gid
-					g = self.groups[gid] = Group(gid, group.decode('utf-8').capitalize().encode('utf-8'), [])
+					g = groups[gid] = Group(gid, group.decode('utf-8').capitalize().encode('utf-8'), [])
 
 				num += 1
 				if cid is None:
-					cid = hash(url)
+					cid = self.channel_ids.get(url)
 				c = Channel(cid, name, num, archive)
-				self.channels[cid] = c
+				channels[cid] = c
 				g.channels.append(c)
 
-				self.channels_data[cid] = {'tvg': tvg, 'url': url, 'logo': logo}
+				channels_data[cid] = {'tvg': tvg, 'url': url, 'logo': logo}
 				if tvg is not None:
 					try:
-						self.tvg_ids[tvg].append(cid)
+						tvg_ids[tvg].append(cid)
 					except KeyError:
-						self.tvg_ids[tvg] = [cid]
+						tvg_ids[tvg] = [cid]
+
+		self.channels.update(channels)
+		self.groups.update(groups)
+		self.channels_data.update(channels_data)
+		self.tvg_ids = tvg_ids
 
 		self.trace("Loaded {} channels".format(len(self.channels)))
 
@@ -12,6 +12,8 @@ from collections import defaultdict
 from datetime import datetime, timedelta
 from hashlib import md5
 
+from twisted.internet.defer import succeed
+
 from .abstract_api import AbstractAPI, OfflineFavourites
 from ..utils import toDate, EPG, Channel, Group, APIWrongPin
 try:
@@ -106,21 +108,32 @@ class KtvStream(OfflineFavourites, KartinaAPI):
 				channels.append(channel)
 			self.groups[gid] = Group(gid, g['name'].encode('utf-8'), channels)
 
-	def getStreamUrl(self, cid, pin, time=None):
+	def _streamUrlRequest(self, cid, pin, time):
 		params = {"cid": cid}
 		if time:
 			params["gmt"] = time.strftime("%s")
 		if pin:
 			params["protect_code"] = pin
-		data = self.getJsonData(self.site + "/get_url?", params)
+		return self.site + "/get_url?", params
+
+	@staticmethod
+	def _parseStreamUrl(data):
 		url = data['url'].encode('utf-8').split(' ')[0].replace('http/ts://', 'http://')
 		if url == "protected":
 			raise APIWrongPin("")
 		return url
 
-	def getChannelsEpg(self, cids):
+	def getStreamUrl(self, cid, pin, time=None):
+		return self._parseStreamUrl(self.getJsonData(*self._streamUrlRequest(cid, pin, time)))
+
+	def getStreamUrlAsync(self, cid, pin, time=None):
+		return self.getJsonDataAsync(*self._streamUrlRequest(cid, pin, time)).addCallback(self._parseStreamUrl)
+
+	def _channelsEpgRequest(self, cids):
 		params = {"cids": ",".join(map(str, cids)), "epg": 3}
-		data = self.getJsonData(self.site + "/epg_current?", params, "getting epg of cids = %s" % cids)
+		return self.site + "/epg_current?", params, "getting epg of cids = %s" % cids
+
+	def _parseChannelsEpg(self, data):
 		for channel in data['epg']:
 			cid = int(channel['cid'])
 			programs = []
@@ -134,40 +147,78 @@ class KtvStream(OfflineFavourites, KartinaAPI):
 				e = (t, name, desc)
 			yield cid, programs
 
+	def getChannelsEpg(self, cids):
+		return self._parseChannelsEpg(self.getJsonData(*self._channelsEpgRequest(cids)))
+
+	def getChannelsEpgAsync(self, cids):
+		d = self.getJsonDataAsync(*self._channelsEpgRequest(cids))
+		return d.addCallback(lambda data: list(self._parseChannelsEpg(data)))
+
+	# Programs of a day have only start time, so the end of the last one is taken from the next day
+
 	def getDayEpg(self, cid, date):
 		date = datetime(date.year, date.month, date.day)
 		try:
 			t_end = self.day_ends[cid][toDate(date)]
 		except KeyError:
-			programs = list(self._getDayEpg(cid, date + timedelta(1)))
-			try:
-				t_end, _, _ = programs[0]
-				self.day_ends[cid][toDate(date)] = t_end
-			except IndexError:
-				t_end = None
-
-		programs = list(self._getDayEpg(cid, date))
+			t_end = self._storeDayEnd(cid, date, self._getDayEpg(cid, date + timedelta(1)))
+		return self._joinDayEpg(cid, date, t_end, self._getDayEpg(cid, date))
+
+	def getDayEpgAsync(self, cid, date):
+		date = datetime(date.year, date.month, date.day)
+		try:
+			d = succeed(self.day_ends[cid][toDate(date)])
+		except KeyError:
+			d = self._getDayEpgAsync(cid, date + timedelta(1))
+			d.addCallback(lambda programs: self._storeDayEnd(cid, date, programs))
+
+		def getDay(t_end):
+			d = self._getDayEpgAsync(cid, date)
+			return d.addCallback(lambda programs: self._joinDayEpg(cid, date, t_end, programs))
+
+		return d.addCallback(getDay)
+
+	def _storeDayEnd(self, cid, date, next_programs):
+		try:
+			t_end, _, _ = next_programs[0]
+		except IndexError:
+			return None
+		self.day_ends[cid][toDate(date)] = t_end
+		return t_end
+
+	def _joinDayEpg(self, cid, date, t_end, programs):
 		try:
 			t_start, _, _ = programs[0]
-			self.day_ends[cid][date - timedelta(1)] = t_start
+			self.day_ends[cid][toDate(date - timedelta(1))] = t_start
 		except IndexError:
 			pass
 
+		epg = []
 		for (i, p) in enumerate(programs[1:]):
 			t, name, desc = programs[i]  # p is programs[i+1]
-			e = EPG(t, p[0], name, desc)
-			yield e
+			epg.append(EPG(t, p[0], name, desc))
 		if t_end is not None and len(programs) > 0:
 			t, name, desc = programs[-1]
-			yield EPG(t, t_end, name, desc)
+			epg.append(EPG(t, t_end, name, desc))
+		return epg
 
-	def _getDayEpg(self, cid, date):
+	def _dayEpgRequest(self, cid, date):
 		params = {"day": date.strftime("%d%m%y"), "cid": cid}
-		data = self.getJsonData(self.site + "/epg?", params, "day EPG %s for channel %s" % (params['day'], cid))
+		return self.site + "/epg?", params, "day EPG %s for channel %s" % (params['day'], cid)
+
+	def _parseDayEpg(self, data):
+		programs = []
 		for program in data['epg']:
 			t = int(program['ut_start'])
 			name, desc = self.parseName(program['progname'].encode("utf-8"))
-			yield (t, name, desc)
+			programs.append((t, name, desc))
+		return programs
+
+	def _getDayEpg(self, cid, date):
+		return self._parseDayEpg(self.getJsonData(*self._dayEpgRequest(cid, date)))
+
+	def _getDayEpgAsync(self, cid, date):
+		return self.getJsonDataAsync(*self._dayEpgRequest(cid, date)).addCallback(self._parseDayEpg)
 
 	def getPiconUrl(self, cid):
 		url = self.icons[cid]
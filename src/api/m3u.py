@@ -13,11 +13,15 @@ from __future__ import print_function
 # system imports
 import os
 import re
+import codecs
+import marshal
+from hashlib import md5
 from time import mktime
-from json import loads as json_loads
+from json import loads as json_loads, dumps as json_dumps
 
 # plugin imports
-from .abstract_api import OfflineFavourites
+from .abstract_api import AbstractAPI, OfflineFavourites
+from .extinf import EXTINF, parseExtInf
 from ..utils import syncTime, APIException, EPG, Channel, Group
 
 
@@ -26,6 +30,9 @@ class M3UProvider(OfflineFavourites):
 	AUTH_TYPE = ""
 
 	TVG_MAP = False  # True if tvg-id are non-numerical and we need to get map from server
+	# Parsed playlist file is saved here, and restored if neither file nor maps changed
+	SNAPSHOT_FILE = AbstractAPI.HTTP_CACHE_PATH + '%s-playlist.snapshot'
+	SNAPSHOT_VERSION = 2
 
 	def __init__(self, username, password):
 		super(M3UProvider, self).__init__(username, password)
@@ -84,7 +91,7 @@ class M3UProvider(OfflineFavourites):
 	def setChannelsList(self):
 		self._downloadTvgMap()
 		try:
-			self._parsePlaylist(self.readHttp(self.playlist_url).split('\n'))
+			self._parsePlaylist(self.readHttpCachedLines(self.playlist_url))
 		except IOError as e:
 			self.trace("error!", e, type(e))
 			raise APIException(e)
@@ -93,7 +100,7 @@ class M3UProvider(OfflineFavourites):
 		self.tvg_map = {}
 		if self.TVG_MAP:
 			try:
-				self.tvg_map = json_loads(self.readHttp(self.site + "/channels"))['data']
+				self.tvg_map = json_loads(self.readHttpCached(self.site + "/channels"))['data']
 			except IOError as e:
 				self.trace("error!", e)
 				raise APIException(e)
@@ -106,12 +113,104 @@ class M3UProvider(OfflineFavourites):
 		if m:
 			cid = int(m.group(1))
 		else:
-			cid = hash(url)
+			cid = self.channel_ids.get(url)
 			self.trace("Failed to get cid from url", url)
 		url = url.replace("localhost", self._domain).replace("00000000000000", self._key)
 		return Channel(cid, name, num, rec), {'tvg': tvg, 'url': url, 'logo': logo}
 
+	def _loadPlaylistFile(self, m3u):
+		"""
+		Parse playlist file, or restore channels from snapshot of previous parsing
+		:param str m3u: path to playlist
+		"""
+		snapshot_file = self.SNAPSHOT_FILE % self.NAME
+		key = self._snapshotKey(m3u)
+		if key is not None and self._loadSnapshot(snapshot_file, key):
+			return
+		with open(m3u) as f:
+			self._parsePlaylist(f)
+		if key is not None:
+			self._saveSnapshot(snapshot_file, key)
+
+	def _snapshotDeps(self):
+		"""
+		Override in derived class to add data that makeChannel uses besides playlist
+		:rtype: list
+		"""
+		return [self.SNAPSHOT_VERSION, self.tvg_map, self._domain, self._key]
+
+	def _snapshotKey(self, m3u):
+		"""
+		:return: size, mtime and hash of playlist together with dependencies, None if they can't be hashed
+		"""
+		st = os.stat(m3u)
+		h = md5()
+		with open(m3u, 'rb') as f:
+			for chunk in iter(lambda: f.read(self.CHUNK_SIZE), ''):
+				h.update(chunk)
+		try:
+			h.update(json_dumps(self._snapshotDeps(), sort_keys=True))
+		except (TypeError, ValueError) as e:
+			self.trace("snapshot disabled:", e)
+			return None
+		return st.st_size, int(st.st_mtime), h.hexdigest()
+
+	def _loadSnapshot(self, snapshot_file, key):
+		try:
+			with open(snapshot_file, 'rb') as f:
+				stored_key, channels, groups, channels_data, tvg_ids = marshal.load(f)
+		except (IOError, EOFError, ValueError, TypeError):
+			return False
+		if stored_key != key:
+			self.trace("snapshot is outdated")
+			return False
+
+		for cid, name, num, has_archive, is_protected in channels:
+			self.channels[cid] = Channel(cid, name, num, has_archive, is_protected)
+		for gid, title, cids in groups:
+			self.groups[gid] = Group(gid, title, [self.channels[cid] for cid in cids])
+		self.channels_data.update(channels_data)
+		self.tvg_ids = tvg_ids
+		self.trace("Loaded {} channels from snapshot".format(len(self.channels)))
+		return True
+
+	def _saveSnapshot(self, snapshot_file, key):
+		data = (
+			key,
+			[(c.cid, c.name, c.number, c.has_archive, c.is_protected) for c in self.channels.itervalues()],
+			[(g.gid, g.title, [c.cid for c in g.channels]) for g in self.groups.itervalues()],
+			self.channels_data, self.tvg_ids)
+		tmp = snapshot_file + '.tmp'
+		try:
+			directory = os.path.dirname(snapshot_file)
+			if directory and not os.path.isdir(directory):
+				os.makedirs(directory)
+			with open(tmp, 'wb') as f:
+				marshal.dump(data, f)
+			os.rename(tmp, snapshot_file)
+		except (IOError, OSError, ValueError) as e:
+			self.trace("failed to save snapshot:", e)
+
+	def _discardBOM(self, lines):
+		"""Strip UTF-8 byte order mark from the first line of iterable"""
+		lines = iter(lines)
+		for line in lines:
+			if line.startswith(codecs.BOM_UTF8):
+				self.trace("Discard BOM_UTF8")
+				line = line[3:]
+			yield line
+			break
+		for line in lines:
+			yield line
+
 	def _parsePlaylist(self, lines):
+		"""
+		Fill channels and groups from playlist, lines are consumed while they are read.
+		Parsing overlaps the download, but channels are not available before it ends:
+		they are added only when the whole playlist is parsed, so read error leaves previous state.
+		:type lines: Iterable[str]
+		"""
+		channels, groups, channels_data = {}, {}, {}
 		group_names = {}
 		num = 0
 
@@ -121,51 +220,26 @@ class M3UProvider(OfflineFavourites):
 		tvg = None
 		rec = False
 
-		tvg_regexp = re.compile('#EXTINF:.*tvg-id="([^"]*)"')
-		group_regexp = re.compile('#EXTINF:.*group-title="([^"]*)"')
-		logo_regexp = re.compile('#EXTINF:.*tvg-logo="([^"]*)"')
-		rec_regexp = re.compile('#EXTINF:.*tvg-rec="([^"]*)"')
-		catchup_regexp = re.compile('#EXTINF:.*catchup-days="([^"]*)"')
-
-		import codecs
-		if lines:
-			if lines[0].startswith(codecs.BOM_UTF8):
-				self.trace("Discard BOM_UTF8")
-				lines[0] = lines[0][3:]
-
-		for line in lines:
-			if line.startswith("#EXTINF:"):
-				name = line.strip().split(',')[1]
-				m = tvg_regexp.match(line)
-				if m:
+		for line in self._discardBOM(lines):
+			if line.startswith(EXTINF):
+				attrs, name = parseExtInf(line.strip())
+				tvg_id = attrs.get('tvg-id')
+				if tvg_id is not None:
 					if self.tvg_map:
-						k = m.group(1).decode('utf-8')
+						k = tvg_id.decode('utf-8')
 						try:
 							tvg = self.tvg_map[k]
 						except KeyError:
 							tvg = None
 							# self.trace("unknown tvg-id", k)
 					else:
-						tvg = int(m.group(1))
+						tvg = int(tvg_id)
 				else:
 					tvg = None
-				m = group_regexp.match(line)
-				if m:
-					group = m.group(1)
-				m = logo_regexp.match(line)
-				if m:
-					logo = m.group(1)
-				else:
-					logo = ""
-				m = rec_regexp.match(line)
-				if m:
-					rec = m.group(1) != "0"
-				else:
-					m = catchup_regexp.match(line)
-					if m:
-						rec = m.group(1) != "0"
-					else:
-						rec = False
+				group = attrs.get('group-title', group)
+				logo = attrs.get('tvg-logo', "")
+				rec = attrs.get('tvg-rec', attrs.get('catchup-days'))
+				rec = rec is not None and rec != "0"
 			elif line.startswith("#EXTGRP:"):
 				group = line.strip().split(':')[1]
 			elif line.startswith("#"):
@@ -177,31 +251,35 @@ class M3UProvider(OfflineFavourites):
 				assert url.find("://") > 0, "line: " + url
 				try:
 					gid = group_names[group]
-					g = self.groups[gid]
+					g = groups[gid]
 				except KeyError:
 					gid = len(group_names)
 					group_names[group] = gid
-					g = self.groups[gid] = Group(gid, group, [])
+					g = groups[gid] = Group(gid, group, [])
 
 				num += 1
 				c, d = self.makeChannel(num, name, url, tvg, logo, rec)
 				cid = c.cid
-				self.channels[cid] = c
+				channels[cid] = c
 				g.channels.append(c)
-				self.channels_data[cid] = d
+				channels_data[cid] = d
 
 				# reset
 				group = "Unknown"
 
+		self.channels.update(channels)
+		self.groups.update(groups)
+		self.channels_data.update(channels_data)
 		# Create inverse mapping from tvg to cid, required for epg_list
-		self.tvg_ids = {}
+		tvg_ids = {}
 		for cid, data in self.channels_data.items():
 			tvg = data['tvg']
 			if tvg is not None:
 				try:
-					self.tvg_ids[tvg].append(cid)
+					tvg_ids[tvg].append(cid)
 				except KeyError:
-					self.tvg_ids[tvg] = [cid]
+					tvg_ids[tvg] = [cid]
+		self.tvg_ids = tvg_ids
 
 		self.trace("Loaded {} channels".format(len(self.channels)))
 
@@ -217,21 +295,31 @@ class M3UProvider(OfflineFavourites):
 			url += '?utc=%s&lutc=%s' % (time.strftime('%s'), syncTime().strftime('%s'))
 		return url
 
-	def getDayEpg(self, cid, date):
+	def _dayEpgRequest(self, cid, date):
 		params = {"id": self.channels_data[cid]['tvg'], "day": date.strftime("%Y.%m.%d")}
-		data = self.getJsonData(self.site + "/epg_day?", params)
+		return self.site + "/epg_day?", params
+
+	@staticmethod
+	def _parseDayEpg(data):
 		return [EPG(
 			int(e['begin']), int(e['end']),
 			e['title'].encode('utf-8'), e['description'].encode('utf-8')) for e in data['data']]
 
-	def getChannelsEpg(self, cids):
+	def getDayEpg(self, cid, date):
+		return self._parseDayEpg(self.getJsonData(*self._dayEpgRequest(cid, date)))
+
+	def getDayEpgAsync(self, cid, date):
+		return self.getJsonDataAsync(*self._dayEpgRequest(cid, date)).addCallback(self._parseDayEpg)
+
+	def _channelsEpgRequest(self, cids):
 		t = mktime(syncTime().timetuple())
 		tvgs = set(self.channels_data[cid]['tvg'] or 0 for cid in cids)
-		data = self.getJsonData(self.site + "/epg_list?", {
+		return self.site + "/epg_list?", {
 			"time": int(t),
 			"ids": ",".join(map(str, tvgs)),
-		})
+		}
 
+	def _parseChannelsEpg(self, data):
 		for c in data['data']:
 			tvg = c['channel_id']
 			try:
@@ -244,5 +332,12 @@ class M3UProvider(OfflineFavourites):
 					int(e['begin']), int(e['end']), e['title'].encode('utf-8'),
 					e['description'].encode('utf-8')) for e in c['programs']]
 
+	def getChannelsEpg(self, cids):
+		return self._parseChannelsEpg(self.getJsonData(*self._channelsEpgRequest(cids)))
+
+	def getChannelsEpgAsync(self, cids):
+		d = self.getJsonDataAsync(*self._channelsEpgRequest(cids))
+		return d.addCallback(lambda data: list(self._parseChannelsEpg(data)))
+
 	def getPiconUrl(self, cid):
 		return self.channels_data[cid]['logo']
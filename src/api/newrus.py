@@ -50,6 +50,11 @@ class NewrusAPI(AbstractAPI):
 			params.update({self.sid_name: self.sid})
 		return super(NewrusAPI, self).getJsonData(url, params, fromauth=fromauth)
 
+	def getJsonDataAsync(self, url, params, name='', fromauth=False):
+		if not fromauth:
+			params.update({self.sid_name: self.sid})
+		return super(NewrusAPI, self).getJsonDataAsync(url, params, fromauth=fromauth)
+
 
 class OTTProvider(AbstractStream, NewrusAPI):
 	NAME = "NewrusTV"
@@ -75,18 +80,27 @@ class OTTProvider(AbstractStream, NewrusAPI):
 				channels.append(channel)
 			self.groups[gid] = Group(gid, g['name'].encode('utf-8'), channels)
 
-	def getStreamUrl(self, cid, pin, time=None):
+	def _streamUrlRequest(self, cid, pin, time):
 		params = {"cid": cid}
 		if pin:
 			params["protect_code"] = pin
 		if time:
 			params["gmt"] = time.strftime("%s")
-		data = self.getJsonData(self.site + "/get_url.php?", params)
+		return self.site + "/get_url.php?", params
+
+	@staticmethod
+	def _parseStreamUrl(data):
 		url = data["url"].encode("utf-8")
 		if url == "protected":
 			raise APIWrongPin("Access denied")
 		return url
 
+	def getStreamUrl(self, cid, pin, time=None):
+		return self._parseStreamUrl(self.getJsonData(*self._streamUrlRequest(cid, pin, time)))
+
+	def getStreamUrlAsync(self, cid, pin, time=None):
+		return self.getJsonDataAsync(*self._streamUrlRequest(cid, pin, time)).addCallback(self._parseStreamUrl)
+
 	@staticmethod
 	def parseProgram(txt):
 		ret = txt.split('\n', 1)
@@ -94,8 +108,7 @@ class OTTProvider(AbstractStream, NewrusAPI):
 			ret.append("")
 		return ret
 
-	def getChannelsEpg(self, cids):
-		data = self.getJsonData(self.site + "/channel_list.php?", {})
+	def _parseChannelsEpg(self, data):
 		for g in data["groups"]:
 			for c in g["channels"]:
 				cid = int(c["id"])
@@ -103,12 +116,28 @@ class OTTProvider(AbstractStream, NewrusAPI):
 				if name:
 					yield cid, [EPG(int(c['epg_start']), int(c['epg_end']), name, description)]
 
-	def getDayEpg(self, cid, date):
-		params = {"cid": cid, "day": date.strftime("%d%m%y")}
-		data = self.getJsonData(self.site + "/epg.php?", params)
+	def getChannelsEpg(self, cids):
+		return self._parseChannelsEpg(self.getJsonData(self.site + "/channel_list.php?", {}))
+
+	def getChannelsEpgAsync(self, cids):
+		d = self.getJsonDataAsync(self.site + "/channel_list.php?", {})
+		return d.addCallback(lambda data: list(self._parseChannelsEpg(data)))
+
+	def _dayEpgRequest(self, cid, date):
+		return self.site + "/epg.php?", {"cid": cid, "day": date.strftime("%d%m%y")}
+
+	def _parseDayEpg(self, data):
+		programs = []
 		for program in data['epg']:
 			name, description = self.parseProgram(program['progname'].encode('utf-8'))
-			yield EPG(program['ut_start'], program['ut_end'], name, description)
+			programs.append(EPG(program['ut_start'], program['ut_end'], name, description))
+		return programs
+
+	def getDayEpg(self, cid, date):
+		return self._parseDayEpg(self.getJsonData(*self._dayEpgRequest(cid, date)))
+
+	def getDayEpgAsync(self, cid, date):
+		return self.getJsonDataAsync(*self._dayEpgRequest(cid, date)).addCallback(self._parseDayEpg)
 
 	def getSettings(self):
 		return self.settings
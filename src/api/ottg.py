@@ -50,7 +50,7 @@ class OTTProvider(JsonSettings, M3UProvider):
 		if m:
 			cid = int(m.group(1))
 		else:
-			cid = hash(url)
+			cid = self.channel_ids.get(url)
 			self.trace("Failed to get cid from url", url)
 		return Channel(cid, name, num, rec), {'tvg': tvg, 'url': url, 'logo': logo}
 
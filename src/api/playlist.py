@@ -42,7 +42,7 @@ class Playlist(JsonSettings, M3UProvider):
 
 	def start(self):
 		try:
-			self.name_map = json_loads(self.readHttp(self.site + "/channels_names"))['data']
+			self.name_map = json_loads(self.readHttpCached(self.site + "/channels_names"))['data']
 		except (IOError, ValueError) as e:
 			self.trace("error!", e)
 			raise APIException(e)
@@ -51,12 +51,10 @@ class Playlist(JsonSettings, M3UProvider):
 		self._downloadTvgMap()
 		try:
 			if self._m3u_from == 'file':
-				m3u = self._locatePlaylist()
-				with open(m3u) as f:
-					self._parsePlaylist(f.readlines())
+				self._loadPlaylistFile(self._locatePlaylist())
 			elif self._m3u_from == 'url':
 				try:
-					lines = self.readHttp(self.playlist_url).split('\n')
+					lines = self.readHttpCachedLines(self.playlist_url)
 				except (IOError, ValueError) as e:
 					self.trace("error!", e, type(e))
 					raise APIException(e)
@@ -67,6 +65,9 @@ class Playlist(JsonSettings, M3UProvider):
 			self.trace("error!", e, type(e))
 			raise APIException(e)
 
+	def _snapshotDeps(self):
+		return super(Playlist, self)._snapshotDeps() + [self.name_map, self.archive_tag]
+
 	def makeChannel(self, num, name, url, tvg, logo, rec):
 		if tvg is None:
 			try:
@@ -77,7 +78,7 @@ class Playlist(JsonSettings, M3UProvider):
 			archive = name.endswith('(A)') or rec
 		else:
 			archive = True
-		return Channel(hash(url), name, num, archive), {'tvg': tvg, 'url': url, 'logo': logo}
+		return Channel(self.channel_ids.get(url), name, num, archive), {'tvg': tvg, 'url': url, 'logo': logo}
 
 	def getStreamUrl(self, cid, pin, time=None):
 		url = self.channels_data[cid]['url']
@@ -37,7 +37,7 @@ class OTTProvider(JsonSettings, M3UProvider):
 	def start(self):
 		self._downloadTvgMap()
 		try:
-			self._parsePlaylist(self.readHttp(self.playlist_url).split('\n'))
+			self._parsePlaylist(self.readHttpLines(self.playlist_url))
 		except HTTPError as e:
 			self.trace("HTTPError:", e, type(e), e.getcode())
 			if e.code in (403, 404):
@@ -57,6 +57,6 @@ class OTTProvider(JsonSettings, M3UProvider):
 		if m:
 			cid = int(m.group(1))
 		else:
-			cid = hash(url)
+			cid = self.channel_ids.get(url)
 			# self.trace("Failed to get cid from url", url)
 		return Channel(cid, name, num, rec), {'tvg': tvg, 'url': url, 'logo': logo}
@@ -60,31 +60,61 @@ class OTTProvider(OfflineFavourites):
 				channels.append(channel)
 			self.groups[gid] = Group(gid, g['name'].encode('utf-8'), channels)
 
-	def getStreamUrl(self, cid, pin, time=None):
+	def _streamUrlRequest(self, cid, pin, time):
 		params = {"cid": cid}
 		if time:
 			params["gmt"] = time.strftime("%s")
 		if pin:
 			params["protect_code"] = pin
-		data = self.getJsonData(self.site + "/get_url?", params)
+		return self.site + "/get_url?", params
+
+	@staticmethod
+	def _parseStreamUrl(data):
 		url = data['url'].encode('utf-8').split(' ')[0].replace('http/ts://', 'http://')
 		if url == "protected":
 			raise APIWrongPin("")
 		return url
 
-	def getChannelsEpg(self, cids):
-		data = self.getJsonData(self.site + "/epg_next2?", {"cids": ",".join(map(str, cids))})
+	def getStreamUrl(self, cid, pin, time=None):
+		return self._parseStreamUrl(self.getJsonData(*self._streamUrlRequest(cid, pin, time)))
+
+	def getStreamUrlAsync(self, cid, pin, time=None):
+		return self.getJsonDataAsync(*self._streamUrlRequest(cid, pin, time)).addCallback(self._parseStreamUrl)
+
+	def _channelsEpgRequest(self, cids):
+		return self.site + "/epg_next2?", {"cids": ",".join(map(str, cids))}
+
+	@staticmethod
+	def _parseChannelsEpg(data):
 		for e in data['epg']:
 			yield int(e['chid']), [EPG(
 				int(e['start']), int(e['end']),
 				e['progname'].encode('utf-8'), e['description'].encode('utf-8'))]
 
-	def getDayEpg(self, cid, date):
-		data = self.getJsonData(self.site + "/epg?", {'cid': cid, 'day': date.strftime("%d%m%y")})
-		for e in data['epg']:
-			yield EPG(
+	def getChannelsEpg(self, cids):
+		return self._parseChannelsEpg(self.getJsonData(*self._channelsEpgRequest(cids)))
+
+	def getChannelsEpgAsync(self, cids):
+		d = self.getJsonDataAsync(*self._channelsEpgRequest(cids))
+		return d.addCallback(lambda data: list(self._parseChannelsEpg(data)))
+
+	def _dayEpgRequest(self, cid, date):
+		return self.site + "/epg?", {'cid': cid, 'day': date.strftime("%d%m%y")}
+
+	@staticmethod
+	def _parseDayEpg(data):
+		return [
+			EPG(
 				int(e['ut_start']), int(e['ut_end']),
 				e['progname'].encode('utf-8'), e['description'].encode('utf-8'))
+			for e in data['epg']
+		]
+
+	def getDayEpg(self, cid, date):
+		return self._parseDayEpg(self.getJsonData(*self._dayEpgRequest(cid, date)))
+
+	def getDayEpgAsync(self, cid, date):
+		return self.getJsonDataAsync(*self._dayEpgRequest(cid, date)).addCallback(self._parseDayEpg)
 
 	def getPiconUrl(self, cid):
 		url = self.icons[cid]
@@ -16,6 +16,8 @@ import urllib
 from hashlib import md5
 from json import loads as json_loads
 
+from twisted.internet.defer import succeed
+
 # plugin imports
 from .abstract_api import JsonSettings, OfflineFavourites
 from ..utils import APIException, APILoginFailed, Channel, Group, EPG
@@ -34,35 +36,49 @@ class OTTProvider(OfflineFavourites, JsonSettings):
 	def start(self):
 		self.authorize()
 
-	def authorize(self):
+	def _authRequest(self):
 		self.trace("Username", self.username)
 		self.sid = None
 		self._tokens = []
-		response = self._getJson(self.site, {
+		return {
 			'userLogin': self.username,
 			'userPasswd': md5(self.password).hexdigest(),
-		}, reauth=False)
+		}
+
+	def _parseAuth(self, response):
 		self.sid = response['sessionId']
 		self.trace("Session", self.sid)
 
-	def _getJson(self, url, params, reauth=True):
+	def authorize(self):
+		self._parseAuth(self._getJson(self.site, self._authRequest(), reauth=False))
+
+	def authorizeAsync(self):
+		return self._getJsonAsync(self.site, self._authRequest(), reauth=False).addCallback(self._parseAuth)
+
+	def _jsonRequest(self, url, params):
 		if self.sid is not None:
 			params['sessionId'] = self.sid
+		self.trace(url, params.get('apiAction', 'AUTH'))
+		self.trace(url + urllib.urlencode(params))
+		return url + urllib.urlencode(params)
+
+	@staticmethod
+	def _parseJson(reply):
+		try:
+			return json_loads(reply)
+		except Exception as e:
+			raise APIException("Failed to parse json: %s" % str(e))
 
+	def _getJson(self, url, params, reauth=True):
 		try:
-			self.trace(url, params.get('apiAction', 'AUTH'))
-			self.trace(url + urllib.urlencode(params))
-			reply = self.readHttp(url + urllib.urlencode(params))
+			reply = self.readHttp(self._jsonRequest(url, params))
 		except URLError as e:
 			self.trace("URLError:", e)
 			raise APIException(e)
 		except IOError as e:
 			self.trace("IOError:", e)
 			raise APIException(e)
-		try:
-			json = json_loads(reply)
-		except Exception as e:
-			raise APIException("Failed to parse json: %s" % str(e))
+		json = self._parseJson(reply)
 
 		if json['status'] != 1:
 			if reauth:
@@ -72,6 +88,19 @@ class OTTProvider(OfflineFavourites, JsonSettings):
 				raise APIException(json['error'].encode('utf-8'))
 		return json['data']
 
+	def _getJsonAsync(self, url, params, reauth=True):
+		def check(json):
+			if json['status'] != 1:
+				if reauth:
+					d = self.authorizeAsync()
+					return d.addCallback(lambda _: self._getJsonAsync(url, params, reauth=False))
+				else:
+					raise APIException(json['error'].encode('utf-8'))
+			return json['data']
+
+		d = self.readHttpAsync(self._jsonRequest(url, params))
+		return d.addCallback(self._parseJson).addCallback(check)
+
 	def setChannelsList(self):
 		data = self._getJson(self.site, {
 			'apiAction': 'getUserChannels',
@@ -94,34 +123,70 @@ class OTTProvider(OfflineFavourites, JsonSettings):
 				channels.append(channel)
 			self.groups[gid] = Group(gid, g['groupName'].encode('utf-8'), channels)
 
+	@staticmethod
+	def _pinRequest(pin):
+		return {
+			'apiAction': 'pornoPinCodeValidation',
+			'pornoPinCode': pin
+		}
+
+	@staticmethod
+	def _pinFailed(err):
+		err.trap(APIException)
+		raise APILoginFailed(str(err.value))
+
+	@staticmethod
+	def _tokensRequest():
+		return {
+			'apiAction': 'getRandomTokens',
+			'cnt': 30,
+		}
+
+	def _parseTokens(self, data):
+		self._tokens = [t.encode('utf-8') for t in data['tokens']]
+		return self._tokens.pop()
+
+	def _streamUrl(self, cid, token, time):
+		url = self.channels_data[cid]['url']
+		if time is None:
+			return url + "?token=%s" % token
+		return url + "?token=%s&utc=%s" % (token, time.strftime('%s'))
+
 	def getStreamUrl(self, cid, pin, time=None):
 		if self.channels[cid].is_protected:
 			try:
-				self._getJson(self.site, {
-					'apiAction': 'pornoPinCodeValidation',
-					'pornoPinCode': pin
-				})
+				self._getJson(self.site, self._pinRequest(pin))
 			except APIException as e:
 				raise APILoginFailed(str(e))
 
-		if not self._tokens:
-			data = self._getJson(self.site, {
-				'apiAction': 'getRandomTokens',
-				'cnt': 30,
-			})
-			self._tokens = [t.encode('utf-8') for t in data['tokens']]
-		token = self._tokens.pop()
+		if self._tokens:
+			token = self._tokens.pop()
+		else:
+			token = self._parseTokens(self._getJson(self.site, self._tokensRequest()))
+		return self._streamUrl(cid, token, time)
 
-		url = self.channels_data[cid]['url']
-		if time is None:
-			return url + "?token=%s" % token
-		return url + "?token=%s&utc=%s" % (token, time.strftime('%s'))
+	def getStreamUrlAsync(self, cid, pin, time=None):
+		if self.channels[cid].is_protected:
+			d = self._getJsonAsync(self.site, self._pinRequest(pin)).addErrback(self._pinFailed)
+		else:
+			d = succeed(None)
 
-	def getDayEpg(self, cid, date):
-		data = self._getJson(self.site, {
+		def getToken(_):
+			if self._tokens:
+				return self._tokens.pop()
+			return self._getJsonAsync(self.site, self._tokensRequest()).addCallback(self._parseTokens)
+
+		return d.addCallback(getToken).addCallback(lambda token: self._streamUrl(cid, token, time))
+
+	@staticmethod
+	def _dayEpgRequest(cid):
+		return {
 			'apiAction': 'getTvProgram',
 			'channelId': cid,
-		})
+		}
+
+	@staticmethod
+	def _parseDayEpg(data):
 		return [
 			EPG(
 				int(e['prStartSec']), int(e['prStopSec']),
@@ -129,12 +194,25 @@ class OTTProvider(OfflineFavourites, JsonSettings):
 			) for e in data['tvProgram']
 		]
 
-	def getChannelsEpg(self, cids):
-		data = self._getJson(self.site, {'apiAction': 'getCurrentPrograms'})
+	def getDayEpg(self, cid, date):
+		return self._parseDayEpg(self._getJson(self.site, self._dayEpgRequest(cid)))
+
+	def getDayEpgAsync(self, cid, date):
+		return self._getJsonAsync(self.site, self._dayEpgRequest(cid)).addCallback(self._parseDayEpg)
+
+	@staticmethod
+	def _parseChannelsEpg(data):
 		for cid, ps in data['currentPrograms'].items():
 			yield (int(cid), [
 				EPG(int(e['prStartSec']), int(e['prStopSec']), e['prTitle'].encode('utf-8')) for e in ps
 			])
 
+	def getChannelsEpg(self, cids):
+		return self._parseChannelsEpg(self._getJson(self.site, {'apiAction': 'getCurrentPrograms'}))
+
+	def getChannelsEpgAsync(self, cids):
+		d = self._getJsonAsync(self.site, {'apiAction': 'getCurrentPrograms'})
+		return d.addCallback(lambda data: list(self._parseChannelsEpg(data)))
+
 	def getPiconUrl(self, cid):
 		return self.channels_data[cid]['logo']
@@ -11,13 +11,15 @@
 from __future__ import print_function
 
 from datetime import datetime, timedelta
+from heapq import heappush, heappop
+from twisted.internet.defer import CancelledError, succeed
 
 # from api.abstract_api import AbstractStream
 from .utils import trace, APIException, EPG
 from .layer import eTimer
 
 try:
-	from typing import List, Dict, Callable, Tuple  # pylint: disable=unused-import
+	from typing import List, Dict, Callable, Set, Tuple  # pylint: disable=unused-import
 except ImportError:
 	pass
 
@@ -33,6 +35,11 @@ class LiveEpgWorker(object):
 		self._timer = eTimer()
 		self._timer.callback.append(self.update)
 		self._epg = {}  # type: Dict[int, List[EPG]]
+		self._queue = []  # type: List[Tuple[datetime, int]]
+		self._pending = set()  # type: Set[int]
+		self._request = None
+		# number of update requests and channels in them
+		self.stats = {'refreshes': 0, 'channels': 0, 'last_channels': 0}
 		if len(self.db.channels):
 			self.update()
 		else:
@@ -42,37 +49,112 @@ class LiveEpgWorker(object):
 		trace("LiveEpgWorker", *args)
 
 	def update(self):
+		"""
+		Request epg for expired channels
+		:rtype: Deferred
+		"""
+		if self._request is not None:
+			self.trace("update already in progress")
+			return self._request
+
 		t = datetime.now()
 		self.trace("update() at", t)
 		if self._epg:
-			self.trace(min([programs[0].end for programs in self._epg.values() if programs]))
-			to_update = [cid for cid, programs in self._epg.items() if (programs and programs[0].end <= t)]
-			self.trace("expired for", to_update)
-		else:
-			to_update = self.db.channels.keys()
-
-		if to_update:
-			try:
-				data = self.db.getChannelsEpg(to_update)
-				self._epg.update(data)
-			except APIException as ex:
-				self.trace("get data failed!", ex)
-				self._timer.startLongTimer(60)  # retry in one minute
-				return
-
-			if not self._epg:
-				self.trace("empty data! Stop.")
-				return
+			self._pending.update(self._popExpired(t))
+			self.trace("expired for", self._pending)
 		else:
-			data = None
+			stored = self.db.epg_store.getLive(self.db.channels.keys())
+			self.trace("loaded from store", len(stored))
+			if stored:
+				self._epg.update(stored)
+				self._push(stored.keys())
+				self._runCallbacks(stored.keys())
+			self._pending.update(cid for cid in self.db.channels.keys() if cid not in stored)
+
+		if not self._pending:
 			self.trace("warning: already up to date")
-
-		next_update = min(p.end for programs in self._epg.values() for p in programs[:1])
+			self._schedule()
+			return succeed(None)
+
+		to_update = list(self._pending)
+		self.stats['refreshes'] += 1
+		self.stats['channels'] += len(to_update)
+		self.stats['last_channels'] = len(to_update)
+
+		def done(result):
+			self._request = None
+			return result
+
+		d = self._request = self.db.getChannelsEpgAsync(to_update)
+		return d.addBoth(done).addCallback(self._updateReceived, to_update).addErrback(self._updateFailed)
+
+	def _push(self, cids):
+		"""Add end of the current program to the expiration queue"""
+		for cid in cids:
+			programs = self._epg.get(cid)
+			if programs:
+				heappush(self._queue, (programs[0].end, cid))
+
+	def _popExpired(self, t):
+		"""
+		Pop channels whose current program ended before t.
+		Queue entries left from replaced data are skipped.
+		:rtype: Set[int]
+		"""
+		expired = set()
+		queue = self._queue
+		while queue and queue[0][0] <= t:
+			end, cid = heappop(queue)
+			programs = self._epg.get(cid)
+			if programs and programs[0].end == end:
+				expired.add(cid)
+		return expired
+
+	def _nextExpire(self):
+		queue = self._queue
+		while queue:
+			end, cid = queue[0]
+			programs = self._epg.get(cid)
+			if programs and programs[0].end == end:
+				return end
+			heappop(queue)
+		return None
+
+	def _updateReceived(self, data, to_update):
+		self._epg.update(data)
+		self.db.epg_store.putLive(data)
+		received = [cid for cid, programs in data]
+		self._pending.difference_update(received)
+		# channels that never had epg are not requested again
+		self._pending.intersection_update(self._epg.keys())
+		self._push(received)
+		self.trace("refreshed %d of %d channels, %s" % (len(received), len(to_update), self.stats))
+		if not self._epg:
+			self.trace("empty data! Stop.")
+			return
+		self._schedule()
+		if received:
+			self._runCallbacks(received)
+
+	def _updateFailed(self, err):
+		if err.check(CancelledError):
+			self.trace("update cancelled")
+			return
+		err.trap(APIException)
+		self.trace("get data failed!", err.getErrorMessage())
+		self._timer.startLongTimer(60)  # retry in one minute
+
+	def _schedule(self):
+		next_update = self._nextExpire()
+		if self._pending:
+			# retry channels without data
+			next_update = datetime.now()
+		elif next_update is None:
+			self.trace("nothing to schedule")
+			return
 		self.trace("schedule to", next_update)
 		diff = int((next_update + timedelta(seconds=1) - datetime.now()).total_seconds() * 1000)
 		self._timer.start(max(60 * 1000, min(60 * 60 * 1000, diff)), True)  # 1 min < timer < 1 hour
-		if data:
-			self._runCallbacks(set(self._epg.keys()).intersection(set(to_update)))
 
 	def _runCallbacks(self, channel_ids):
 		new_data = []
@@ -85,11 +167,13 @@ class LiveEpgWorker(object):
 	def destroy(self):
 		"""Call before del to avoid cycle references, because eTimer holds reference to self."""
 		self._timer.callback.remove(self.update)
-		self._timer.stop()
+		self.stop()
 
 	def stop(self):
 		self.trace("Stop.")
 		self._timer.stop()
+		if self._request is not None:
+			self._request.cancel()
 
 	def get(self, cid):
 		try:
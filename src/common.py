@@ -202,12 +202,18 @@ class AutoAudioSelection(Screen):
 class NumberEnter(Screen):
 	TIMEOUT = 1800
 
-	def __init__(self, session, number):
+	def __init__(self, session, number, find=None):
+		"""
+		:param int number: first digit
+		:param find: function that returns channels which numbers start with entered digits, used for preview
+		"""
 		Screen.__init__(self, session)
 		self.skinName = "NumberZap"  # TODO own skin
 
+		self.find = find
 		self["channel"] = Label(_("Channel:"))
 		self["number"] = Label(str(number))
+		self["servicename"] = Label("")
 
 		self["actions"] = NumberActionMap(["SetupActions"], {
 				"cancel": self.exit,
@@ -227,6 +233,13 @@ class NumberEnter(Screen):
 		self.timer = eTimer()
 		self.timer.callback.append(self.keyOK)
 		self.timer.start(self.TIMEOUT)
+		self.updatePreview()
+
+	def updatePreview(self):
+		if self.find is None:
+			return
+		channels = self.find(int(self["number"].text))
+		self["servicename"].setText(" | ".join("%d. %s" % (c.number, c.name) for c in channels))
 
 	def exit(self):
 		self.timer.stop()
@@ -241,3 +254,5 @@ class NumberEnter(Screen):
 		self["number"].text += str(number)
 		if len(self["number"].text) > 5:
 			self.keyOK()
+		else:
+			self.updatePreview()
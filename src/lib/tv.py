@@ -12,20 +12,30 @@
 
 from __future__ import print_function
 
-from collections import deque
-from os import mkdir, listdir, path as os_path
-from twisted.web.client import downloadPage
+from collections import OrderedDict
+from os import mkdir, listdir, rename, path as os_path
+from time import time
+from heapq import heapify, heappop, heappush
+from itertools import count
+from json import loads as json_loads, dumps as json_dumps
+from twisted.internet import reactor
 from twisted.internet.defer import Deferred, succeed, CancelledError
+try:
+	from typing import Dict, List, Tuple  # pylint: disable=unused-import
+except ImportError:
+	pass
 
 from Components.AVSwitch import AVSwitch
-from Components.config import config, ConfigSelection
+from Components.config import config, ConfigSelection, ConfigInteger
 from enigma import eBackgroundFileEraser, ePicLoad
 
 from ..loc import translate as _
 from ..layer import enigma2Qt
+from ..provision import pluginConfig
 from ..api.abstract_api import AbstractStream
-from ..utils import trace
-from ..common import fatalError, downloadError, DownloadException
+from ..utils import trace, LRUCache
+from ..common import fatalError, DownloadException
+from ..webclient import makeAgent, defaultHeaders, readResponseBody, timeoutDeferred
 
 
 class SortOrderSettings(object):
@@ -56,77 +66,233 @@ PICON_PATH = '/tmp/IPtvDream/'
 
 
 class PiconCache(object):
-	CACHE_SIZE = 50
+	"""
+	Downloaded picons in PICON_PATH, least recently used files are removed when total size exceeds budget.
+	Size and access time of files are kept in index file, files not found in index are removed on start.
+	"""
+	MAX_SIZE = 2 * 1024 * 1024  # bytes
+	INDEX_FILE = 'index.json'
+	MAX_DOWNLOADS = 4
+	TIMEOUT = 20  # seconds for whole download, stalled server must not keep place in pool
+	SAVE_DELAY = 60  # seconds, access times of cache hits are written to index at most that often
+	# Download priorities, lower value goes first
+	PRIORITY_SHOW, PRIORITY_SELECTED, PRIORITY_PAGE, PRIORITY_NEXT = range(4)
 
-	def __init__(self):
-		self.picons = {}
-		self.defers = {}
-		self.requests = deque()
+	def __init__(self, max_size=MAX_SIZE):
+		self.max_size = max_size
+		# file name -> [size, access time], in order of access
+		self.picons = OrderedDict()  # type: OrderedDict[str, list]
+		self.total_size = 0
+		# file name -> consumer deferreds waiting for download
+		self.defers = {}  # type: Dict[str, List[Deferred]]
+		# heap of (priority, n, url, file name) waiting for free place in download pool
+		self._queue = []
+		self._counter = count()
+		# file name -> (priority, deferred) of running downloads
+		self._active = {}  # type: Dict[str, Tuple[int, Deferred]]
+		self._agent = makeAgent()
+		self.stats = {'hits': 0, 'misses': 0, 'evicted': 0, 'cancelled': 0}
+		self._saveCall = None
 		self.trace("init")
 		try:
 			if not os_path.exists(PICON_PATH):
 				mkdir(PICON_PATH)
 			else:
-				for f in listdir(PICON_PATH):
-					self._onLoad(None, f, loaded=False)
+				self._loadIndex()
+		except (IOError, OSError) as e:
+			self.trace(e)
+
+	def _loadIndex(self):
+		try:
+			with open(PICON_PATH + self.INDEX_FILE) as f:
+				index = json_loads(f.read())
+		except (IOError, ValueError):
+			index = {}
+		files = set(listdir(PICON_PATH))
+		files.discard(self.INDEX_FILE)
+		for f, (size, atime) in sorted(index.items(), key=lambda item: item[1][1]):
+			f = f.encode('utf-8')
+			if f in files and os_path.getsize(PICON_PATH + f) == size:
+				files.remove(f)
+				self.picons[f] = [size, atime]
+				self.total_size += size
+		# not finished downloads and files of previous versions
+		for f in files:
+			self._erase(f)
+		self._evict()
+
+	def _saveIndex(self):
+		if self._saveCall is not None:
+			if self._saveCall.active():
+				self._saveCall.cancel()
+			self._saveCall = None
+		try:
+			with open(PICON_PATH + self.INDEX_FILE, 'w') as f:
+				f.write(json_dumps(self.picons))
 		except IOError as e:
 			self.trace(e)
 
-	def get(self, url):
+	@staticmethod
+	def _erase(f):
+		eBackgroundFileEraser.getInstance().erase(PICON_PATH + f)
+
+	def get(self, url, priority=PRIORITY_SHOW):
+		"""
+		:return: Deferred that fires with path to downloaded picon
+		"""
 		f = url.split('/')[-1]
 		try:
-			p = self.picons[f]
-			self.trace("return", url)
-			return succeed(p)
+			entry = self.picons.pop(f)
 		except KeyError:
-			return self.load(url, f)
+			self.stats['misses'] += 1
+			return self.load(url, f, priority)
+		entry[1] = int(time())
+		self.picons[f] = entry
+		self.stats['hits'] += 1
+		if self._saveCall is None:
+			self._saveCall = reactor.callLater(self.SAVE_DELAY, self._saveIndex)
+		self.trace("return", url)
+		return succeed(PICON_PATH + f)
+
+	def setMaxSize(self, max_size):
+		self.max_size = max_size
+		self._evict()
+		self._saveIndex()
 
-	def load(self, url, f):
+	def load(self, url, f, priority=PRIORITY_SHOW):
 		self.trace("load", url)
+		consumer = Deferred()
+		self.defers.setdefault(f, []).append(consumer)
+		self._enqueue(url, f, priority)
+		self._startDownloads()
+		return consumer
+
+	def prefetch(self, selected, page, next_page):
+		"""
+		Download picons before they are shown, previous prefetch requests that have not started are dropped
+		:param str selected: picon url of selected channel
+		:param List[str] page: urls for visible page
+		:param List[str] next_page: urls for next page
+		"""
+		self._queue = [item for item in self._queue if item[0] == self.PRIORITY_SHOW]
+		heapify(self._queue)
+		for priority, urls in (
+				(self.PRIORITY_SELECTED, [selected]), (self.PRIORITY_PAGE, page), (self.PRIORITY_NEXT, next_page)):
+			for url in urls:
+				if url:
+					f = url.split('/')[-1]
+					if f not in self.picons:
+						self._enqueue(url, f, priority)
+		self._startDownloads()
+
+	def _enqueue(self, url, f, priority):
 		try:
-			d, consumers = self.defers[f]
-			consumers.append(Deferred())
+			active_priority, d = self._active[f]
 		except KeyError:
-			d = downloadPage(url, PICON_PATH + f).addErrback(downloadError)
-			d.addCallback(self._onLoad, f).addErrback(self._onError, f)
-			consumers = [Deferred()]
-			self.defers[f] = (d, consumers)
-		return consumers[-1]
+			heappush(self._queue, (priority, next(self._counter), url, f))
+		else:
+			# already downloading, raise priority so it is not cancelled
+			self._active[f] = (min(priority, active_priority), d)
+
+	def _startDownloads(self):
+		while self._queue:
+			priority, _n, url, f = self._queue[0]
+			if f in self._active or f in self.picons:
+				heappop(self._queue)
+				continue
+			if len(self._active) >= self.MAX_DOWNLOADS:
+				# cancelled download starts next one by itself, so check queue again
+				if not self._cancelLowerPriority(priority):
+					break
+				continue
+			heappop(self._queue)
+			self._download(url, f, priority)
 
-	def _onLoad(self, result, f, loaded=True):
+	def _cancelLowerPriority(self, priority):
+		"""Cancel prefetch download with the lowest priority to free place for selected or shown picon"""
+		if priority > self.PRIORITY_SELECTED:
+			return False
+		lowest = max(self._active.items(), key=lambda item: item[1][0])
+		f, (active_priority, d) = lowest
+		if active_priority <= self.PRIORITY_SELECTED:
+			return False
+		self.trace("cancel", f)
+		self.stats['cancelled'] += 1
+		d.cancel()
+		return f not in self._active
+
+	def _download(self, url, f, priority):
+		d = self._agent.request(b'GET', url, headers=defaultHeaders())
+		d.addCallback(readResponseBody)
+		timeoutDeferred(d, self.TIMEOUT)
+		self._active[f] = (priority, d)
+		d.addCallback(self._onLoad, f).addErrback(self._onError, f)
+		d.addCallback(self._onFinished, f)
+
+	def _onFinished(self, _result, f):
+		self._active.pop(f, None)
+		self._startDownloads()
+
+	def _onLoad(self, data, f):
 		pixmap = PICON_PATH + f
-		self.picons[f] = pixmap
-		self.requests.append(f)
-		if loaded:
-			d, consumers = self.defers.pop(f)
-			for consumer in consumers:
-				consumer.callback(pixmap)
-			del d
-		if len(self.requests) >= self.CACHE_SIZE:
-			self.trace("wipe cache", self.requests)
-			for _i in xrange(self.CACHE_SIZE / 2):
-				fname = self.requests.popleft()
-				del self.picons[fname]
-				eBackgroundFileEraser.getInstance().erase(PICON_PATH + fname)
+		with open(pixmap + '.part', 'wb') as fd:
+			fd.write(data)
+		rename(pixmap + '.part', pixmap)
+		size = len(data)
+		old = self.picons.pop(f, None)
+		if old is not None:
+			self.total_size -= old[0]
+		self.picons[f] = [size, int(time())]
+		self.total_size += size
+		self._evict()
+		self._saveIndex()
+		for consumer in self.defers.pop(f, []):
+			consumer.callback(pixmap)
+
+	def _evict(self):
+		# last added file is never removed
+		evicted = 0
+		while self.total_size > self.max_size and len(self.picons) > 1:
+			f, (size, _atime) = self.picons.popitem(last=False)
+			self.total_size -= size
+			evicted += 1
+			self._erase(f)
+		if evicted:
+			self.stats['evicted'] += evicted
+			self.trace(self)
 
 	def _onError(self, err, f):
-		self.trace(err)
-		_, consumers = self.defers.pop(f)
-		for consumer in consumers:
-			consumer.errback(err)
+		self.trace(err.getErrorMessage())
+		for consumer in self.defers.pop(f, []):
+			if err.check(CancelledError):
+				consumer.errback(err)
+			else:
+				consumer.errback(DownloadException(err.getErrorMessage()))
 
 	@staticmethod
 	def trace(*args):
 		print("[IPtvDream] PiconCache", ' '.join(map(str, args)))
 
+	def __str__(self):
+		return "PiconCache(files=%d, size=%d/%d, %s)" % (
+			len(self.picons), self.total_size, self.max_size,
+			", ".join("%s=%d" % kv for kv in sorted(self.stats.items())))
+
 
-cache = PiconCache()
+pluginConfig.picon_cache_size = ConfigInteger(PiconCache.MAX_SIZE // (1024 * 1024), (1, 64))  # megabytes
+cache = PiconCache(pluginConfig.picon_cache_size.value * 1024 * 1024)
 
 
 class Picon(object):
+	PIXMAP_CACHE_SIZE = 16
+	# Decoded and scaled pictures shared by all instances, keyed by (file, width, height)
+	pixmaps = LRUCache(PIXMAP_CACHE_SIZE)
+	decode_stats = {'count': 0, 'time': 0.0}
+
 	def __init__(self, pixmap):
 		self.pixmap = pixmap
 		self.d = None
+		self._decoding = None  # key and start time of running decode
 		self.picload = ePicLoad()
 		if enigma2Qt:
 			self._connection = self.picload.PictureData.connect(self._paint)
@@ -135,6 +301,7 @@ class Picon(object):
 
 	def setIcon(self, url):
 		self.pixmap.instance.setPixmap(None)
+		self._decoding = None
 		if self.d:
 			self.d.cancel()
 		if not url:
@@ -143,19 +310,33 @@ class Picon(object):
 		self.d.addCallback(self._onReady).addErrback(self._onFail).addErrback(fatalError)
 
 	def _onReady(self, file_name):
+		width = self.pixmap.instance.size().width()
+		height = self.pixmap.instance.size().height()
+		key = (file_name, width, height)
+		ptr = self.pixmaps.get(key)
+		if ptr is not None:
+			self.pixmap.instance.setPixmap(ptr.__deref__())
+			return
 		sc = AVSwitch().getFramebufferScale()
-		trace(sc)
-		self.picload.setPara((
-			self.pixmap.instance.size().width(),
-			self.pixmap.instance.size().height(),
-			sc[0], sc[1], False, 1, "#00000000"))
+		self.picload.setPara((width, height, sc[0], sc[1], False, 1, "#00000000"))
+		self._decoding = (key, time())
 		self.picload.startDecode(file_name)
 
 	def _paint(self, picInfo=None):
-		trace(picInfo)
 		ptr = self.picload.getData()
-		if ptr is not None:
-			self.pixmap.instance.setPixmap(ptr.__deref__())
+		# decoding result of previous icon is not needed
+		if ptr is None or self._decoding is None:
+			return
+		key, start = self._decoding
+		self._decoding = None
+		self.pixmaps[key] = ptr
+		stats = self.decode_stats
+		stats['count'] += 1
+		stats['time'] += time() - start
+		total = self.pixmaps.hits + self.pixmaps.misses
+		trace("picon decoded in %.3f s, average %.3f s, hit ratio %.2f" % (
+			time() - start, stats['time'] / stats['count'], float(self.pixmaps.hits) / total))
+		self.pixmap.instance.setPixmap(ptr.__deref__())
 
 	def _onFail(self, err):
 		e = err.trap(DownloadException, CancelledError)
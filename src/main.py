@@ -14,9 +14,10 @@ from __future__ import print_function
 # system imports
 from datetime import datetime, timedelta
 import urllib
+from twisted.internet.defer import CancelledError
 try:
 	# noinspection PyUnresolvedReferences
-	from typing import Callable, Optional, List, Tuple  # pylint: disable=unused-import
+	from typing import Callable, Dict, Optional, List, Tuple  # pylint: disable=unused-import
 except ImportError:
 	pass
 
@@ -52,14 +53,14 @@ from skin import parseFont, parseColor
 # plugin imports
 from .layer import eTimer
 from .common import NumberEnter
-from .utils import trace, tdSec, secTd, syncTime, APIException, APIWrongPin, EPG, timeit
+from .utils import trace, tdSec, secTd, syncTime, APIException, APIWrongPin, EPG, timeit, LRUCache
 from .api.abstract_api import AbstractStream
 from .loc import translate as _
-from .common import ShowHideScreen, AutoAudioSelection, MainMenuScreen
+from .common import ShowHideScreen, AutoAudioSelection, MainMenuScreen, safecb, fatalError
 from .standby import standbyNotifier
 from .cache import LiveEpgWorker
 from .lib.epg import EpgProgress
-from .lib.tv import SortOrderSettings, Picon
+from .lib.tv import SortOrderSettings, Picon, cache as piconCache
 
 SKIN_PATH = resolveFilename(SCOPE_SKIN, 'IPtvDream')
 ENIGMA_CONF_PATH = resolveFilename(SCOPE_SYSETC, 'enigma2')
@@ -188,6 +189,12 @@ class IPtvDreamStreamPlayer(
 		self.archive_pause = None
 		self.shift = 0
 
+		# Pending requests to the api
+		self._url_request = None
+		self._epg_request = None
+		self._wantCallbacks = None
+		self.onClose.append(self.cancelRequests)
+
 	# Init and destroy
 
 	def start(self):
@@ -199,6 +206,11 @@ class IPtvDreamStreamPlayer(
 		self.session.deleteDialog(self.channels)
 		self.close(ret)
 
+	def cancelRequests(self):
+		for d in (self._url_request, self._epg_request):
+			if d is not None:
+				d.cancel()
+
 	def confirmExit(self):
 		def cb(ret):
 			if ret:
@@ -232,19 +244,30 @@ class IPtvDreamStreamPlayer(
 				windowTitle=_("Channel Locked"), type=Input.PIN)
 
 	def getUrl(self, pin):
-		try:
-			url = self.db.getStreamUrl(self.cid, pin, self.time())
-		except APIWrongPin:
+		if self._url_request is not None:
+			self._url_request.cancel()
+		self._url_request = self.db.getStreamUrlAsync(self.cid, pin, self.time())
+		self._url_request.addCallback(self.urlReceived).addErrback(self.urlFailed).addErrback(fatalError)
+
+	@safecb
+	def urlReceived(self, url):
+		self._url_request = None
+		self.playUrl(url)
+
+	@safecb
+	def urlFailed(self, err):
+		e = err.trap(APIWrongPin, APIException, CancelledError)
+		if e == CancelledError:
+			trace("getUrl cancelled")
+			return
+		self._url_request = None
+		if e == APIWrongPin:
 			self.session.openWithCallback(
 					lambda ret: self.enterPin(), MessageBox, _("Wrong pin!"),
 					MessageBox.TYPE_ERROR, timeout=10, enable_input=False)
-			return
-		except APIException as e:
-			self.showError(_("Error while getting stream url:") + str(e))
+		else:
+			self.showError(_("Error while getting stream url:") + str(err.getErrorMessage()))
 			self.updateLabels()
-			return
-
-		self.playUrl(url)
 
 	# Player
 
@@ -372,60 +395,80 @@ class IPtvDreamStreamPlayer(
 		# first stop timers
 		self.epgTimer.stop()
 		self.epgProgressTimer.stop()
+		if self._epg_request is not None:
+			self._epg_request.cancel()
 		cid = self.cid
 		time = syncTime() + secTd(self.shift)
 
-		def setEpgCurrent():
-			curr = self.db.channels[cid].epgCurrent(time)
-			if not curr:
-				return False
-
-			self.currentEpg = curr
-			self["currentName"].setText(curr.name)
-			self["currentTime"].setText(curr.begin.strftime("%H:%M"))
-			self["nextTime"].setText(curr.end.strftime("%H:%M"))
-			self.epgTimer.start(curr.timeLeftMilliseconds(time) + 1000)
-			self["currentDuration"].setText("+%d min" % (curr.timeLeft(time) / 60))
-			self["progressBar"].setValue(curr.percent(time, PROGRESS_SIZE))
-			self.epgProgressTimer.start(PROGRESS_TIMER)
-			if self.shift:
-				self["archiveDate"].setText(curr.begin.strftime("%d.%m"))
-				self["archiveDate"].show()
-			else:
-				self["archiveDate"].hide()
-			return True
+		has_current = self.setEpgCurrent(cid, time)
+		if not has_current:
+			self.clearEpgCurrent()
+		has_next = self.setEpgNext(cid, time)
+		if not has_next:
+			self.clearEpgNext()
 
-		if not setEpgCurrent():
-			try:
-				self.db.loadDayEpg(cid, time)
-			except APIException as e:
-				trace("ERROR load epg failed! cid =", cid, bool(self.shift), e)
-			if not setEpgCurrent():
-				self["currentName"].setText('')
-				self["currentTime"].setText('')
-				self["nextTime"].setText('')
-				self["currentDuration"].setText('')
-				self["progressBar"].setValue(0)
-
-		def setEpgNext():
-			e = self.db.channels[cid].epgNext(time)
-			if not e:
-				return False
-			self['nextName'].setText(e.name)
-			self['nextDuration'].setText("%d min" % (e.duration() / 60))
-			return True
-
-		if not setEpgNext():
-			try:
-				self.db.loadDayEpg(cid, time)
-			except APIException:
-				trace("load epg next failed!")
-			if not setEpgNext():
-				self["nextName"].setText('')
-				self["nextDuration"].setText('')
+		if not (has_current and has_next):
+			self._epg_request = self.db.loadDayEpgAsync(cid, time)
+			self._epg_request.addCallback(lambda _: cid).addCallback(self.epgLoaded).addErrback(
+				self.epgLoadFailed, cid).addErrback(fatalError)
 
 		self.serviceStarted()
 
+	@safecb
+	def epgLoaded(self, cid):
+		self._epg_request = None
+		if cid != self.cid:
+			return
+		time = syncTime() + secTd(self.shift)
+		self.setEpgCurrent(cid, time)
+		self.setEpgNext(cid, time)
+
+	def epgLoadFailed(self, err, cid):
+		if err.check(CancelledError):
+			return
+		err.trap(APIException)
+		self._epg_request = None
+		trace("ERROR load epg failed! cid =", cid, bool(self.shift), err.getErrorMessage())
+
+	def setEpgCurrent(self, cid, time):
+		curr = self.db.channels[cid].epgCurrent(time)
+		if not curr:
+			return False
+
+		self.currentEpg = curr
+		self["currentName"].setText(curr.name)
+		self["currentTime"].setText(curr.begin.strftime("%H:%M"))
+		self["nextTime"].setText(curr.end.strftime("%H:%M"))
+		self.epgTimer.start(curr.timeLeftMilliseconds(time) + 1000)
+		self["currentDuration"].setText("+%d min" % (curr.timeLeft(time) / 60))
+		self["progressBar"].setValue(curr.percent(time, PROGRESS_SIZE))
+		self.epgProgressTimer.start(PROGRESS_TIMER)
+		if self.shift:
+			self["archiveDate"].setText(curr.begin.strftime("%d.%m"))
+			self["archiveDate"].show()
+		else:
+			self["archiveDate"].hide()
+		return True
+
+	def clearEpgCurrent(self):
+		self["currentName"].setText('')
+		self["currentTime"].setText('')
+		self["nextTime"].setText('')
+		self["currentDuration"].setText('')
+		self["progressBar"].setValue(0)
+
+	def setEpgNext(self, cid, time):
+		e = self.db.channels[cid].epgNext(time)
+		if not e:
+			return False
+		self['nextName'].setText(e.name)
+		self['nextDuration'].setText("%d min" % (e.duration() / 60))
+		return True
+
+	def clearEpgNext(self):
+		self["nextName"].setText('')
+		self["nextDuration"].setText('')
+
 	def epgUpdateProgress(self):
 		time = syncTime() + secTd(self.shift)
 		self["currentDuration"].setText("+%d min" % (self.currentEpg.timeLeft(time) / 60))
@@ -496,7 +539,7 @@ class IPtvDreamStreamPlayer(
 			self.switchChannel(cid)
 
 	def keyNumberGlobal(self, number):
-		self.session.openWithCallback(self.numberEntered, NumberEnter, number)
+		self.session.openWithCallback(self.numberEntered, NumberEnter, number, self.db.findNumberPrefix)
 
 	def numberEntered(self, num=None):
 		trace("numberEntered", num)
@@ -511,12 +554,18 @@ class IPtvDreamStreamPlayer(
 
 
 class ChannelList(MenuList):
+	WIDTH_CACHE_SIZE = 4096
+	PAGE_MARGIN = 3  # rows refreshed around visible page
+	ROW_CACHE_SIZE = 100
+
 	def __init__(self):
 		MenuList.__init__(self, [], content=eListboxPythonMultiContent, enableWrapAround=True)
 		self.list = []
 		self.index = {}
 		self.col = {}
 		self.fontCalc = []
+		# Measured text widths, keyed by (font, text)
+		self.widthCache = LRUCache(self.WIDTH_CACHE_SIZE)
 
 		self.pixmapProgressBar = None
 		self.pixmapArchive = None
@@ -528,6 +577,10 @@ class ChannelList(MenuList):
 		self.showEpgProgress = config.usage.show_event_progress_in_servicelist.value
 		self.num = 0
 		self.highlight_cid = 0
+		# Built content of recently painted rows
+		self.rowCache = LRUCache(self.ROW_CACHE_SIZE)
+		self.buildItem = self.buildChannelEntry
+		self.l.setBuildFunc(self.buildRow)
 
 		for x in [
 				"colorEventProgressbar", "colorEventProgressbarSelected",
@@ -579,6 +632,9 @@ class ChannelList(MenuList):
 					attribs.append((attrib, value))
 
 		self.skinAttributes = attribs
+		# fonts could be changed
+		self.widthCache.clear()
+		self.rowCache.clear()
 		res = GUIComponent.applySkin(self, desktop, parent)
 
 		self.l.setItemHeight(self.listItemHeight)
@@ -595,25 +651,71 @@ class ChannelList(MenuList):
 			self.num = 1
 		else:
 			self.num = 0
+		self.rowCache.clear()
+
+	# Rows of the list are (item,), where item is (Channel, EPG) or Group.
+	# Content is built by buildRow only for rows that are painted,
+	# it calls build function only for tuple rows and passes their items as arguments.
 
+	@timeit
 	def setChannelsList(self, channels):
-		self.setList(map(self.buildChannelEntry, channels))
+		self.buildItem = self.buildChannelEntry
+		self.setList([(entry,) for entry in channels])
 		# Create map from channel id to its index in list
-		self.index = dict((entry[0][0].cid, i) for (i, entry) in enumerate(self.list))
+		self.index = dict((row[0][0].cid, i) for (i, row) in enumerate(self.list))
 		if self.num:
 			self.num = 1
 
-	def updateChannel(self, cid, channel):
-		try:
-			index = self.index[cid]
-		except KeyError:
-			return
-		self.list[index] = self.buildChannelEntry(channel)
-		self.l.invalidateEntry(index)
+	def buildRow(self, item):
+		"""Called by list content when row is painted"""
+		entry = self.rowCache.get(item)
+		if entry is None:
+			entry = self.rowCache[item] = self.buildItem(item)
+		return entry
 
+	def updatePrograms(self, programs):
+		"""
+		Set current programs of channels, only visible rows that changed are repainted
+		:type programs: Dict[int, EPG]
+		"""
+		start, stop = self.visibleRange()
+		changed = repainted = 0
+		for cid, epg in programs.iteritems():
+			try:
+				index = self.index[cid]
+			except KeyError:
+				continue
+			channel, old = self.list[index][0]
+			if old is not None and (old.begin, old.end, old.name) == (epg.begin, epg.end, epg.name):
+				continue
+			self.list[index] = ((channel, epg),)
+			changed += 1
+			if start <= index < stop:
+				self.l.invalidateEntry(index)
+				repainted += 1
+		trace("updatePrograms received", len(programs), "changed", changed, "repainted", repainted)
+
+	@timeit
 	def updateChannelsProgress(self):
-		if self.showEpgProgress:
-			self.setList([self.buildChannelEntry(item[0]) for item in self.list])
+		"""Repaint rows on screen, other rows are built again when they are scrolled into view"""
+		if self.showEpgProgress and self.index:
+			self.rowCache.clear()
+			start, stop = self.visibleRange()
+			for i in range(start, stop):
+				self.l.invalidateEntry(i)
+
+	def pageSize(self):
+		"""Number of rows on screen"""
+		page = self.instance.size().height() // self.listItemHeight if self.instance else 0
+		return max(page, 1)
+
+	def visibleRange(self):
+		"""
+		:return: range of indexes that could be visible with current selection
+		"""
+		page = self.pageSize() + self.PAGE_MARGIN
+		index = self.getSelectedIndex()
+		return max(0, index - page), min(len(self.list), index + page)
 
 	def moveEntryUp(self):
 		index = self.getSelectedIndex()
@@ -643,14 +745,20 @@ class ChannelList(MenuList):
 
 	def highlight(self, cid):
 		self.highlight_cid = cid
+		self.rowCache.clear()
 
 	def setGroupList(self, groups):
-		self.setList(map(self.buildGroupEntry, groups))
+		self.buildItem = self.buildGroupEntry
+		self.setList([(group,) for group in groups])
 		self.index = {}
 
 	def calculateWidth(self, text, font):
-		self.fontCalc[font].setText(text)
-		return int(round(self.fontCalc[font].calculateSize().width()*1.1))
+		key = (font, text)
+		width = self.widthCache.get(key)
+		if width is None:
+			self.fontCalc[font].setText(text)
+			width = self.widthCache[key] = int(round(self.fontCalc[font].calculateSize().width()*1.1))
+		return width
 
 	def buildGroupEntry(self, group):
 		return [
@@ -865,6 +973,12 @@ class IPtvDreamChannels(Screen):
 		self._worker = LiveEpgWorker(db)
 		self._worker.onUpdate.append(self.updatePrograms)
 		self.onClose.append(self._worker.destroy)
+		# Updates from worker are collected and applied together
+		self._pending_programs = {}  # type: Dict[int, EPG]
+		self._programsTimer = eTimer()
+		self._programsTimer.callback.append(self.applyPrograms)
+		self.onClose.append(self._programsTimer.stop)
+		self.onClose.append(lambda: self._programsTimer.callback.remove(self.applyPrograms))
 
 		def workerStandby(sleep):
 			if sleep:
@@ -988,13 +1102,19 @@ class IPtvDreamChannels(Screen):
 		# type: (List[Tuple[int, EPG]]) -> None
 		if self.mode == self.GROUPS:
 			return
+		scheduled = bool(self._pending_programs)
 		for (cid, epg) in data:
-			if epg:
-				try:
-					channel = self.db.channels[cid]
-				except KeyError:
-					continue
-				self.list.updateChannel(cid, (channel, epg))
+			if epg and cid in self.list.index:
+				self._pending_programs[cid] = epg
+		if self._pending_programs and not scheduled:
+			self._programsTimer.start(0, True)
+
+	@timeit
+	def applyPrograms(self):
+		"""Apply all updates received from worker since last main loop iteration"""
+		pending, self._pending_programs = self._pending_programs, {}
+		if self.mode != self.GROUPS:
+			self.list.updatePrograms(pending)
 
 	@timeit
 	def setChannels(self, channels):
@@ -1037,6 +1157,18 @@ class IPtvDreamChannels(Screen):
 		else:
 			self["key_yellow"].setText(_("Add"))
 
+	def prefetchPicons(self, channel):
+		"""Download picons of selected channel, current and next page of list"""
+		page = self.list.pageSize()
+		start = self.list.getSelectedIndex() // page * page
+		rows = self.list.list
+
+		def urls(begin, end):
+			return [self.db.getPiconUrl(row[0][0].cid) for row in rows[begin:end]]
+
+		piconCache.prefetch(
+			self.db.getPiconUrl(channel.cid), urls(start, start + page), urls(start + page, start + 2 * page))
+
 	def selectionChanged(self):
 		channel = self.getSelected()
 		trace("selection =", channel)
@@ -1046,6 +1178,7 @@ class IPtvDreamChannels(Screen):
 			self.hideEpgLabels()
 			self.hideEpgNextLabels()
 		else:
+			self.prefetchPicons(channel)
 			self["channelName"].setText(channel.name)
 			self["channelName"].show()
 			curr = self._worker.get(channel.cid)
@@ -1354,39 +1487,74 @@ class IPtvDreamEpg(Screen):
 		self.list.onSelectionChanged.append(self.updateLabels)
 		self.onShown.append(self.start)
 
+		self._request = None
+		self._wantCallbacks = None
+		self.onClose.append(self.cancelRequest)
+
+	def cancelRequest(self):
+		if self._request is not None:
+			self._request.cancel()
+
 	def start(self):
 		self.onShown.remove(self.start)
 		self.fillList()
 
-	def buildEpgEntry(self, entry):
-		if self.db.channels[self.cid].has_archive and entry.begin < syncTime():
+	@staticmethod
+	def buildEpgEntry(entry, has_archive, now):
+		if has_archive and entry.begin < now:
 			pixmap = rec_png
 		else:
 			pixmap = None
 		return entry, pixmap, entry.begin.strftime('%a'), entry.begin.strftime('%H:%M'), entry.name
 
-	def fillList(self):
+	def fillList(self, select_last=False):
 		if self.cid is None:
 			return
+		if self._request is not None:
+			self._request.cancel()
 
 		time = syncTime() + secTd(self.shift)
 		d = time + timedelta(self.day)
+		channel = self.db.channels[self.cid]
+		self.setTitle("EPG / %s / %s %s" % (channel.name, d.strftime("%d"), _(d.strftime("%b"))))
 
-		epg_list = []
-		try:
-			epg_list = self.db.getDayEpg(self.cid, datetime(d.year, d.month, d.day))
-		except APIException as e:
-			self.session.open(MessageBox, _("Can not load EPG:") + str(e), MessageBox.TYPE_ERROR, 5)
-
-		self.list.setList(map(self.buildEpgEntry, epg_list))
-		self.setTitle("EPG / %s / %s %s" % (self.db.channels[self.cid].name, d.strftime("%d"), _(d.strftime("%b"))))
+		date = datetime(d.year, d.month, d.day)
+		if channel.hasEpgDay(date):
+			self.epgReceived((channel.epgDay(date), time, select_last))
+			return
+		self._request = self.db.loadDayEpgAsync(self.cid, date)
+		self._request.addCallback(lambda _: (channel.epgDay(date), time, select_last)).addCallback(
+			self.epgReceived).addErrback(self.epgFailed).addErrback(fatalError)
+
+	@safecb
+	def epgReceived(self, data):
+		self._request = None
+		epg_view, time, select_last = data
+		has_archive = self.db.channels[self.cid].has_archive
+		now = syncTime()
+		# skin templates need list of tuples, so rows are built in a single pass over the view,
+		# current program is found on the way
+		entries = []
+		current = 0
+		for entry in epg_view:
+			if not current and self.day == 0 and entry.isAt(time):
+				current = len(entries)
+			entries.append(self.buildEpgEntry(entry, has_archive, now))
+		self.list.setList(entries)
 		self.list.setIndex(0)
 
-		if self.day == 0:
-			for i, program in enumerate(epg_list):
-				if program.isAt(time):
-					self.list.setIndex(i)
-					break
+		if select_last:
+			self.list.setIndex(self.list.count() - 1)
+		elif current:
+			self.list.setIndex(current)
+
+	@safecb
+	def epgFailed(self, err):
+		if err.trap(APIException, CancelledError) == CancelledError:
+			return
+		self._request = None
+		self.list.setList([])
+		self.session.open(MessageBox, _("Can not load EPG:") + str(err.getErrorMessage()), MessageBox.TYPE_ERROR, 5)
 
 	def updateLabels(self):
 		entry = self.list.getCurrent()
@@ -1429,8 +1597,7 @@ class IPtvDreamEpg(Screen):
 	def up(self):
 		idx = self.list.getIndex()
 		if idx == 0:
-			self.prevDay()
-			self.list.setIndex(self.list.count() - 1)
+			self.prevDay(select_last=True)
 		else:
 			self.list.selectPrevious()
 
@@ -1444,8 +1611,7 @@ class IPtvDreamEpg(Screen):
 	def pageUp(self):
 		idx = self.list.getIndex()
 		if idx == 0:
-			self.prevDay()
-			self.list.setIndex(self.list.count() - 1)
+			self.prevDay(select_last=True)
 		else:
 			self.list.pageUp()
 
@@ -1460,9 +1626,9 @@ class IPtvDreamEpg(Screen):
 		self.day += 1
 		self.fillList()
 
-	def prevDay(self):
+	def prevDay(self, select_last=False):
 		self.day -= 1
-		self.fillList()
+		self.fillList(select_last)
 
 
 class IPtvDreamEpgInfo(Screen):
@@ -44,6 +44,7 @@ from .utils import trace, APIException, APILoginFailed
 from .loc import translate as _
 from .settings import IPtvDreamConfig, IPtvDreamWebConfig, SettingsRepository, WebConfig
 from .main import IPtvDreamStreamPlayer, IPtvDreamChannels
+from .lib.tv import cache as piconCache
 
 PLAYERS = [('1', "enigma2 ts (1)"), ('4097', "gstreamer (4097)"), ('5002', "exteplayer3 (5002)")]
 KEYMAPS = [('enigma', 'enigma'), ('neutrino', 'neutrino')]
@@ -144,6 +145,7 @@ class PluginStarter(Screen):
 	def run(self):
 		try:
 			self.db.setChannelsList()
+			self.db.channelsChanged()
 		except APIException as e:
 			trace(e)
 			self.session.openWithCallback(lambda ret: self.exit(), MessageBox, str(e), MessageBox.TYPE_ERROR)
@@ -385,6 +387,14 @@ class Manager(object):
 		pluginConfig.start_mode.value = mode
 		pluginConfig.start_mode.save()
 
+	def getPiconCacheSizeChoices(self):
+		return [("%d MB" % n, n) for n in (1, 2, 4, 8, 16)]
+
+	def setPiconCacheSize(self, size):
+		pluginConfig.picon_cache_size.value = size
+		pluginConfig.picon_cache_size.save()
+		piconCache.setMaxSize(size * 1024 * 1024)
+
 	def getList(self):
 		return sorted(
 			({'name': v.NAME, 'title': v.TITLE} for v in self.apiDict.values()),
@@ -479,6 +489,7 @@ class IPtvDreamManager(Screen):
 			(_("Choose skin"), self.selectSkin),
 			(_("Additional playlists number"), self.selectPlaylistNumber),
 			(_("Start mode"), self.selectStartMode),
+			(_("Picon cache size"), self.selectPiconCacheSize),
 		]
 		self.session.openWithCallback(cb, ChoiceBox, _("Context menu"), actions)
 
@@ -539,6 +550,14 @@ class IPtvDreamManager(Screen):
 
 		self.session.openWithCallback(cb, ChoiceBox, title=_("Select start mode"), list=manager.getStartModeChoices())
 
+	def selectPiconCacheSize(self):
+		def cb(selected):
+			if selected is not None:
+				manager.setPiconCacheSize(selected[1])
+
+		self.session.openWithCallback(
+			cb, ChoiceBox, title=_("Select picon cache size"), list=manager.getPiconCacheSizeChoices())
+
 	def restart(self, ret):
 		if ret:
 			from Screens.Standby import TryQuitMainloop
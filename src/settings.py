@@ -11,15 +11,11 @@
 from __future__ import print_function
 
 # system imports
-from io import StringIO, BytesIO
 from collections import OrderedDict
 import urllib
 from json import loads as json_loads, dumps as json_dumps
-from twisted.web.client import downloadPage, FileBodyProducer, Agent, Headers
-from twisted.web._newclient import ResponseDone
+from twisted.web.client import downloadPage
 from twisted.web.error import Error as WebError
-from twisted.internet import reactor
-from twisted.internet.protocol import Protocol
 from twisted.internet.defer import Deferred, CancelledError
 
 # enigma2 imports
@@ -35,13 +31,13 @@ from Components.Sources.Boolean import Boolean
 from Tools.LoadPixmap import LoadPixmap
 
 # plugin imports
-from .dist import NAME, VERSION
 from .utils import trace, ConfInteger, ConfSelection, ConfString, ConfBool, APIException
 from .virtualkb import VirtualKeyBoard
 from .common import ConfigNumberText
 from .api.abstract_api import AbstractStream
 from .loc import translate as _
 from .common import safecb, fatalError
+from .webclient import getRequest, postRequest, HttpError, AgentException
 
 try:
 	from typing import List, Tuple, Dict  # pylint: disable=unused-import
@@ -181,91 +177,6 @@ def convertConfEntry(conf):
 		raise Exception("Unknown type in settings: " + str(type(conf)))
 
 
-def getRequest(url):
-	agent = Agent(reactor)
-	d = agent.request(b'GET', url, headers=defaultHeaders())
-	return d.addErrback(agentError).addCallback(readResponseBody)
-
-
-def postRequest(url, body):
-	agent = Agent(reactor)
-	headers = defaultHeaders()
-	headers.addRawHeader('Content-Type', 'application/json')
-	d = agent.request(b'POST', url, headers=headers, bodyProducer=FileBodyProducer(BytesIO(body)))
-	return d.addErrback(agentError).addCallback(readResponseBody)
-
-
-def defaultHeaders():
-	headers = Headers()
-	headers.addRawHeader('User-Agent', 'IPtvDream-%s/%s' % (NAME, VERSION))
-	return headers
-
-
-def readResponseBody(response):
-	trace("Response", response.code)
-	# TODO: support redirects, this actually can be done with RedirectAgent
-	if 200 <= response.code < 300:
-		return readBody(response)
-	else:
-		raise HttpError(response.code, response.phrase)
-
-
-def readBody(response):
-	"""
-	Copy-paste from twisted > 14.0.0
-	Get full body from IResponse
-	"""
-
-	def cancel(deferred):
-		abort = getattr(protocol.transport, "abortConnection", None)
-		if abort is not None:
-			abort()
-
-	d = Deferred(cancel)
-	protocol = _ReadBodyProtocol(response.code, response.phrase, d)
-	response.deliverBody(protocol)
-	return d
-
-
-class _ReadBodyProtocol(Protocol):
-	"""
-	Copy-paste from twisted > 14.0.0
-	Helper protocol for deliverBody
-	"""
-
-	def __init__(self, status, message, deferred):
-		self.deferred = deferred
-		self.status = status
-		self.message = message
-		self.dataBuffer = []
-
-	def dataReceived(self, data):
-		self.dataBuffer.append(data)
-
-	def connectionLost(self, reason):
-		"""
-		Deliver the accumulated response bytes to the waiting L{Deferred}, if
-		the response body has been completely received without error.
-		"""
-		if reason.check(ResponseDone):
-			self.deferred.callback(b"".join(self.dataBuffer))
-		else:
-			self.deferred.errback(reason)
-
-
-class HttpError(WebError):
-	"""Bad HTTP response code"""
-
-
-class AgentException(Exception):
-	"""Twisted Agent exception"""
-
-
-def agentError(err):
-	"""Wrap twisted failure in AgentException"""
-	raise AgentException(err.getErrorMessage())
-
-
 class WebConfig(object):
 	site = 'http://technic.cf/web/'
 
@@ -12,7 +12,10 @@
 from __future__ import print_function
 
 from functools import wraps
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from array import array
+from bisect import bisect, bisect_left
 import time
 import re
 try:
@@ -20,6 +23,10 @@ try:
 except ImportError:
 	# ignore it, because it is not used
 	pass
+try:
+	from typing import Dict, List, Optional  # pylint: disable=unused-import
+except ImportError:
+	pass
 
 
 def trace(*args):
@@ -37,6 +44,44 @@ def timeit(f):
 	return wrapper
 
 
+class LRUCache(object):
+	"""Dictionary that keeps at most size recently used items"""
+
+	def __init__(self, size):
+		self.size = size
+		self._data = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key, default=None):
+		try:
+			value = self._data.pop(key)
+		except KeyError:
+			self.misses += 1
+			return default
+		self._data[key] = value
+		self.hits += 1
+		return value
+
+	def __setitem__(self, key, value):
+		self._data.pop(key, None)
+		self._data[key] = value
+		if len(self._data) > self.size:
+			self._data.popitem(last=False)
+
+	def __contains__(self, key):
+		return key in self._data
+
+	def __len__(self):
+		return len(self._data)
+
+	def clear(self):
+		self._data.clear()
+
+	def __str__(self):
+		return "LRUCache(size=%d/%d, hits=%d, misses=%d)" % (len(self._data), self.size, self.hits, self.misses)
+
+
 def getHwAddr(ifname):
 	try:
 		import fcntl
@@ -254,11 +299,53 @@ class ConfBool(ConfEntry):
 		}
 
 
+class EPGView(object):
+	"""
+	Read-only sequence of programs stored in rows [start, stop) of EPG database.
+	EPG objects are fetched only when accessed, nothing is copied on creation.
+	The view is a snapshot: database copies its rows before changing them in place while a view exists,
+	so get a new view to see epg loaded later.
+	"""
+	__slots__ = ('_get', '_start', '_stop')
+
+	def __init__(self, get, start, stop):
+		"""
+		:param get: callable(i) returning EPG for row i
+		:param int start:
+		:param int stop:
+		"""
+		self._get = get
+		self._start = start
+		self._stop = stop
+
+	def __len__(self):
+		return self._stop - self._start
+
+	def __getitem__(self, i):
+		if i < 0:
+			i += len(self)
+		if not 0 <= i < len(self):
+			raise IndexError("EPGView index out of range")
+		return self._get(self._start + i)
+
+	def __iter__(self):
+		for i in xrange(self._start, self._stop):
+			yield self._get(i)
+
+	def __repr__(self):
+		return repr(list(self))
+
+
+EPGView.EMPTY = EPGView(None, 0, 0)
+
+
 class EPGDB(object):
 	def __init__(self):
 		self.l = []
 		self.days_start = {}
 		self.last = 0
+		# rows are referenced by EPGView
+		self._shared = False
 
 	# bisect copies from python library
 
@@ -344,11 +431,16 @@ class EPGDB(object):
 		try:
 			t1 = self.days_start[toDate(date)]
 		except KeyError:
-			return []
+			return EPGView.EMPTY
 		t2 = t1 + timedelta(1)
 		i1 = self.bisect_left(toTimestamp(t1))
 		i2 = self.bisect_left(toTimestamp(t2), lo=i1)
-		return [x[1] for x in self.l[i1:i2]]  # FIXME: extra copy
+		rows = self.l
+		self._shared = True
+		return EPGView(lambda i: rows[i][1], i1, i2)
+
+	def hasEpgDay(self, date):
+		return toDate(date) in self.days_start
 
 	def addEpg(self, epg, hint=-1):
 		t = toTimestamp(epg.begin)
@@ -356,6 +448,9 @@ class EPGDB(object):
 			i = hint
 		else:
 			i = self.bisect(t)
+		if self._shared:
+			self.l = list(self.l)
+			self._shared = False
 		if i > 0:
 			prev = self.l[i-1][1]
 			if prev.begin == epg.begin or prev.end > epg.begin:
@@ -368,9 +463,211 @@ class EPGDB(object):
 		return i+1
 
 	def addEpgSorted(self, epg_list):
-		hint = 0
-		for e in epg_list:
-			hint = self.addEpg(e, hint)
+		"""
+		Merge list sorted by begin time into the database in linear time.
+		Conflicts are resolved the same way as in addEpg called for each item.
+		"""
+		old = self.l
+		result = []
+		i = 0
+		for epg in epg_list:
+			t = toTimestamp(epg.begin)
+			j = self.bisect(t, lo=i)
+			result.extend(old[i:j])
+			i = j
+			if result:
+				prev = result[-1][1]
+				if prev.begin == epg.begin or prev.end > epg.begin:
+					trace("EPG conflict!")
+					result[-1] = (t, epg)
+					continue
+			result.append((t, epg))
+		result.extend(old[i:])
+		self.l = result
+		self._shared = False
+		self.last = 0
+
+	def addEpgDay(self, date, epglist):
+		self.days_start[toDate(date)] = date
+		self.addEpgSorted(epglist)
+
+
+class StringTable(object):
+	"""
+	Interned strings referenced by index.
+	EPG titles and descriptions repeat a lot between days and channels, so each distinct string is stored once.
+	"""
+
+	def __init__(self):
+		self._index = {}  # type: Dict[str, int]
+		self._strings = []  # type: List[str]
+
+	def add(self, s):
+		try:
+			return self._index[s]
+		except KeyError:
+			i = self._index[s] = len(self._strings)
+			self._strings.append(s)
+			return i
+
+	def __getitem__(self, i):
+		return self._strings[i]
+
+	def __len__(self):
+		return len(self._strings)
+
+
+class ArrayEPGDB(object):
+	"""
+	Same interface as EPGDB, but programs are stored in columns of machine integers:
+	begin and end timestamps, and title and description indices in the string table.
+	EPG objects are created only when they are returned to the caller.
+	AbstractStream gives all channels of a channel list one string table, it is replaced on reload,
+	so strings are freed together with the channels. Database used alone creates its own table.
+	"""
+
+	def __init__(self):
+		self.strings = None  # type: Optional[StringTable]
+		self._begin = array('l')
+		self._end = array('l')
+		self._name = array('l')
+		self._description = array('l')
+		self.days_start = {}
+		self.last = 0
+		# columns are referenced by EPGView
+		self._shared = False
+
+	def __len__(self):
+		return len(self._begin)
+
+	def _epg(self, i):
+		return EPG(self._begin[i], self._end[i], self.strings[self._name[i]], self.strings[self._description[i]])
+
+	def findEpg(self, time):
+		if time is None:
+			t = toTimestamp(syncTime())
+			update = True
+			i = self.atTime(t, self.last, update)
+			if i is not None:
+				return i
+			i = self.atTime(t, self.last+1, update)
+			if i is not None:
+				return i
+		else:
+			t = toTimestamp(time)
+			update = False
+		return self.atTime(t, bisect(self._begin, t), update)
+
+	def atTime(self, t, i, update):
+		if i == 0 or i-1 >= len(self._begin):
+			return None
+		if self._begin[i-1] <= t < self._end[i-1]:
+			if update:
+				self.last = i
+			return i-1
+		else:
+			return None
+
+	def checkHint(self, i, t):
+		return 0 < i <= len(self._begin) and (i == len(self._begin) or t < self._begin[i]) and self._begin[i-1] <= t
+
+	### Public methods
+
+	def epgCurrent(self, time=None):
+		i = self.findEpg(time)
+		if i is not None:
+			return self._epg(i)
+		else:
+			return None
+
+	def epgNext(self, time=None):
+		i = self.findEpg(time)
+		if (i is not None) and (i+1 < len(self._begin)) and self._end[i] == self._begin[i+1]:
+			return self._epg(i+1)
+		else:
+			return None
+
+	def epgDay(self, date):
+		# for apis that can't get correct range in getDayEpg
+		try:
+			t1 = self.days_start[toDate(date)]
+		except KeyError:
+			return EPGView.EMPTY
+		t2 = t1 + timedelta(1)
+		i1 = bisect_left(self._begin, toTimestamp(t1))
+		i2 = bisect_left(self._begin, toTimestamp(t2), i1)
+		begin, end, name, description, strings = \
+			self._begin, self._end, self._name, self._description, self.strings
+		self._shared = True
+		return EPGView(lambda i: EPG(begin[i], end[i], strings[name[i]], strings[description[i]]), i1, i2)
+
+	def hasEpgDay(self, date):
+		return toDate(date) in self.days_start
+
+	def addEpg(self, epg, hint=-1):
+		t = toTimestamp(epg.begin)
+		if self.checkHint(hint, t):
+			i = hint
+		else:
+			i = bisect(self._begin, t)
+		if self.strings is None:
+			self.strings = StringTable()
+		row = (t, toTimestamp(epg.end), self.strings.add(epg.name), self.strings.add(epg.description))
+		if self._shared:
+			self._begin, self._end, self._name, self._description = (
+				array('l', column) for column in (self._begin, self._end, self._name, self._description))
+			self._shared = False
+		columns = (self._begin, self._end, self._name, self._description)
+		if i > 0:
+			if self._begin[i-1] == t or self._end[i-1] > t:
+				trace("EPG conflict!")
+				for column, value in zip(columns, row):
+					column[i-1] = value
+				return i
+		for column, value in zip(columns, row):
+			column.insert(i, value)
+		if self.last >= i:
+			self.last += 1
+		return i+1
+
+	def addEpgSorted(self, epg_list):
+		"""
+		Merge list sorted by begin time into the database in linear time.
+		Conflicts are resolved the same way as in addEpg called for each item.
+		"""
+		old_begin, old_end, old_name, old_description = self._begin, self._end, self._name, self._description
+		begin, end, name, description = array('l'), array('l'), array('l'), array('l')
+		if self.strings is None:
+			self.strings = StringTable()
+		add = self.strings.add
+		i = 0
+		for epg in epg_list:
+			t = toTimestamp(epg.begin)
+			j = bisect(old_begin, t, i)
+			if j > i:
+				begin.extend(old_begin[i:j])
+				end.extend(old_end[i:j])
+				name.extend(old_name[i:j])
+				description.extend(old_description[i:j])
+				i = j
+			if begin and (begin[-1] == t or end[-1] > t):
+				trace("EPG conflict!")
+				begin[-1] = t
+				end[-1] = toTimestamp(epg.end)
+				name[-1] = add(epg.name)
+				description[-1] = add(epg.description)
+			else:
+				begin.append(t)
+				end.append(toTimestamp(epg.end))
+				name.append(add(epg.name))
+				description.append(add(epg.description))
+		begin.extend(old_begin[i:])
+		end.extend(old_end[i:])
+		name.extend(old_name[i:])
+		description.extend(old_description[i:])
+		self._begin, self._end, self._name, self._description = begin, end, name, description
+		self._shared = False
+		self.last = 0
 
 	def addEpgDay(self, date, epglist):
 		self.days_start[toDate(date)] = date
@@ -403,7 +700,7 @@ class Group(object):
 		assert all(isinstance(c, Channel) for c in self.channels)
 
 
-class Channel(EPGDB):
+class Channel(ArrayEPGDB):
 	def __init__(self, cid, name, number, has_archive=False, is_protected=False):
 		"""
 		:param int cid: channel id
@@ -412,7 +709,7 @@ class Channel(EPGDB):
 		:param bool has_archive:
 		:param bool is_protected:
 		"""
-		EPGDB.__init__(self)
+		ArrayEPGDB.__init__(self)
 		self.cid = cid
 		self.name = name
 		self.number = number
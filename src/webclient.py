@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# Enigma2 IPtvDream player framework
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+"""Helpers for asynchronous http requests with twisted Agent"""
+
+from __future__ import print_function
+
+# system imports
+from io import BytesIO
+from twisted.web.client import FileBodyProducer, Agent, Headers, HTTPConnectionPool, \
+	ContentDecoderAgent, GzipDecoder, CookieAgent, RedirectAgent
+from twisted.web._newclient import ResponseDone
+from twisted.web.error import Error as WebError
+from twisted.internet import reactor
+from twisted.internet.protocol import Protocol
+from twisted.internet.defer import Deferred, CancelledError
+
+# plugin imports
+from .dist import NAME, VERSION
+from .utils import trace
+
+
+def getRequest(url):
+	agent = Agent(reactor)
+	d = agent.request(b'GET', url, headers=defaultHeaders())
+	return d.addErrback(agentError).addCallback(readResponseBody)
+
+
+def postRequest(url, body):
+	agent = Agent(reactor)
+	headers = defaultHeaders()
+	headers.addRawHeader('Content-Type', 'application/json')
+	d = agent.request(b'POST', url, headers=headers, bodyProducer=FileBodyProducer(BytesIO(body)))
+	return d.addErrback(agentError).addCallback(readResponseBody)
+
+
+def defaultHeaders():
+	headers = Headers()
+	headers.addRawHeader('User-Agent', 'IPtvDream-%s/%s' % (NAME, VERSION))
+	return headers
+
+
+def readResponseBody(response):
+	trace("Response", response.code)
+	# TODO: support redirects, this actually can be done with RedirectAgent
+	if 200 <= response.code < 300:
+		return readBody(response)
+	else:
+		raise HttpError(response.code, response.phrase)
+
+
+def readBody(response):
+	"""
+	Copy-paste from twisted > 14.0.0
+	Get full body from IResponse
+	"""
+
+	def cancel(deferred):
+		abort = getattr(protocol.transport, "abortConnection", None)
+		if abort is not None:
+			abort()
+
+	d = Deferred(cancel)
+	protocol = _ReadBodyProtocol(response.code, response.phrase, d)
+	response.deliverBody(protocol)
+	return d
+
+
+class _ReadBodyProtocol(Protocol):
+	"""
+	Copy-paste from twisted > 14.0.0
+	Helper protocol for deliverBody
+	"""
+
+	def __init__(self, status, message, deferred):
+		self.deferred = deferred
+		self.status = status
+		self.message = message
+		self.dataBuffer = []
+
+	def dataReceived(self, data):
+		self.dataBuffer.append(data)
+
+	def connectionLost(self, reason):
+		"""
+		Deliver the accumulated response bytes to the waiting L{Deferred}, if
+		the response body has been completely received without error.
+		"""
+		if reason.check(ResponseDone):
+			self.deferred.callback(b"".join(self.dataBuffer))
+		else:
+			self.deferred.errback(reason)
+
+
+class HttpError(WebError):
+	"""Bad HTTP response code"""
+
+
+class AgentException(Exception):
+	"""Twisted Agent exception"""
+
+
+class AgentTimeout(AgentException):
+	"""Request was not completed in time"""
+
+
+def agentError(err):
+	"""Wrap twisted failure in AgentException"""
+	raise AgentException(err.getErrorMessage())
+
+
+def makeAgent(cookiejar=None, timeout=10):
+	"""
+	Create agent with the same features as urllib2 opener used by api:
+	persistent connections, redirects, gzip encoding and cookies.
+	:type cookiejar: cookielib.CookieJar|None
+	:param int timeout: connect timeout in seconds
+	"""
+	pool = HTTPConnectionPool(reactor, persistent=True)
+	agent = ContentDecoderAgent(Agent(reactor, connectTimeout=timeout, pool=pool), [(b'gzip', GzipDecoder)])
+	if cookiejar is not None:
+		agent = CookieAgent(agent, cookiejar)
+	return RedirectAgent(agent)
+
+
+def timeoutDeferred(d, seconds):
+	"""
+	Cancel deferred if it has not fired within given number of seconds
+	The deferred fails with AgentTimeout in this case.
+	"""
+	state = {'timeout': False}
+
+	def expire():
+		state['timeout'] = True
+		d.cancel()
+
+	call = reactor.callLater(seconds, expire)
+
+	def done(result):
+		if call.active():
+			call.cancel()
+		return result
+
+	def error(err):
+		if state['timeout'] and err.check(CancelledError):
+			raise AgentTimeout("Request timed out after %d seconds" % seconds)
+		return err
+
+	return d.addBoth(done).addErrback(error)
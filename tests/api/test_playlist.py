@@ -26,7 +26,7 @@ class Test(ott_provider.TestOTTProvider):
 		def parse():
 			m3u = prov._locatePlaylist()
 			with open(m3u) as f:
-				prov._parsePlaylist(f.readlines())
+				prov._parsePlaylist(f)
 
 		import timeit
 		from math import sqrt
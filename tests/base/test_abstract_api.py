@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#  enigma2 iptv player
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+from __future__ import print_function
+
+from twisted.trial.unittest import TestCase
+
+from src.api.abstract_api import AbstractStream
+from src.utils import Channel, Group
+
+
+def makeStream(n, groups=10):
+	db = AbstractStream("", "")
+	for gid in range(groups):
+		db.groups[gid] = Group(gid, "Group %d" % gid, [])
+	for i in range(n):
+		# names are in reverse order of numbers
+		c = db.channels[1000 + i] = Channel(1000 + i, "Channel %06d" % (n - i), i + 1)
+		db.groups[i % groups].channels.append(c)
+	db.channelsChanged()
+	return db
+
+
+class TestSortedChannels(TestCase):
+	def test_sorted(self):
+		db = makeStream(100)
+		self.assertEqual([c.number for c in db.selectAll(AbstractStream.Sort_N)], range(1, 101))
+		self.assertEqual([c.number for c in db.selectAll(AbstractStream.Sort_AZ)], range(100, 0, -1))
+		self.assertEqual([c.number for c in db.selectChannels(3)], range(4, 101, 10))
+		self.assertEqual([c.number for c in db.selectChannels(3, AbstractStream.Sort_AZ)], range(94, 0, -10))
+		self.assertIs(db.selectAll(), db.selectAll())
+
+	def test_changed(self):
+		db = makeStream(10)
+		self.assertEqual(len(db.selectAll()), 10)
+		db.channels[1] = Channel(1, "New", 11)
+		self.assertEqual(len(db.selectAll()), 10)
+		db.channelsChanged()
+		self.assertEqual(len(db.selectAll()), 11)
+
+	def bench_selectAll(self):
+		db = makeStream(5000)
+
+		def sort():
+			sorted(db.channels.values(), key=lambda c: getattr(c, 'name'))
+
+		def cached():
+			db.selectAll(AbstractStream.Sort_AZ)
+
+		import timeit
+		for f in sort, cached:
+			t = min(timeit.repeat(f, number=100, repeat=3)) / 100
+			print("%s: %f s for 5000 channels" % (f.__name__, t))
+
+
+class TestEpgStrings(TestCase):
+	def test_shared(self):
+		"""Channels of a list share one string table, reloaded list gets a new one"""
+		db = makeStream(10)
+		tables = set(id(c.strings) for c in db.channels.values())
+		self.assertEqual(len(tables), 1)
+		old = db.channels[1000].strings
+		db.channels = dict((c.cid, Channel(c.cid, c.name, c.number)) for c in db.channels.values())
+		db.channelsChanged()
+		self.assertEqual(len(set(id(c.strings) for c in db.channels.values())), 1)
+		self.assertIsNot(db.channels[1000].strings, old)
+
+
+class TestNumberIndex(TestCase):
+	def test_findNumber(self):
+		db = makeStream(150)
+		self.assertEqual(db.findNumber(1), 1000)
+		self.assertEqual(db.findNumber(150), 1149)
+		self.assertEqual(db.findNumber(151), None)
+		db.channels[1] = Channel(1, "New", 151)
+		db.channelsChanged()
+		self.assertEqual(db.findNumber(151), 1)
+
+	def test_prefix(self):
+		db = makeStream(150)
+		self.assertEqual([c.number for c in db.findNumberPrefix(1)], [1, 10, 11, 12, 13])
+		self.assertEqual([c.number for c in db.findNumberPrefix(1, limit=20)], [1] + range(10, 20) + range(100, 109))
+		self.assertEqual([c.number for c in db.findNumberPrefix(14)], [14, 140, 141, 142, 143])
+		self.assertEqual([c.number for c in db.findNumberPrefix(15)], [15, 150])
+		self.assertEqual(db.findNumberPrefix(16)[1:], [])
+		self.assertEqual(db.findNumberPrefix(151), [])
+		self.assertEqual(db.findNumberPrefix(0), [])
+
+
+if __name__ == "__main__":
+	from unittest import main
+	main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#  enigma2 iptv player
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+from twisted.trial.unittest import TestCase
+
+from src.api import channelids
+from src.api.channelids import ChannelIds, hashId
+
+
+class TestChannelIds(TestCase):
+	def setUp(self):
+		self.path = tempfile.mkdtemp()
+		self.file_name = os.path.join(self.path, 'test.ids.json')
+
+	def tearDown(self):
+		shutil.rmtree(self.path)
+
+	def test_stable(self):
+		ids = ChannelIds(self.file_name)
+		cid = ids.get("http://example.com/1.m3u8")
+		# known value, must not change between versions and platforms
+		self.assertEqual(cid, 0x6ce87b45bc7dc0d8)
+		self.assertEqual(ids.get(u"http://example.com/1.m3u8"), cid)
+		self.assertEqual(ChannelIds(self.file_name).get("http://example.com/1.m3u8"), cid)
+		self.assertNotEqual(ids.get("http://example.com/2.m3u8"), cid)
+		self.assertFalse(os.path.exists(self.file_name))
+
+	def test_collision(self):
+		self.patch(channelids, 'hashId', lambda key: 42)
+		ids = ChannelIds(self.file_name)
+		self.assertEqual(ids.get("a"), 42)
+		self.assertEqual(ids.get("b"), 43)
+		self.assertEqual(ids.stats['collisions'], 1)
+		# colliding key keeps its id when it comes first after restart
+		ids = ChannelIds(self.file_name)
+		self.assertEqual(ids.get("b"), 43)
+		self.assertEqual(ids.get("a"), 42)
+		self.assertEqual(ids.get("c"), 44)
+
+	def test_find(self):
+		ids = ChannelIds(self.file_name)
+		self.assertEqual(ids.find("a"), None)
+		cid = ids.get(u"a")
+		self.assertEqual(ids.find("a"), cid)
+		self.assertEqual(ids.find(u"b"), None)
+		self.assertEqual(ids.get("b"), ids.find("b"))
+
+	def test_migrate(self):
+		"""Favourites saved with hash() ids are converted once"""
+		from src.api.abstract_api import OfflineFavourites
+		from src.utils import Channel
+		db = OfflineFavourites("", "")
+		db._favorites_file = os.path.join(self.path, 'favourites.txt')
+		db.channel_ids = ChannelIds(self.file_name)
+		urls = ["http://example.com/%d.m3u8" % i for i in range(3)]
+		for url in urls:
+			cid = db.channel_ids.get(url)
+			db.channels[cid] = Channel(cid, url, 1)
+		db.uploadFavourites([hash(urls[2]), db.channel_ids.find(urls[0]), 12345])
+		db.channelsChanged()
+		self.assertEqual(db.getFavourites(), [db.channel_ids.find(urls[2]), db.channel_ids.find(urls[0]), 12345])
+		self.assertEqual([c.name for c in db.selectFavourites()], [urls[2], urls[0]])
+		# mark is stored, favourites are not read again after restart
+		db.channel_ids = ChannelIds(self.file_name)
+		db.channel_ids.get(urls[0])
+		self.assertFalse(db.channel_ids.needsMigration())
+		self.patch(db, 'getFavourites', lambda: self.fail("favourites read"))
+		db.channelsChanged()
+
+	def test_oldFormat(self):
+		with open(self.file_name, 'w') as f:
+			f.write('{"b": 43}')
+		ids = ChannelIds(self.file_name)
+		self.assertEqual(ids.get("b"), 43)
+		self.assertTrue(ids.needsMigration())
+		ids.setMigrated()
+		ids = ChannelIds(self.file_name)
+		self.assertEqual(ids.get("b"), 43)
+		self.assertFalse(ids.needsMigration())
+
+	def test_hashId(self):
+		self.assertTrue(0 < hashId("") <= channelids.ID_MASK)
+
+
+if __name__ == "__main__":
+	from unittest import main
+	main()
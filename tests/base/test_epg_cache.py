@@ -13,9 +13,11 @@ from __future__ import print_function
 from datetime import datetime, timedelta
 from twisted.trial.unittest import TestCase
 from twisted.internet import task, reactor
-from twisted.internet.defer import DeferredList
+from twisted.internet.defer import DeferredList, succeed
 
 from src.cache import LiveEpgWorker
+from src.utils import EPG, Channel, toTimestamp
+from src.api.epgstore import EpgStore
 from ..mock_api import MockApi as OTTProvider
 
 
@@ -28,6 +30,8 @@ class TestLiveEpgWorker(TestCase):
 		self.db.start()
 		self.db.setChannelsList()
 		self._worker = LiveEpgWorker(self.db)
+		# wait for initial epg request
+		return self._worker.update()
 
 	def test_update(self):
 		ch_ids = self.db.channels.keys()
@@ -53,6 +57,45 @@ class TestLiveEpgWorker(TestCase):
 		]).addCallback(lambda _: self._worker.stop())
 
 
+class FakeStream(object):
+	"""Offline provider, where programs of first channels are already ended"""
+
+	def __init__(self, channels, expired):
+		self.channels = dict((cid, Channel(cid, str(cid), cid)) for cid in range(channels))
+		self.epg_store = EpgStore('/dev/null/epg.db')
+		self.expired = expired
+		self.requests = []
+
+	def getChannelsEpgAsync(self, cids):
+		self.requests.append(sorted(cids))
+		t = toTimestamp(datetime.now())
+		data = []
+		for cid in cids:
+			end = t - 1 if cid in self.expired else t + 3600
+			data.append((cid, [EPG(end - 3600, end, "current"), EPG(end, end + 3600, "next")]))
+		self.expired = set()
+		return succeed(data)
+
+
+class TestLiveEpgQueue(TestCase):
+	def test_expired(self):
+		db = FakeStream(100, set([3, 5, 7]))
+		worker = LiveEpgWorker(db)
+		self.addCleanup(worker.destroy)
+		self.assertEqual(len(db.requests), 1)
+		self.assertEqual(len(db.requests[0]), 100)
+
+		worker.update()
+		self.assertEqual(db.requests[1], [3, 5, 7])
+		self.assertEqual(worker.stats['last_channels'], 3)
+		self.assertTrue(worker.get(5).end > datetime.now())
+
+		worker.update()
+		self.assertEqual(len(db.requests), 2)
+		self.assertEqual(worker.stats['refreshes'], 2)
+		self.assertEqual(worker.stats['channels'], 103)
+
+
 if __name__ == "__main__":
 	from unittest import main
 	main()
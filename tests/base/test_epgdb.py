@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+#  enigma2 iptv player
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+from __future__ import print_function
+
+import sys
+import random
+from datetime import datetime, timedelta
+from twisted.trial.unittest import TestCase
+
+from src.utils import EPG, EPGDB, ArrayEPGDB, StringTable, toTimestamp, toDate
+
+
+def makeDay(date, titles=50):
+	"""Generate programs for one day with titles repeated from small set"""
+	t = toTimestamp(date)
+	end = t + 24 * 3600
+	programs = []
+	while t < end:
+		d = min(random.choice((15, 30, 45, 60, 90)) * 60, end - t)
+		n = random.randrange(titles)
+		programs.append(EPG(t, t + d, "Program %d" % n, "Description of program %d. " % n * 5))
+		t += d
+	return programs
+
+
+def deepSize(obj, seen=None):
+	"""Approximate memory used by object and everything it references"""
+	if seen is None:
+		seen = set()
+	if id(obj) in seen:
+		return 0
+	seen.add(id(obj))
+	size = sys.getsizeof(obj)
+	if isinstance(obj, dict):
+		size += sum(deepSize(k, seen) + deepSize(v, seen) for k, v in obj.items())
+	elif isinstance(obj, (list, tuple)):
+		size += sum(deepSize(x, seen) for x in obj)
+	elif hasattr(obj, '__slots__'):
+		size += sum(deepSize(getattr(obj, k), seen) for k in obj.__slots__ if hasattr(obj, k))
+	elif hasattr(obj, '__dict__'):
+		size += deepSize(obj.__dict__, seen)
+	return size
+
+
+class TestArrayEPGDB(TestCase):
+	def setUp(self):
+		random.seed(1)
+		self.date = datetime(2018, 10, 1)
+		self.days = [makeDay(self.date + timedelta(d)) for d in range(3)]
+
+	def fill(self, db, days):
+		for d in days:
+			db.addEpgDay(self.date + timedelta(d), self.days[d])
+
+	def assertSameEpg(self, e1, e2):
+		self.assertEqual(repr(e1), repr(e2))
+		if e1 is not None:
+			self.assertEqual(e1.description, e2.description)
+
+	def test_compare(self):
+		db1, db2 = EPGDB(), ArrayEPGDB()
+		# insert days out of order to exercise inserts in the middle
+		for db in db1, db2:
+			self.fill(db, [2, 0, 1])
+		self.assertEqual(len(db1.l), len(db2))
+		t = self.date - timedelta(hours=1)
+		while t < self.date + timedelta(days=3, hours=1):
+			self.assertSameEpg(db1.epgCurrent(t), db2.epgCurrent(t))
+			self.assertSameEpg(db1.epgNext(t), db2.epgNext(t))
+			t += timedelta(minutes=7)
+		for d in range(4):
+			date = self.date + timedelta(d)
+			self.assertEqual(repr(db1.epgDay(date)), repr(db2.epgDay(date)))
+
+	def test_dayView(self):
+		db = ArrayEPGDB()
+		self.fill(db, [0, 1])
+		view = db.epgDay(self.date + timedelta(1))
+		self.assertEqual(len(view), len(self.days[1]))
+		self.assertEqual(repr(list(view)), repr(self.days[1]))
+		self.assertEqual(repr(view[-1]), repr(self.days[1][-1]))
+		self.assertRaises(IndexError, lambda: view[len(view)])
+		self.assertEqual(len(db.epgDay(self.date + timedelta(2))), 0)
+
+	def test_viewSnapshot(self):
+		"""View keeps its programs when epg is inserted in place after it was taken"""
+		for db in EPGDB(), ArrayEPGDB():
+			self.fill(db, [1])
+			date = self.date + timedelta(1)
+			view = db.epgDay(date)
+			expected = repr(list(view))
+			t = toTimestamp(date) - 3600
+			db.addEpg(EPG(t, t + 600, "inserted"))
+			self.assertEqual(repr(list(view)), expected)
+			self.assertEqual(db.epgCurrent(date - timedelta(hours=1)).name, "inserted")
+
+	def test_conflict(self):
+		db = ArrayEPGDB()
+		t = toTimestamp(self.date)
+		db.addEpgSorted([EPG(t, t + 600, "a"), EPG(t + 600, t + 1200, "b")])
+		db.addEpg(EPG(t + 600, t + 900, "c"))
+		self.assertEqual(len(db), 2)
+		self.assertEqual(db.epgNext(self.date).name, "c")
+
+	def test_strings(self):
+		"""Each database has its own string table, it is created when programs are added"""
+		db1, db2 = ArrayEPGDB(), ArrayEPGDB()
+		self.assertIsNone(db1.epgCurrent(self.date))
+		self.fill(db1, [0])
+		self.fill(db2, [0, 1])
+		self.assertIsNot(db1.strings, db2.strings)
+		self.assertEqual(len(db1.strings), len(set(e.name for e in self.days[0]) | set(e.description for e in self.days[0])))
+
+	def test_merge(self):
+		"""Bulk merge gives the same result as inserting programs one by one"""
+		t0 = toTimestamp(self.date)
+		dates = [self.date + timedelta(d) for d in range(4)]
+		for cls in EPGDB, ArrayEPGDB:
+			db1, db2 = cls(), cls()
+			for db in db1, db2:
+				db.days_start = dict((toDate(d), d) for d in dates)
+			for _n in range(20):
+				programs = []
+				t = t0 + random.randrange(0, 3 * 24 * 3600, 300)
+				for _i in range(random.randrange(10)):
+					d = random.randrange(-2, 20) * 300
+					programs.append(EPG(t, t + abs(d), "p%d" % random.randrange(1000)))
+					t += d
+				programs.sort(key=lambda e: e.begin)
+				for e in programs:
+					db1.addEpg(e)
+				db2.addEpgSorted(programs)
+				for d in dates:
+					self.assertEqual(repr(db1.epgDay(d)), repr(db2.epgDay(d)))
+
+	def bench_addEpgDay(self):
+		"""Load 7 days into channel one by one and with bulk merge, latest day first"""
+		days = [makeDay(self.date + timedelta(d)) for d in range(7)]
+
+		def sequential():
+			db = ArrayEPGDB()
+			for d in reversed(range(7)):
+				for e in days[d]:
+					db.addEpg(e)
+
+		def merge():
+			db = ArrayEPGDB()
+			for d in reversed(range(7)):
+				db.addEpgDay(self.date + timedelta(d), days[d])
+
+		import timeit
+		N = 20
+		for f in sequential, merge:
+			t = min(timeit.repeat(f, number=N, repeat=3))
+			print("%s: %f per 7 days" % (f.__name__, t / N))
+
+	def bench_memory(self):
+		channels = 100
+		days = [makeDay(self.date + timedelta(d)) for d in range(7)]
+		for cls in EPGDB, ArrayEPGDB, 'shared':
+			if cls == 'shared':
+				# string table of the channel list, as AbstractStream does
+				dbs = [ArrayEPGDB() for _c in range(channels)]
+				strings = StringTable()
+				for db in dbs:
+					db.strings = strings
+			else:
+				dbs = [cls() for _c in range(channels)]
+			for db in dbs:
+				for d, programs in enumerate(days):
+					# make new objects like a provider does
+					db.addEpgDay(self.date + timedelta(d), [
+						EPG(
+							toTimestamp(e.begin), toTimestamp(e.end),
+							str(bytearray(e.name)), str(bytearray(e.description)))
+						for e in programs])
+			size = deepSize(dbs)
+			print("%s: %d channels x 7 days, %.1f MB" % (getattr(cls, '__name__', cls), channels, size / 1024. / 1024.))
+
+
+if __name__ == "__main__":
+	from unittest import main
+	main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#  enigma2 iptv player
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+from __future__ import print_function
+
+import os
+import time
+import shutil
+import tempfile
+from datetime import datetime
+from twisted.trial.unittest import TestCase
+
+from src.utils import EPG, toTimestamp
+from src.api.epgstore import EpgStore
+
+
+class TestEpgStore(TestCase):
+	def setUp(self):
+		self.path = tempfile.mkdtemp()
+		self.file_name = os.path.join(self.path, 'test-epg.db')
+		self.store = EpgStore(self.file_name)
+		self.date = datetime(2018, 10, 1)
+		t = toTimestamp(self.date)
+		self.programs = [EPG(t + i * 600, t + (i + 1) * 600, "Program %d" % i, u"Описание") for i in range(100)]
+
+	def tearDown(self):
+		self.store.close()
+		shutil.rmtree(self.path)
+
+	def test_day(self):
+		self.assertEqual(self.store.getDay(1, self.date), None)
+		self.store.putDay(1, self.date, self.programs)
+		self.store.close()
+		# data is available after restart
+		self.store = EpgStore(self.file_name)
+		programs = self.store.getDay(1, self.date)
+		self.assertEqual(repr(programs), repr(self.programs))
+		self.assertEqual(programs[0].description, u"Описание")
+		self.assertEqual(self.store.getDay(2, self.date), None)
+		self.store.ttl = 0
+		self.assertEqual(self.store.getDay(1, self.date), None)
+
+	def test_live(self):
+		t = int(time.time())
+		self.store.putLive([
+			(1, [EPG(t - 600, t + 600, "current"), EPG(t + 600, t + 1200, "next")]),
+			(2, [EPG(t - 1200, t - 600, "ended"), EPG(t - 600, t + 600, "current")]),
+			(3, [EPG(t - 1200, t - 600, "ended")]),
+		])
+		live = self.store.getLive([1, 2, 3, 4])
+		self.assertEqual(sorted(live.keys()), [1, 2])
+		self.assertEqual([e.name for e in live[1]], ["current", "next"])
+		self.assertEqual([e.name for e in live[2]], ["current"])
+
+	def test_scope(self):
+		"""Epg stored with other provider settings is not used"""
+		settings = ["user", 0]
+		self.store.scope = lambda: settings
+		self.store.putDay(1, self.date, self.programs)
+		self.store.putLive([(1, [EPG(time.time() - 600, time.time() + 600, "current")])])
+		settings[1] = 3
+		self.assertEqual(self.store.getDay(1, self.date), None)
+		self.assertEqual(self.store.getLive([1]), {})
+		settings[1] = 0
+		self.assertNotEqual(self.store.getDay(1, self.date), None)
+		self.assertEqual(list(self.store.getLive([1])), [1])
+
+	def test_expire(self):
+		"""Entries older than TTL are removed on write"""
+		t = int(time.time())
+		self.store.putLive([(cid, [EPG(t, t + 600, "current")]) for cid in range(10)])
+		self.store.putDay(1, self.date, self.programs)
+		self.store.ttl = 0
+		self.store.putLive([(1, [EPG(t, t + 600, "current")])])
+		self.store.putDay(2, self.date, self.programs)
+		count = lambda table: self.store._db.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0]
+		self.assertEqual((count('live'), count('day')), (0, 0))
+		self.assertEqual(self.store.stats['evicted'], 12)
+
+	def test_evict(self):
+		self.store.max_size = 64 * 1024
+		for cid in range(100):
+			self.store.putDay(cid, self.date, self.programs)
+		self.assertTrue(self.store.stats['evicted'] > 0)
+		self.assertTrue(os.path.getsize(self.file_name) < 2 * self.store.max_size)
+		self.assertNotEqual(self.store.getDay(99, self.date), None)
+		self.assertEqual(self.store.getDay(0, self.date), None)
+
+	def test_disabled(self):
+		store = EpgStore('/dev/null/epg.db')
+		store.putDay(1, self.date, self.programs)
+		self.assertEqual(store.getDay(1, self.date), None)
+		self.assertEqual(store.getLive([1]), {})
+
+
+if __name__ == "__main__":
+	from unittest import main
+	main()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#  enigma2 iptv player
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+from __future__ import print_function
+
+import re
+import codecs
+from twisted.trial.unittest import TestCase
+
+from src.api.extinf import parseExtInf
+from src.api.m3u import M3UProvider
+
+
+def makePlaylist(n):
+	lines = ["#EXTM3U"]
+	for i in range(n // 2):
+		lines.append(
+			'#EXTINF:-1 tvg-id="%d" tvg-name="Channel %d" tvg-logo="http://example.com/logo/%d.png" '
+			'group-title="Group %d" tvg-rec="%d" catchup="shift" '
+			'catchup-source="http://example.com/catchup/%d/{utc}-{lutc}/index.m3u8?token=0123456789abcdef",'
+			'Channel %d' % (i, i, i, i % 20, i % 3, i, i))
+		lines.append("http://example.com/iptv/00000000000000/%d/index.m3u8" % i)
+	return lines
+
+
+class TestExtInf(TestCase):
+	def test_attributes(self):
+		attrs, title = parseExtInf('#EXTINF:-1 tvg-id="1" tvg-logo="" group-title="News, Sport",First, HD ')
+		self.assertEqual(attrs, {'tvg-id': '1', 'tvg-logo': '', 'group-title': 'News, Sport'})
+		self.assertEqual(title, "First, HD")
+
+	def test_bad(self):
+		self.assertEqual(parseExtInf('#EXTINF:0 tvg-rec=3 "stray, quoted" x="y",Title'), ({'x': 'y'}, 'Title'))
+		self.assertEqual(parseExtInf('#EXTINF:0 CUID="7"'), ({'CUID': '7'}, ''))
+		self.assertEqual(parseExtInf('#EXTINF:-1 a="1" a="2",Name'), ({'a': '2'}, 'Name'))
+
+	def test_compare(self):
+		"""Same result as separate regular expressions on usual playlist"""
+		regexps = self.regexps()
+		for line in makePlaylist(200)[1::2]:
+			attrs, title = parseExtInf(line)
+			self.assertEqual(title, line.split(',')[1])
+			for key, regexp in regexps:
+				m = regexp.match(line)
+				self.assertEqual(attrs.get(key), m and m.group(1))
+
+	@staticmethod
+	def regexps():
+		return [
+			(key, re.compile('#EXTINF:.*%s="([^"]*)"' % key))
+			for key in ('tvg-id', 'group-title', 'tvg-logo', 'tvg-rec', 'catchup-days')]
+
+	def bench_extinf(self):
+		lines = [line for line in makePlaylist(50000) if line.startswith('#EXTINF:')]
+		regexps = self.regexps()
+
+		def regex():
+			for line in lines:
+				line.strip().split(',')[1]
+				for _key, regexp in regexps:
+					m = regexp.match(line)
+					if m:
+						m.group(1)
+
+		def tokenizer():
+			for line in lines:
+				attrs = parseExtInf(line.strip())[0]
+				for key, _regexp in regexps:
+					attrs.get(key)
+
+		import timeit
+		for f in regex, tokenizer:
+			t = min(timeit.repeat(f, number=1, repeat=3))
+			print("%s: %f s for %d lines" % (f.__name__, t, len(lines) * 2))
+
+
+class TestM3UParser(TestCase):
+	def test_iterator(self):
+		"""Playlist is parsed from lazy line iterator, BOM is discarded"""
+		lines = makePlaylist(200)
+		lines[0] = codecs.BOM_UTF8 + lines[0]
+		consumed = []
+
+		def stream():
+			for line in lines:
+				consumed.append(line)
+				yield line
+
+		prov = M3UProvider("", "")
+		prov._parsePlaylist(stream())
+		self.assertEqual(len(consumed), len(lines))
+		self.assertEqual(len(prov.channels), 100)
+		self.assertEqual(len(prov.groups), 20)
+		self.assertEqual(prov.channels[5].name, "Channel 5")
+		self.assertEqual(prov.channels_data[5]['tvg'], 5)
+
+		other = M3UProvider("", "")
+		other._parsePlaylist(lines)
+		self.assertEqual(sorted(other.channels), sorted(prov.channels))
+
+	def test_commaTitle(self):
+		"""Whole title after the first comma outside of quotes is the channel name"""
+		lines = [
+			"#EXTM3U",
+			'#EXTINF:-1 tvg-id="1" group-title="Movies, Series",Cinema, HD (A)',
+			"http://example.com/iptv/00000000000000/1/index.m3u8",
+		]
+		# previous parser took line.split(',')[1], that is ' Series"' here
+		prov = M3UProvider("", "")
+		prov._parsePlaylist(lines)
+		self.assertEqual([c.name for c in prov.channels.values()], ["Cinema, HD (A)"])
+		self.assertEqual([g.title for g in prov.groups.values()], ["Movies, Series"])
+
+	def test_error(self):
+		"""Read error in the middle of playlist leaves provider without channels of that playlist"""
+		lines = makePlaylist(200)
+
+		def stream():
+			for line in lines[:100]:
+				yield line
+			raise IOError("connection reset")
+
+		prov = M3UProvider("", "")
+		self.assertRaises(IOError, prov._parsePlaylist, stream())
+		self.assertEqual((prov.channels, prov.groups, prov.channels_data, prov.tvg_ids), ({}, {}, {}, {}))
+
+
+if __name__ == "__main__":
+	from unittest import main
+	main()
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+#  enigma2 iptv player
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+from __future__ import print_function
+
+import time
+import socket
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from twisted.trial.unittest import TestCase
+
+from tools import hlsgw
+
+
+class Origin(object):
+	"""Settings of local HLS origin"""
+	segments = 5
+	segment_size = 64 * 1024
+	delay = 0.0  # seconds before first byte of segment
+	slow = {}  # extra delay of some segments
+	duration = 1.0
+	requests = []
+
+
+class OriginHandler(BaseHTTPRequestHandler):
+	def do_GET(self):
+		Origin.requests.append(self.path)
+		if self.path.startswith('/live.m3u8'):
+			body = "#EXTM3U\n#EXT-X-TARGETDURATION:1\n#EXT-X-MEDIA-SEQUENCE:0\n" + "".join(
+				"#EXTINF:%s,\nseg%d.ts\n" % (Origin.duration, i) for i in range(Origin.segments))
+			content_type = 'application/vnd.apple.mpegurl'
+		else:
+			n = int(self.path[len('/seg'):-len('.ts')])
+			time.sleep(Origin.delay + Origin.slow.get(n, 0))
+			body = chr(ord('a') + n % 26) * Origin.segment_size
+			content_type = 'video/mp2t'
+		self.send_response(200)
+		self.send_header('Content-Type', content_type)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		try:
+			self.wfile.write(body)
+		except socket.error:
+			pass
+
+	def log_message(self, *args):
+		pass
+
+
+class OriginServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+
+class HlsTestCase(TestCase):
+	def setUp(self):
+		Origin.segments = 5
+		Origin.segment_size = 64 * 1024
+		Origin.delay = 0.0
+		Origin.slow = {}
+		Origin.duration = 1.0
+		Origin.requests = []
+		self.origin = OriginServer(('127.0.0.1', 0), OriginHandler)
+		self.url = 'http://127.0.0.1:%d/live.m3u8' % self.origin.server_port
+		thread = threading.Thread(target=self.origin.serve_forever, kwargs={'poll_interval': 0.1})
+		thread.daemon = True
+		thread.start()
+
+	def tearDown(self):
+		self.origin.shutdown()
+		self.origin.server_close()
+
+	def runSession(self, session, send, **kwargs):
+		"""Run serveHLS in thread, return thread and list where exception is stored"""
+		result = []
+
+		def run():
+			try:
+				hlsgw.serveHLS(self.url, send, session=session, **kwargs)
+			except Exception as e:  # pylint: disable=broad-except
+				result.append(e)
+
+		thread = threading.Thread(target=run)
+		thread.daemon = True
+		thread.start()
+		return thread, result
+
+
+class TestSessions(HlsTestCase):
+	def test_cancelRead(self):
+		"""Cancel aborts segment download that is waiting for data"""
+		Origin.delay = 10
+		session = hlsgw.Session()
+		thread, result = self.runSession(session, lambda view, block: len(view))
+		while not any(path.endswith('.ts') for path in Origin.requests):
+			time.sleep(0.01)
+		t = time.time()
+		session.cancel("zap")
+		thread.join(5)
+		self.assertFalse(thread.is_alive())
+		self.assertTrue(time.time() - t < 1)
+		self.assertIsInstance(result[0], hlsgw.SessionCancelled)
+
+	def test_maxSessions(self):
+		sessions = hlsgw.Sessions(max_sessions=2)
+		first = sessions.start()
+		second = sessions.start()
+		self.assertFalse(first.cancelled.is_set())
+		third = sessions.start()
+		self.assertTrue(first.cancelled.is_set())
+		self.assertFalse(second.cancelled.is_set())
+		sessions.end(first)
+		sessions.end(second)
+		self.assertEqual(len(sessions), 1)
+		self.assertFalse(third.cancelled.is_set())
+
+	def test_clientClosed(self):
+		"""Gateway stops stream when client disconnects"""
+		server = hlsgw.PooledHTTPServer(('127.0.0.1', 0), hlsgw.HlsHandler, workers=2)
+		thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.1})
+		thread.daemon = True
+		thread.start()
+		try:
+			Origin.delay = 10
+			sock = socket.create_connection(('127.0.0.1', server.server_port))
+			sock.sendall("GET /?url=%s HTTP/1.0\r\n\r\n" % self.url)
+			self.assertTrue(sock.recv(100).startswith("HTTP/1.0 200"))
+			while len(hlsgw.sessions) == 0:
+				time.sleep(0.01)
+			sock.close()
+			t = time.time()
+			while len(hlsgw.sessions) and time.time() - t < 5:
+				time.sleep(0.01)
+			self.assertEqual(len(hlsgw.sessions), 0)
+		finally:
+			server.shutdown()
+			server.server_close()
+
+	def test_busy(self):
+		"""Client gets 503 when all workers serve other streams"""
+		server = hlsgw.PooledHTTPServer(('127.0.0.1', 0), hlsgw.HlsHandler, workers=1)
+		thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.1})
+		thread.daemon = True
+		thread.start()
+		try:
+			Origin.delay = 10
+			first = socket.create_connection(('127.0.0.1', server.server_port))
+			first.sendall("GET /?url=%s HTTP/1.0\r\n\r\n" % self.url)
+			self.assertTrue(first.recv(100).startswith("HTTP/1.0 200"))
+			second = socket.create_connection(('127.0.0.1', server.server_port))
+			self.assertTrue(second.recv(100).startswith("HTTP/1.0 503"))
+			second.close()
+			first.close()
+		finally:
+			server.shutdown()
+			server.server_close()
+
+
+class TestRingBuffer(TestCase):
+	def test_wrap(self):
+		ring = hlsgw.RingBuffer(10)
+		self.assertEqual(ring.write("abcdefgh"), 8)
+		ring.consume(6)
+		self.assertEqual(ring.write(memoryview("123456789")), 8)
+		self.assertEqual(ring.free(), 0)
+		self.assertEqual(ring.peek().tobytes(), "gh12")
+		ring.consume(4)
+		self.assertEqual(ring.peek().tobytes(), "345678")
+		ring.consume(6)
+		self.assertEqual(len(ring), 0)
+
+	def test_slowClient(self):
+		"""Slow client gets all data in order, chunks are read only when there is room for them"""
+		ring = hlsgw.RingBuffer(1000)
+		out = []
+		buffered = []
+
+		def chunks():
+			for i in range(50):
+				buffered.append(len(ring))
+				yield chr(ord('a') + i % 26) * 300
+
+		def send(view, block):
+			if not block and len(out) % 3:
+				out.append('')
+				return 0
+			out.append(view[:70].tobytes())
+			return len(out[-1])
+
+		hold, total = hlsgw.pipeChunks(chunks(), ring, send, hold=500)
+		hlsgw.drain(ring, send)
+		self.assertEqual((hold, total), (0, 50 * 300))
+		self.assertEqual("".join(out), "".join(chr(ord('a') + i % 26) * 300 for i in range(50)))
+		self.assertTrue(max(buffered) <= 1000)
+
+
+class TestPipeline(HlsTestCase):
+	def bench_throughput(self):
+		"""Stream from local origin to socket client through serveHLS, compare with string concatenation"""
+		Origin.segments = 20
+		Origin.segment_size = 4 * 1024 * 1024
+		size = Origin.segments * Origin.segment_size
+
+		def concat(session, send):
+			data = ''
+			for media in list(hlsgw.getM3U8MediaList(self.url, session)):
+				for chunk in hlsgw.readM3U8Chunks(
+						self.url.replace('live.m3u8', media[3]), chunk_size=hlsgw.READ_SIZE, session=session):
+					data += chunk
+					if len(data) < hlsgw.BUFFERING_SIZE:
+						continue
+					send(memoryview(data))
+					data = ''
+			send(memoryview(data))
+			raise hlsgw.SessionCancelled("done")
+
+		def ring(session, send):
+			hlsgw.serveHLS(self.url, send, session=session)
+
+		for f in concat, ring:
+			server, client = socket.socketpair()
+			session = hlsgw.Session()
+			writer = hlsgw.ClientWriter(server, session)
+
+			def read():
+				received = 0
+				while received < size:
+					received += len(client.recv(256 * 1024))
+				session.cancel("done")
+
+			reader = threading.Thread(target=read)
+			reader.start()
+			t = time.time()
+			try:
+				f(session, lambda view, block=True: writer.send(view, block))
+			except hlsgw.SessionCancelled:
+				pass
+			reader.join()
+			t = time.time() - t
+			print("%s: %.1f MB/s" % (f.__name__, size / t / 1024 / 1024))
+			server.close()
+			client.close()
+
+
+class TestPrefetch(HlsTestCase):
+	def stream(self, depth, size):
+		"""Run session until size bytes are received, return them and session"""
+		session = hlsgw.Session()
+		out = []
+		received = []
+
+		def send(view, block):
+			if not out:
+				received.append(list(Origin.requests))
+			out.append(view.tobytes())
+			if sum(map(len, out)) >= size:
+				session.cancel("done")
+			return len(view)
+
+		thread, result = self.runSession(session, send, depth=depth)
+		thread.join(30)
+		self.assertFalse(thread.is_alive())
+		self.assertIsInstance(result[0], hlsgw.SessionCancelled)
+		return "".join(out), received[0], session
+
+	def test_order(self):
+		"""Segments are downloaded together and emitted in order even if the first one is the slowest"""
+		Origin.segments = 4
+		Origin.slow = {0: 0.5}
+		data, requested, session = self.stream(depth=3, size=4 * Origin.segment_size)
+		self.assertEqual(data, "".join(chr(ord('a') + i) * Origin.segment_size for i in range(4)))
+		self.assertEqual(sorted(p for p in requested if p.endswith('.ts')), ['/seg%d.ts' % i for i in range(4)])
+
+	def bench_prefetch(self):
+		"""Startup and rebuffers of real time client when every segment has latency close to its duration"""
+		Origin.segments = 10
+		Origin.duration = 0.2
+		Origin.delay = 0.3
+		for depth in 0, 1, 3:
+			t = time.time()
+			_data, _requested, session = self.stream(depth, Origin.segments * Origin.segment_size)
+			stats = session.stats
+			print("depth %d: %.2f s, startup %.3f s, rebuffers %d, stalled %.2f s" % (
+				depth, time.time() - t, stats['startup'], stats['rebuffers'], stats['stalled']))
+
+
+if __name__ == "__main__":
+	from unittest import main
+	main()
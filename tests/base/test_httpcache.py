@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#  enigma2 iptv player
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from twisted.trial.unittest import TestCase
+
+from src.api.abstract_api import AbstractAPI
+from src.api.httpcache import HttpCache
+
+
+class Handler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	bodies = 0
+	version = 0
+
+	def do_GET(self):
+		etag = '"%s%d"' % (self.path, Handler.version)
+		if self.headers.get('If-None-Match') == etag:
+			self.send_response(304)
+			self.send_header('ETag', etag)
+			self.end_headers()
+			return
+		body = self.path * 100
+		Handler.bodies += 1
+		self.send_response(200)
+		if self.path != '/nocache':
+			self.send_header('ETag', etag)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+class TestHttpCache(TestCase):
+	def setUp(self):
+		Handler.bodies = 0
+		Handler.version = 0
+		self.server = HTTPServer(('127.0.0.1', 0), Handler)
+		self.url = 'http://127.0.0.1:%d' % self.server.server_port
+		self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.1})
+		self.thread.daemon = True
+		self.thread.start()
+		self.path = tempfile.mkdtemp()
+		self.api = AbstractAPI("", "")
+		self.api.http_cache = HttpCache(self.path)
+
+	def tearDown(self):
+		self.api.connection_pool.closeAll()
+		self.server.shutdown()
+		self.server.server_close()
+		shutil.rmtree(self.path)
+
+	def test_notModified(self):
+		url = self.url + '/a'
+		self.assertEqual(self.api.readHttpCached(url), '/a' * 100)
+		self.assertEqual(self.api.readHttpCached(url), '/a' * 100)
+		self.assertEqual(Handler.bodies, 1)
+		self.assertEqual(self.api.http_cache.stats['hits'], 1)
+		# 304 reply has no body, so connection is reused
+		self.assertEqual(self.api.connection_pool.stats['created'], 1)
+
+	def test_persistent(self):
+		url = self.url + '/a'
+		self.api.readHttpCached(url)
+		self.api.http_cache = HttpCache(self.path)
+		self.assertEqual(self.api.readHttpCached(url), '/a' * 100)
+		self.assertEqual(Handler.bodies, 1)
+
+	def test_noValidator(self):
+		url = self.url + '/nocache'
+		self.api.readHttpCached(url)
+		self.api.readHttpCached(url)
+		self.assertEqual(Handler.bodies, 2)
+		self.assertEqual(self.api.http_cache.size(), 0)
+
+	def test_incomplete(self):
+		chunks = self.api.readHttpCachedChunks(self.url + '/a')
+		next(chunks)
+		chunks.close()
+		self.assertEqual(self.api.http_cache.size(), 0)
+		self.assertEqual(os.listdir(self.path), [])
+
+	def test_replaceIncomplete(self):
+		"""Interrupted download of changed body keeps the stored one"""
+		url = self.url + '/a'
+		self.api.readHttpCached(url)
+		Handler.version = 1
+		chunks = self.api.readHttpCachedChunks(url)
+		next(chunks)
+		chunks.close()
+		self.assertEqual(self.api.http_cache.size(), 200)
+		self.assertEqual(sorted(os.listdir(self.path)), sorted([HttpCache.key(url), HttpCache.INDEX_FILE]))
+		Handler.version = 0
+		self.assertEqual(self.api.readHttpCached(url), '/a' * 100)
+		self.assertEqual(Handler.bodies, 2)
+
+	def test_lostBody(self):
+		"""Body is downloaded again and stored when the file of entry is lost"""
+		url = self.url + '/a'
+		self.api.readHttpCached(url)
+		os.remove(os.path.join(self.path, HttpCache.key(url)))
+		self.assertEqual(self.api.readHttpCached(url), '/a' * 100)
+		self.assertEqual(self.api.readHttpCached(url), '/a' * 100)
+		self.assertEqual(Handler.bodies, 2)
+		self.assertEqual(self.api.http_cache.size(), 200)
+
+	def test_orphans(self):
+		"""Files missing in index are removed on load"""
+		url = self.url + '/a'
+		self.api.readHttpCached(url)
+		for f in ('lost', HttpCache.key(url + 'b') + '.tmp'):
+			with open(os.path.join(self.path, f), 'w') as f:
+				f.write('x' * 1000)
+		self.api.http_cache = HttpCache(self.path)
+		self.assertEqual(self.api.http_cache.size(), 200)
+		self.assertEqual(sorted(os.listdir(self.path)), sorted([HttpCache.key(url), HttpCache.INDEX_FILE]))
+
+	def test_evict(self):
+		self.api.http_cache.max_size = 500
+		for p in ('/a', '/b', '/c'):
+			self.api.readHttpCached(self.url + p)
+		self.api.readHttpCached(self.url + '/a')
+		self.assertEqual(self.api.http_cache.size(), 400)
+		self.assertEqual(self.api.http_cache.stats['evicted'], 2)
+		self.api.readHttpCached(self.url + '/c')
+		self.assertEqual(Handler.bodies, 4)
+
+
+if __name__ == "__main__":
+	from unittest import main
+	main()
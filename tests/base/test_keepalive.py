@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+#  enigma2 iptv player
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+from __future__ import print_function
+
+import gzip
+import urllib2
+import threading
+from io import BytesIO
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from twisted.trial.unittest import TestCase
+
+from src.api.abstract_api import AbstractAPI
+
+
+def gzipData(data):
+	buf = BytesIO()
+	with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+		f.write(data)
+	return buf.getvalue()
+
+
+LINES = '\n'.join("line %d" % i for i in range(100000)) + '\n'
+
+
+class Handler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	connections = 0
+	posts = 0
+
+	def setup(self):
+		BaseHTTPRequestHandler.setup(self)
+		Handler.connections += 1
+
+	def do_GET(self):
+		body = "hello %s" % self.path
+		self.send_response(200)
+		if self.path == '/gzip':
+			body = gzipData(body)
+			self.send_header('Content-Encoding', 'gzip')
+		elif self.path == '/cookie':
+			self.send_header('Set-Cookie', 'sid=42; Path=/')
+		elif self.path == '/check':
+			body = self.headers.get('Cookie', '')
+		elif self.path == '/lines':
+			body = gzipData(LINES)
+			self.send_header('Content-Encoding', 'gzip')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_POST(self):
+		Handler.posts += 1
+		body = self.rfile.read(int(self.headers['Content-Length']))
+		self.send_response(200)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+
+class TestKeepAlive(TestCase):
+	def setUp(self):
+		Handler.connections = 0
+		Handler.posts = 0
+		# keep-alive connection occupies handler until it is closed, so concurrent connections need threads
+		self.server = ThreadingServer(('127.0.0.1', 0), Handler)
+		self.url = 'http://127.0.0.1:%d' % self.server.server_port
+		self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.1})
+		self.thread.daemon = True
+		self.thread.start()
+		self.api = AbstractAPI("", "")
+
+	def tearDown(self):
+		self.api.connection_pool.closeAll()
+		self.server.shutdown()
+		self.server.server_close()
+
+	def test_reuse(self):
+		for i in range(5):
+			self.assertEqual(self.api.readHttp(self.url + '/%d' % i), "hello /%d" % i)
+		stats = self.api.connection_pool.stats
+		self.assertEqual(stats['created'], 1)
+		self.assertEqual(stats['reused'], 4)
+		self.assertEqual(Handler.connections, 1)
+
+	def test_gzip(self):
+		self.assertEqual(self.api.readHttp(self.url + '/gzip'), "hello /gzip")
+		self.assertEqual(self.api.readHttp(self.url + '/gzip'), "hello /gzip")
+		self.assertEqual(self.api.connection_pool.stats['reused'], 1)
+
+	def test_cookies(self):
+		self.api.readHttp(self.url + '/cookie')
+		self.assertEqual(self.api.readHttp(self.url + '/check'), "sid=42")
+		self.assertEqual(Handler.connections, 1)
+
+	def test_idleTimeout(self):
+		self.api.connection_pool.idle_timeout = 0
+		self.api.readHttp(self.url + '/1')
+		self.api.readHttp(self.url + '/2')
+		stats = self.api.connection_pool.stats
+		self.assertEqual(stats['created'], 2)
+		self.assertEqual(stats['expired'], 1)
+		self.assertEqual(stats['reused'], 0)
+
+	def test_serverClosed(self):
+		self.api.readHttp(self.url + '/1')
+		# simulate server that drops idle keep-alive connection
+		for idle in self.api.connection_pool._idle.values():
+			for _t, conn in idle:
+				conn.sock.shutdown(2)
+		self.assertEqual(self.api.readHttp(self.url + '/2'), "hello /2")
+		self.assertEqual(self.api.connection_pool.stats['created'], 2)
+
+	def test_post(self):
+		"""Request with body is sent once over a new connection, that is pooled after response"""
+		self.api.readHttp(self.url + '/1')
+		for idle in self.api.connection_pool._idle.values():
+			for _t, conn in idle:
+				conn.sock.shutdown(2)
+		self.assertEqual(self.api.readHttp(urllib2.Request(self.url + '/login', 'user=1')), 'user=1')
+		self.assertEqual(Handler.posts, 1)
+		self.assertEqual(self.api.connection_pool.stats['reused'], 0)
+		self.assertEqual(self.api.readHttp(self.url + '/2'), "hello /2")
+		self.assertEqual(self.api.connection_pool.stats['reused'], 1)
+
+	def test_limit(self):
+		"""Request over max_per_host waits until a connection is returned"""
+		first = self.api.urlopener.open(self.url + '/1')
+		second = self.api.urlopener.open(self.url + '/2')
+		result = []
+		thread = threading.Thread(target=lambda: result.append(self.api.readHttp(self.url + '/3')))
+		thread.start()
+		thread.join(0.3)
+		self.assertEqual(result, [])
+		first.read()
+		thread.join(5)
+		self.assertEqual(result, ["hello /3"])
+		second.read()
+		self.assertEqual(Handler.connections, 2)
+		self.assertTrue(self.api.connection_pool.stats['waited'] > 0)
+
+	def test_overflow(self):
+		"""Request goes over the limit when nothing is returned in time"""
+		self.api.connection_pool.wait_timeout = 0.1
+		responses = [self.api.urlopener.open(self.url + '/%d' % i) for i in range(2)]
+		self.assertEqual(self.api.readHttp(self.url + '/3'), "hello /3")
+		self.assertEqual(self.api.connection_pool.stats['overflow'], 1)
+		self.assertEqual(Handler.connections, 3)
+		for r in responses:
+			r.read()
+
+	def test_dropped(self):
+		"""Response dropped without reading frees its place"""
+		self.api.connection_pool.wait_timeout = 0.1
+		for i in range(3):
+			self.api.urlopener.open(self.url + '/%d' % i)
+		self.assertEqual(self.api.connection_pool.stats['overflow'], 0)
+		self.assertEqual(self.api.connection_pool._busy.values(), [0])
+
+	def test_streamLines(self):
+		self.api.CHUNK_SIZE = 1000
+		chunks = list(self.api.readHttpChunks(self.url + '/lines'))
+		self.assertTrue(len(chunks) > 1)
+		self.assertEqual(''.join(chunks), LINES)
+		self.assertEqual(list(self.api.readHttpLines(self.url + '/lines')), LINES.split('\n'))
+		self.assertEqual(self.api.connection_pool.stats['reused'], 1)
+
+
+if __name__ == "__main__":
+	from unittest import main
+	main()
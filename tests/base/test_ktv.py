@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#  enigma2 iptv player
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+from __future__ import print_function
+
+import json
+from datetime import datetime
+from twisted.internet.defer import succeed
+from twisted.trial.unittest import TestCase
+
+from src.api.ktv import KtvStream
+
+DAYS = {
+	'010120': [{'ut_start': 50, 'progname': u'Yesterday'}],
+	'020120': [{'ut_start': 100, 'progname': u'First\nAbout'}, {'ut_start': 200, 'progname': u'Second'}],
+	'030120': [{'ut_start': 300, 'progname': u'Tomorrow'}],
+}
+
+
+class TestDayEpg(TestCase):
+	def setUp(self):
+		self.stream = KtvStream("", "")
+		self.stream.sid = True
+		self.requests = []
+
+		def reply(url):
+			day = url.split('day=')[1][:6]
+			self.requests.append(day)
+			return json.dumps({'epg': DAYS[day]})
+
+		self.stream.readHttp = reply
+		self.stream.readHttpAsync = lambda url: succeed(reply(url))
+
+	def check(self, epg):
+		self.assertEqual([(e.begin, e.end, e.name, e.description) for e in epg], [
+			(datetime.fromtimestamp(100), datetime.fromtimestamp(200), "First", "About"),
+			(datetime.fromtimestamp(200), datetime.fromtimestamp(300), "Second", ""),
+		])
+
+	def test_sync(self):
+		self.check(self.stream.getDayEpg(1, datetime(2020, 1, 2, 12)))
+		self.assertEqual(self.requests, ['030120', '020120'])
+
+	def test_async(self):
+		d = self.stream.getDayEpgAsync(1, datetime(2020, 1, 2, 12))
+		d.addCallback(self.check)
+		self.assertEqual(self.requests, ['030120', '020120'])
+		return d
+
+	def test_dayEnd(self):
+		self.stream.getDayEpgAsync(1, datetime(2020, 1, 2))
+		del self.requests[:]
+		# start of the day is remembered as the end of the previous one
+		epg = []
+		self.stream.getDayEpgAsync(1, datetime(2020, 1, 1)).addCallback(epg.extend)
+		self.assertEqual(self.requests, ['010120'])
+		self.assertEqual([(e.begin, e.end) for e in epg], [(datetime.fromtimestamp(50), datetime.fromtimestamp(100))])
+
+
+if __name__ == "__main__":
+	from unittest import main
+	main()
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+#  enigma2 iptv player
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+from __future__ import print_function
+
+from twisted.trial.unittest import TestCase
+
+from src.utils import LRUCache
+
+
+class TestLRUCache(TestCase):
+	def test_evict(self):
+		cache = LRUCache(2)
+		cache['a'] = 1
+		cache['b'] = 2
+		self.assertEqual(cache.get('a'), 1)
+		cache['c'] = 3
+		# b is least recently used
+		self.assertEqual(cache.get('b'), None)
+		self.assertEqual(cache.get('a'), 1)
+		self.assertEqual(cache.get('c'), 3)
+		self.assertEqual(len(cache), 2)
+		self.assertEqual((cache.hits, cache.misses), (3, 1))
+		cache.clear()
+		self.assertFalse('a' in cache)
+
+
+if __name__ == "__main__":
+	from unittest import main
+	main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#  enigma2 iptv player
+#
+#  Copyright (c) 2018 Alex Maystrenko <alexeytech@gmail.com>
+#
+# This is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2, or (at your option) any later
+# version.
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+from twisted.trial.unittest import TestCase
+
+from src.api.m3u import M3UProvider
+from .test_extinf import makePlaylist
+
+
+class TestPlaylistSnapshot(TestCase):
+	def setUp(self):
+		self.path = tempfile.mkdtemp()
+		self.m3u = os.path.join(self.path, 'playlist.m3u')
+		self.writePlaylist(makePlaylist(200))
+
+	def tearDown(self):
+		shutil.rmtree(self.path)
+
+	def writePlaylist(self, lines):
+		with open(self.m3u, 'w') as f:
+			f.write('\n'.join(lines))
+
+	def makeProvider(self, parse=True):
+		prov = M3UProvider("", "")
+		prov.SNAPSHOT_FILE = os.path.join(self.path, '%s.snapshot')
+		if not parse:
+			def fail(_lines):
+				self.fail("playlist parsed again")
+			prov._parsePlaylist = fail
+		return prov
+
+	def assertSameChannels(self, prov, other):
+		self.assertEqual(
+			[(c.cid, c.name, c.number, c.has_archive) for c in sorted(prov.channels.values(), key=lambda c: c.number)],
+			[(c.cid, c.name, c.number, c.has_archive) for c in sorted(other.channels.values(), key=lambda c: c.number)])
+		self.assertEqual(
+			[(g.gid, g.title, [c.cid for c in g.channels]) for g in prov.groups.values()],
+			[(g.gid, g.title, [c.cid for c in g.channels]) for g in other.groups.values()])
+		self.assertEqual(prov.channels_data, other.channels_data)
+		self.assertEqual(prov.tvg_ids, other.tvg_ids)
+
+	def test_restore(self):
+		prov = self.makeProvider()
+		prov._loadPlaylistFile(self.m3u)
+		self.assertEqual(len(prov.channels), 100)
+		other = self.makeProvider(parse=False)
+		other._loadPlaylistFile(self.m3u)
+		self.assertSameChannels(prov, other)
+		self.assertTrue(other.groups[0].channels[0] is other.channels[other.groups[0].channels[0].cid])
+
+	def test_invalidate(self):
+		self.makeProvider()._loadPlaylistFile(self.m3u)
+		# different maps
+		prov = self.makeProvider()
+		prov.tvg_map = {u'1': 100}
+		prov._loadPlaylistFile(self.m3u)
+		self.assertEqual(prov.channels_data[1]['tvg'], 100)
+		# changed file
+		self.writePlaylist(makePlaylist(100))
+		prov = self.makeProvider()
+		prov._loadPlaylistFile(self.m3u)
+		self.assertEqual(len(prov.channels), 50)
+
+	def bench_snapshot(self):
+		self.writePlaylist(makePlaylist(20000))
+		self.makeProvider()._loadPlaylistFile(self.m3u)
+
+		def parse():
+			with open(self.m3u) as f:
+				self.makeProvider()._parsePlaylist(f)
+
+		def snapshot():
+			self.makeProvider(parse=False)._loadPlaylistFile(self.m3u)
+
+		import timeit
+		for f in parse, snapshot:
+			t = min(timeit.repeat(f, number=1, repeat=3))
+			print("%s: %f s for 10000 channels" % (f.__name__, t))
+
+
+if __name__ == "__main__":
+	from unittest import main
+	main()
@@ -32,6 +32,29 @@ class TestChannelsScreen(unittest.TestCase):
 		dlg.sortByName()
 		dlg.sortByNumber()
 
+	def test_rows(self):
+		"""List content builds only tuple rows, it passes their items to build function"""
+		from src.main import IPtvDreamChannels
+
+		session = getSession()
+
+		db = OTTProvider("", "")
+		db.start()
+		db.setChannelsList()
+
+		dlg = session.open(
+			IPtvDreamChannels,
+			db,
+			None
+		)  # type: IPtvDreamChannels
+		for show in dlg.showAll, dlg.showGroups:
+			show()
+			assert dlg.list.list
+			for row in dlg.list.list:
+				assert isinstance(row, tuple) and len(row) == 1
+			assert dlg.list.buildRow(*dlg.list.list[0])[0] is dlg.list.list[0][0]
+			assert dlg.list.getCurrent() == dlg.list.list[dlg.list.getSelectedIndex()]
+
 	def test_favourites_ordering(self):
 		from src.main import IPtvDreamChannels
 
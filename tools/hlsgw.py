@@ -22,19 +22,199 @@
 from __future__ import print_function
 
 import socket
+import collections
+import select
+import threading
+import Queue
 import urlparse
 import urllib
 import urllib2
+import httplib
 import time
 import datetime
+from functools import partial
 from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
-from SocketServer import ThreadingMixIn
 import logging
 from logging.handlers import RotatingFileHandler
 
 SUPPORTED_VERSION = 3
 USER_AGENT = "hlsgw/0.1"
 PORT_NUMBER = 7001
+MAX_WORKERS = 4  # threads that handle requests
+MAX_SESSIONS = 2  # streams served at once, the oldest one is stopped when new client comes
+RING_SIZE = 2 * 1024 * 1024  # bytes buffered for client in every session
+BUFFERING_SIZE = 15000000 / 8  # bytes collected before writing to client after stream has stalled
+READ_SIZE = 64 * 1024
+PREFETCH_DEPTH = 2  # segments downloaded while the current one is streamed
+SEGMENT_BUFFER = 16  # chunks of READ_SIZE buffered for every downloading segment
+
+log = logging.getLogger('hlsgw')
+
+
+class SessionCancelled(Exception):
+	"""Client has gone or its session was replaced by newer one"""
+
+
+class Session(object):
+	"""
+	State of one client stream. Cancelling the session stops sleeps
+	and shuts down sockets of upstream connections, so blocked reads return at once.
+	"""
+
+	def __init__(self):
+		self.cancelled = threading.Event()
+		self.reason = None
+		self._socks = set()
+		self._local = threading.local()
+		self._lock = threading.Lock()
+		self._opener = urllib2.build_opener(SessionHTTPHandler(self), SessionHTTPSHandler(self))
+		self.created = time.time()
+		self.stats = {'startup': None, 'segments': 0, 'rebuffers': 0, 'stalled': 0.0}
+
+	def cancel(self, reason):
+		with self._lock:
+			if self.cancelled.is_set():
+				return
+			self.reason = reason
+			self.cancelled.set()
+			socks = list(self._socks)
+		for sock in socks:
+			shutdownSocket(sock)
+
+	def check(self):
+		if self.cancelled.is_set():
+			raise SessionCancelled(self.reason)
+
+	def sleep(self, seconds):
+		self.cancelled.wait(seconds)
+		self.check()
+
+	def register(self, sock):
+		"""Called by connections of this session when they are connected"""
+		sock = getattr(sock, '_sock', sock)
+		with self._lock:
+			self._local.socks.append(sock)
+			self._socks.add(sock)
+			cancelled = self.cancelled.is_set()
+		if cancelled:
+			shutdownSocket(sock)
+
+	def _release(self, socks):
+		with self._lock:
+			self._socks.difference_update(socks)
+
+	def open(self, req, timeout):
+		"""urlopen that is aborted on cancel"""
+		self.check()
+		self._local.socks = []
+		try:
+			conn = self._opener.open(req, timeout=timeout)
+		except (IOError, httplib.HTTPException):
+			self._release(self._local.socks)
+			self.check()
+			raise
+		socks = self._local.socks
+		# connections of redirects are already closed
+		self._release(socks[:-1])
+		conn.session_socks = socks[-1:]
+		return conn
+
+	def close(self, conn):
+		self._release(conn.session_socks)
+		conn.close()
+
+	def watch(self, sock):
+		"""Cancel session when client closes connection, runs in separate thread"""
+		while not self.cancelled.is_set():
+			try:
+				readable, _, _ = select.select([sock], [], [], 1)
+				if not readable:
+					continue
+				if not sock.recv(1, socket.MSG_PEEK):
+					self.cancel("client disconnected")
+			except (socket.error, select.error, ValueError) as e:
+				self.cancel("client socket error %s" % e)
+			# client sends nothing after request, stop watching if it does
+			return
+
+
+def shutdownSocket(sock):
+	try:
+		sock.shutdown(socket.SHUT_RDWR)
+	except socket.error:
+		pass
+
+
+class SessionHTTPConnection(httplib.HTTPConnection):
+	"""Connection that registers its socket in session, so it can be shut down on cancel"""
+
+	def __init__(self, host, session, **kwargs):
+		httplib.HTTPConnection.__init__(self, host, **kwargs)
+		self.session = session
+
+	def connect(self):
+		httplib.HTTPConnection.connect(self)
+		self.session.register(self.sock)
+
+
+class SessionHTTPSConnection(httplib.HTTPSConnection):
+	def __init__(self, host, session, **kwargs):
+		httplib.HTTPSConnection.__init__(self, host, **kwargs)
+		self.session = session
+
+	def connect(self):
+		httplib.HTTPSConnection.connect(self)
+		self.session.register(self.sock)
+
+
+class SessionHTTPHandler(urllib2.HTTPHandler):
+	def __init__(self, session):
+		urllib2.HTTPHandler.__init__(self)
+		self.session = session
+
+	def http_open(self, req):
+		return self.do_open(partial(SessionHTTPConnection, session=self.session), req)
+
+
+class SessionHTTPSHandler(urllib2.HTTPSHandler):
+	def __init__(self, session):
+		urllib2.HTTPSHandler.__init__(self)
+		self.session = session
+
+	def https_open(self, req):
+		kwargs = {}
+		if getattr(self, '_context', None) is not None:
+			kwargs['context'] = self._context
+		return self.do_open(partial(SessionHTTPSConnection, session=self.session), req, **kwargs)
+
+
+class Sessions(object):
+	"""Registry of active sessions limited to max_sessions"""
+
+	def __init__(self, max_sessions=MAX_SESSIONS):
+		self.max_sessions = max_sessions
+		self._sessions = []
+		self._lock = threading.Lock()
+
+	def start(self):
+		session = Session()
+		with self._lock:
+			self._sessions.append(session)
+			stale = self._sessions[:-self.max_sessions]
+		for old in stale:
+			old.cancel("replaced by new session")
+		return session
+
+	def end(self, session):
+		session.cancel("ended")
+		with self._lock:
+			self._sessions.remove(session)
+
+	def __len__(self):
+		return len(self._sessions)
+
+
+sessions = Sessions()
 
 
 def getBestBitrate(variants, bitrate=0):
@@ -43,15 +223,24 @@ def getBestBitrate(variants, bitrate=0):
 	return best[0]
 
 
-def readM3U8Chunks(URL, duration=30, chunk_size=1024*4):
+def readM3U8Chunks(URL, duration=30, chunk_size=1024*4, session=None):
+	session = session or Session()
 	req = urllib2.Request(url=URL, headers={'User-Agent': USER_AGENT})
-	conn = urllib2.urlopen(url=req, timeout=60)
-	while True:
-		data = conn.read(chunk_size)
-		if data:
-			yield data
-		else:
-			return
+	conn = session.open(req, timeout=60)
+	try:
+		while True:
+			data = conn.read(chunk_size)
+			session.check()
+			if data:
+				yield data
+			else:
+				return
+	except (IOError, httplib.HTTPException):
+		# connection was shut down by cancel
+		session.check()
+		raise
+	finally:
+		session.close(conn)
 
 
 def isM3U8Valid(conn):
@@ -74,13 +263,21 @@ def isM3U8Valid(conn):
 	return enc
 
 
-def getM3U8Lines_iterator(url):
+def getM3U8Lines_iterator(url, session=None):
+	session = session or Session()
 	req = urllib2.Request(url=url, headers={'User-Agent': USER_AGENT})
-	con = urllib2.urlopen(url=req, timeout=10)
-	enc = isM3U8Valid(con)
-	for l in con:
-		if l.startswith('#EXT') or not l.startswith('#'):
-			yield l.rstrip('\r\n').decode(enc)
+	con = session.open(req, timeout=10)
+	try:
+		enc = isM3U8Valid(con)
+		for l in con:
+			if l.startswith('#EXT') or not l.startswith('#'):
+				yield l.rstrip('\r\n').decode(enc)
+		session.check()
+	except (IOError, httplib.HTTPException):
+		session.check()
+		raise
+	finally:
+		session.close(con)
 
 
 def parseM3U8Tag(line):
@@ -113,11 +310,11 @@ def parseM3U8KeyValue(attribs, known_keys=None):
 	return d
 
 
-def getM3U8MediaList(url):
+def getM3U8MediaList(url, session=None):
 	seq = 0
 	duration = 5
 	targetduration = 5
-	for line in getM3U8Lines_iterator(url):
+	for line in getM3U8Lines_iterator(url, session):
 		if line.startswith('#EXT'):
 			tag, attribs = parseM3U8Tag(line)
 			if tag == '#EXTINF':
@@ -143,10 +340,219 @@ def getM3U8MediaList(url):
 			yield (seq, duration, targetduration, line)
 
 
-def serveHLS(url, write_cb, bitrate=0):
+class RingBuffer(object):
+	"""
+	Fixed size byte ring, memory is allocated once and reused for all segments of session.
+	Data is written by copying from buffers and read as memoryview without copying.
+	"""
+
+	def __init__(self, size=RING_SIZE):
+		self.size = size
+		self._buf = bytearray(size)
+		self._view = memoryview(self._buf)
+		self._head = 0  # position of first unread byte
+		self._len = 0
+
+	def __len__(self):
+		return self._len
+
+	def free(self):
+		return self.size - self._len
+
+	def write(self, data):
+		"""
+		Copy as much of data as fits
+		:param data: str or memoryview
+		:return: number of bytes copied
+		"""
+		n = min(len(data), self.size - self._len)
+		tail = (self._head + self._len) % self.size
+		first = min(n, self.size - tail)
+		self._view[tail:tail + first] = data[:first]
+		if n > first:
+			self._view[:n - first] = data[first:n]
+		self._len += n
+		return n
+
+	def peek(self):
+		"""Contiguous part of unread data"""
+		return self._view[self._head:self._head + min(self._len, self.size - self._head)]
+
+	def consume(self, n):
+		self._head = (self._head + n) % self.size
+		self._len -= n
+		if not self._len:
+			self._head = 0
+
+
+class ClientWriter(object):
+	"""Socket writer for serveHLS, waits for slow client only while session is active"""
+
+	def __init__(self, sock, session):
+		self.sock = sock
+		self.session = session
+
+	def send(self, view, block=True):
+		"""
+		:param bool block: wait until client can receive data
+		:return: number of bytes sent, 0 if client is not ready and block is False
+		"""
+		while True:
+			self.session.check()
+			try:
+				_, writable, _ = select.select([], [self.sock], [], 1 if block else 0)
+				if writable:
+					return self.sock.send(view)
+			except (socket.error, select.error) as e:
+				self.session.cancel("client socket error %s" % e)
+				self.session.check()
+			if not block:
+				return 0
+
+
+def pipeChunks(chunks, ring, send, hold=0):
+	"""
+	Pass chunks to client through ring. Client is written without waiting while there is room in ring,
+	when ring is full the chunks are not read until client takes some data, so upstream is slowed down to client speed.
+	:param send: function(memoryview, block) -> number of bytes sent
+	:param int hold: don't write to client until so many bytes are buffered
+	:return: hold that is left, 0 when buffering is done, and number of bytes read from chunks
+	"""
+	total = 0
+	for chunk in chunks:
+		total += len(chunk)
+		view = memoryview(chunk)
+		while len(view):
+			n = ring.write(view)
+			view = view[n:]
+			if len(ring) < hold and ring.free():
+				continue
+			hold = 0
+			while len(ring):
+				sent = send(ring.peek(), not ring.free())
+				if not sent:
+					break
+				ring.consume(sent)
+	return hold, total
+
+
+def drain(ring, send):
+	"""Write everything buffered in ring to client"""
+	while len(ring):
+		ring.consume(send(ring.peek(), True))
+
+
+class Prefetcher(object):
+	"""
+	Downloads segments in threads, up to depth segments ahead of the one that is streamed to client.
+	Every download has its own bounded queue of chunks and segments are returned strictly in order.
+
+	Session stats are updated here: startup is time from request to first chunk,
+	rebuffers counts stalls of a client that plays segments in real time from the first chunk.
+	"""
+
+	def __init__(self, session, depth=PREFETCH_DEPTH, buffer_chunks=SEGMENT_BUFFER):
+		self.session = session
+		self.depth = depth
+		self.buffer_chunks = buffer_chunks
+		self._pending = collections.deque()  # (url, duration) of segments that are not started
+		self._started = collections.deque()  # (duration, queue of chunks) of downloading segments
+		self._clock = None  # when client started to play, moved forward by stalls
+		self._delivered = 0.0  # seconds of media passed to client
+
+	def add(self, url, duration):
+		self._pending.append((url, duration))
+		self._start(self.depth)
+
+	def next(self):
+		"""
+		:return: iterator over chunks of the next added segment
+		"""
+		self._start(1)
+		duration, chunks = self._started.popleft()
+		self._start(self.depth)
+		return self._read(duration, chunks)
+
+	def _start(self, limit):
+		while self._pending and len(self._started) < limit:
+			url, duration = self._pending.popleft()
+			chunks = Queue.Queue(self.buffer_chunks)
+			t = threading.Thread(target=self._download, args=(url, duration, chunks))
+			t.daemon = True
+			t.start()
+			self._started.append((duration, chunks))
+
+	def _download(self, url, duration, chunks):
+		try:
+			for chunk in readM3U8Chunks(url, duration, READ_SIZE, self.session):
+				self._put(chunks, chunk)
+			self._put(chunks, None)
+		except Exception as e:  # pylint: disable=broad-except
+			self._put(chunks, e)
+
+	def _put(self, chunks, item):
+		while not self.session.cancelled.is_set():
+			try:
+				chunks.put(item, timeout=1)
+				return
+			except Queue.Full:
+				pass
+		# wake up reader that waits for this segment
+		try:
+			chunks.put_nowait(item)
+		except Queue.Full:
+			pass
+
+	def _get(self, chunks):
+		try:
+			return chunks.get_nowait()
+		except Queue.Empty:
+			pass
+		t = time.time()
+		while True:
+			self.session.check()
+			try:
+				item = chunks.get(timeout=1)
+				break
+			except Queue.Empty:
+				pass
+		if self._clock is not None:
+			now = time.time()
+			underrun = self._clock + self._delivered
+			if now > underrun:
+				stall = now - max(t, underrun)
+				self._clock += stall
+				self.session.stats['rebuffers'] += 1
+				self.session.stats['stalled'] += stall
+		return item
+
+	def _read(self, duration, chunks):
+		stats = self.session.stats
+		while True:
+			item = self._get(chunks)
+			if item is None:
+				break
+			if isinstance(item, Exception):
+				raise item
+			if self._clock is None:
+				self._clock = time.time()
+				stats['startup'] = self._clock - self.session.created
+			yield item
+		self._delivered += duration
+		stats['segments'] += 1
+
+
+def serveHLS(url, send, bitrate=0, session=None, depth=PREFETCH_DEPTH):
+	"""
+	Stream HLS url to client until session is cancelled
+	:param send: function(memoryview, block) -> number of bytes sent to client, see ClientWriter
+	:param int depth: number of segments downloaded ahead, 0 to download them one by one
+	"""
+	session = session or Session()
+	prefetcher = Prefetcher(session, depth)
 	variants = []
 	variant = None
-	for line in getM3U8Lines_iterator(url):
+	for line in getM3U8Lines_iterator(url, session):
 		if line.startswith('#EXT'):
 			tag, attribs = parseM3U8Tag(line)
 			if tag == '#EXT-X-STREAM-INF':
@@ -160,7 +566,9 @@ def serveHLS(url, write_cb, bitrate=0):
 	last_seq = -1
 	targetduration = 5
 	media_bytes_total = 0
-	buffering_needed = False
+	hold = 0
+	changed = 0
+	ring = RingBuffer()
 
 	while True:
 		if bitrate:
@@ -170,43 +578,38 @@ def serveHLS(url, write_cb, bitrate=0):
 
 		media_start_time = datetime.datetime.now()
 		media_bytes_total = 0
-		data = ''
-		for media in list(getM3U8MediaList(url)):
+		added = 0
+		for media in list(getM3U8MediaList(url, session)):
 			if media is None:
 				continue
 			seq, duration, targetduration, media_url = media
 			if seq > last_seq:
-				for chunk in readM3U8Chunks(urlparse.urljoin(url, media_url), targetduration or duration):
-					data += chunk
-					media_bytes_total += len(chunk)
-					if buffering_needed and len(data) < 15000000/8:
-						continue
-					write_cb(data)
-					data = ''
-					buffering_needed = False
-				if data:
-					write_cb(data)
-					data = ''
+				prefetcher.add(urlparse.urljoin(url, media_url), duration)
+				added += 1
 				last_seq = seq
 				changed = 1
+		for _i in range(added):
+			hold, size = pipeChunks(prefetcher.next(), ring, send, hold)
+			drain(ring, send)
+			media_bytes_total += size
 		if len(variants):
 			bitrate = int((media_bytes_total*8) / (datetime.datetime.now() - media_start_time).total_seconds())
 		if changed == 1:
 			# initial minimum reload delay
 			delta = (datetime.datetime.now() - media_start_time).total_seconds()
 			if delta < duration:
-				time.sleep(duration - delta)
+				session.sleep(duration - delta)
 			else:
-				buffering_needed = True
+				hold = BUFFERING_SIZE
 		elif changed == 0:
 			# first attempt
-			time.sleep(targetduration*0.5)
+			session.sleep(targetduration*0.5)
 		elif changed == -1:
 			# second attempt
-			time.sleep(targetduration*1.5)
+			session.sleep(targetduration*1.5)
 		else:
 			# third attempt and beyond
-			time.sleep(targetduration*3.0)
+			session.sleep(targetduration*3.0)
 		changed -= 1
 
 
@@ -229,21 +632,62 @@ class HlsHandler(BaseHTTPRequestHandler):
 			self.send_header('Content-type', "video/mp2t")
 			self.end_headers()
 
-			log.debug("Serving HLS url %s", url)
-			serveHLS(url, self.wfile.write)
-			log.debug("Serving HLS ended")
+			session = sessions.start()
+			watcher = threading.Thread(target=session.watch, args=(self.connection,))
+			watcher.daemon = True
+			watcher.start()
+			log.debug("Serving HLS url %s, %d sessions", url, len(sessions))
+			try:
+				serveHLS(url, ClientWriter(self.connection, session).send, session=session)
+			except SessionCancelled as e:
+				log.debug("Serving HLS cancelled: %s", e)
+			finally:
+				sessions.end(session)
+			log.debug("Serving HLS ended, stats %s", session.stats)
 		except Exception:  # pylint: disable=broad-except
 			log.exception("Serving HLS ended with exception")
 
 
-class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
-	"""Handle requests in a separate thread."""
+class PooledHTTPServer(HTTPServer):
+	"""Handle requests in fixed number of threads, new connections get 503 reply when all of them are busy"""
+
+	def __init__(self, server_address, handler_class, workers=MAX_WORKERS):
+		HTTPServer.__init__(self, server_address, handler_class)
+		self.requests = Queue.Queue()
+		# taken by accepted request until worker finishes it
+		self.idle = threading.Semaphore(workers)
+		for _i in range(workers):
+			t = threading.Thread(target=self.work)
+			t.daemon = True
+			t.start()
+
+	def process_request(self, request, client_address):
+		if self.idle.acquire(False):
+			self.requests.put((request, client_address))
+			return
+		log.warn("Too many requests, rejecting %s", client_address)
+		try:
+			request.sendall("HTTP/1.0 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n")
+		except socket.error:
+			pass
+		self.shutdown_request(request)
+
+	def work(self):
+		while True:
+			request, client_address = self.requests.get()
+			try:
+				self.finish_request(request, client_address)
+			except Exception:  # pylint: disable=broad-except
+				self.handle_error(request, client_address)
+			finally:
+				self.shutdown_request(request)
+				self.idle.release()
 
 
 def serve():
 	try:
 		socket.setdefaulttimeout(30)
-		server = HTTPServer(('127.0.0.1', PORT_NUMBER), HlsHandler)
+		server = PooledHTTPServer(('127.0.0.1', PORT_NUMBER), HlsHandler)
 		log.info('Started hls gateway on port %d', PORT_NUMBER)
 		server.serve_forever(poll_interval=3)
 	except KeyboardInterrupt:
@@ -252,7 +696,6 @@ def serve():
 
 
 if __name__ == '__main__':
-	log = logging.getLogger('hlsgw')
 	log.setLevel(logging.DEBUG)
 	log.addHandler(RotatingFileHandler('/tmp/hlsgw.log', maxBytes=10 * 1024))
 	try: